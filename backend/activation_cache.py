@@ -0,0 +1,138 @@
+from collections import OrderedDict
+import hashlib
+import numpy as np
+
+import backend.util as util
+
+
+class Activation_Cache:
+    """Cache holding the activations of all layers for the most recently used inputs.
+    The activations of every layer in conv_layers and grp_layers are computed together in one
+    multi-output forward pass, so switching the layer only costs a dictionary lookup.
+    Inputs are evicted in least recently used order when the memory budget is exceeded.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def input_key(self, settings, input_data):
+        """Creates the key identifying the given input for the current model.
+
+        Args:
+            settings: the current settings object.
+            input_data: the preprocessed input of the model.
+
+        Returns:
+            the hexadecimal digest of the model fingerprint and the input data.
+        """
+        data = np.ascontiguousarray(input_data)
+        sha = hashlib.sha1(str(settings.model_fingerprint).encode("utf-8"))
+        sha.update(str(data.shape).encode("utf-8"))
+        sha.update(data.tobytes())
+        return sha.hexdigest()
+
+    def get(self, settings, layer_name, input_data):
+        """Gets the activations of the given layer for the given input.
+        Computes the activations of all layers on a cache miss.
+
+        Args:
+            settings: the current settings object.
+            layer_name: the name of the layer.
+            input_data: the preprocessed input of the model.
+
+        Returns:
+            the activations of the given layer.
+        """
+        key = self.input_key(settings, input_data)
+        acts = self.lookup(key, layer_name)
+        if acts is not None:
+            return acts
+        entry = self.entries.setdefault(key, dict())
+        self.compute(settings, layer_name, input_data, entry)
+        self.entries.move_to_end(key)
+        self.evict(settings.activation_cache_budget)
+        return entry[layer_name].astype(np.float32, copy=False)
+
+    def lookup(self, key, layer_name):
+        """Gets the cached activations of the given layer without computing them.
+
+        Args:
+            key: the key of the input created by input_key.
+            layer_name: the name of the layer.
+
+        Returns:
+            the activations of the given layer, or None if they are not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is None or layer_name not in entry:
+            return None
+        self.entries.move_to_end(key)
+        return entry[layer_name].astype(np.float32, copy=False)
+
+    def insert(self, settings, key, layer_name, acts):
+        """Adds activations that were computed elsewhere, e.g. loaded from the artifact store.
+
+        Args:
+            settings: the current settings object.
+            key: the key of the input created by input_key.
+            layer_name: the name of the layer.
+            acts: the activations of the layer.
+        """
+        if settings.activation_float16:
+            acts = acts.astype(np.float16)
+        entry = self.entries.setdefault(key, dict())
+        if layer_name in entry:
+            self.size -= entry[layer_name].nbytes
+        entry[layer_name] = acts
+        self.size += acts.nbytes
+        self.entries.move_to_end(key)
+        self.evict(settings.activation_cache_budget)
+
+    def compute(self, settings, layer_name, input_data, entry):
+        """Computes the activations for all layers of the model and adds them to the given entry.
+        Only the requested layer is computed if the activations of all layers exceed the memory budget.
+
+        Args:
+            settings: the current settings object.
+            layer_name: the name of the requested layer.
+            input_data: the preprocessed input of the model.
+            entry: dict the activations are stored in.
+        """
+        names = list(dict.fromkeys(
+            [layer.name for layer in settings.conv_layers + settings.grp_layers]))
+        itemsize = 2 if settings.activation_float16 else 4
+        total = sum(int(np.prod(settings.get_layer_by_name(name).out_shape[1:])) * itemsize
+                    for name in names)
+        if total > settings.activation_cache_budget or layer_name not in names:
+            names = [layer_name]
+            outputs = [util.get_activations(
+                settings.registry, layer_name, input_data)]
+        else:
+            outputs = settings.registry.multi_forward(names)(input_data)
+            if not isinstance(outputs, (list, tuple)):
+                outputs = [outputs]
+            outputs = [np.squeeze(acts.numpy()) for acts in outputs]
+        for name, acts in zip(names, outputs):
+            if settings.activation_float16:
+                acts = acts.astype(np.float16)
+            if name in entry:
+                self.size -= entry[name].nbytes
+            self.size += acts.nbytes
+            entry[name] = acts
+
+    def evict(self, budget):
+        """Removes the least recently used inputs until the cache fits the given budget.
+        The most recently used input is always kept.
+
+        Args:
+            budget: the memory budget in bytes.
+        """
+        while self.size > budget and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= sum(acts.nbytes for acts in entry.values())
+
+    def clear(self):
+        """Removes all cached activations."""
+        self.entries.clear()
+        self.size = 0
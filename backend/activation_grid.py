@@ -1,64 +1,78 @@
 import numpy as np
 import tensorflow as tf
 import backend.feature_visualization as fv
-import backend.util as util
+import backend.batching as batching
 
 
 def generate_filter_activation_grid(activations, layer_name, dictionary, worker):
     """Creates a 2D-list of images as a representation for the given layer.
     Selects the filter with the highest activation for each spatial position of
     the activations of the given layer.
+    The selected images are streamed to the main thread through the tile signal of the worker, one emit per finished row.
 
     Args:
         activations: the activations of the given layer.
         layer_name: the name of the layer.
         dictionary: dict containing the feature visualizations for the filter in the given layer.
-        worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+        worker: the worker object that runs the task on a second thread. The object is used to emit progress and tiles to the main thread.
 
     Returns:
         activation_grid: a 2D-list of feature visualization with one image for each spatial position in the output of the given layer.
     """
     activation_grid = []
     imgs = dictionary[layer_name]
+    # Each filter image is converted once, the tiles of all positions selecting it share the array
+    arrays = dict()
     for x, row in enumerate(activations):
+        if not worker.is_running:
+            return []
         activation_grid.append([])
+        tiles = []
         for y, col in enumerate(row):
-            if not worker.is_running:
-                return []
-            activation_grid[x].append(imgs[np.argmax(col)])
-            worker.progress.emit(x*len(activations) + y)
+            index = int(np.argmax(col))
+            activation_grid[x].append(imgs[index])
+            if index not in arrays:
+                arrays[index] = np.asarray(imgs[index])
+            tiles.append((x, y, arrays[index]))
+        worker.tile.emit(tiles)
+        worker.progress.emit((x + 1) * len(row))
     return activation_grid
 
 
 def generate_activation_grid(settings, activations, worker):
     """Creates a list of images as a representation for the given layer.
     Generates an image for each spatial location in the output of the selected layer using the direction loss.
+    The positions are optimized in batches and the images of each finished batch are streamed to the main thread through the tile signal of the worker.
 
     Args:
         settings: the current settings object.
         activations: the activations of the given layer.
-        worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+        worker: the worker object that runs the task on a second thread. The object is used to emit progress and tiles to the main thread.
 
     Returns:
         activation_grid: a list of feature visualization with one image for each spatial position in the output of the given layer.
     """
-    feature_extractor = util.prepare_feature_extractor(
-        settings.model, settings.layer)
+    feature_extractor = settings.registry.extractor(settings.layer)
     acts_flat = tf.squeeze(activations).numpy()
     acts_flat = acts_flat.reshape([-1] + [acts_flat.shape[2]])
+    cols = activations.shape[1]
+    imgs = []
 
-    activation_grid = []
-    row = []
-
-    for n, v in enumerate(acts_flat):
+    def run(run_settings, batch):
+        batch_imgs = fv.visualize_directions(
+            feature_extractor, batch, run_settings, worker)
         if not worker.is_running:
             return []
-        if n > 0 and n % activations.shape[1] == 0:
-            activation_grid.append(row)
-            row = []
-        img = fv.visualize_direction(feature_extractor, v, settings)
-        row.append(img)
-        worker.progress.emit(n)
+        tiles = []
+        for img in batch_imgs:
+            n = len(imgs)
+            imgs.append(img)
+            tiles.append((n // cols, n % cols, img))
+        worker.tile.emit(tiles)
+        worker.progress.emit(len(imgs))
+        return []
 
-    activation_grid.append(row)
-    return activation_grid
+    batching.run_batched(settings, settings.layer, list(acts_flat), run, worker)
+    if not worker.is_running:
+        return []
+    return [imgs[n:n + cols] for n in range(0, len(imgs), cols)]
@@ -0,0 +1,226 @@
+import os
+import json
+import atexit
+import time
+import shutil
+import threading
+import numpy as np
+
+import backend.util as util
+
+"""Content-addressed store for computed artifacts (dictionaries, activations, Grad-CAM maps, NMF groups).
+Every artifact is keyed by its kind, the fingerprint of the model, the fingerprint of the settings it depends on
+and further identifying parts (layer, input, ...). Matching artifacts are reused, entries recorded for a different
+model or different settings are never returned. Artifacts in use are reference counted and the least recently
+used unreferenced artifacts are removed once the store exceeds its size limit.
+Lookups only update the last use in memory, the index is written at most every FLUSH_INTERVAL seconds,
+whenever an artifact is added or removed and when the application exits.
+"""
+
+DEFAULT_SIZE_LIMIT = 2 * 2**30
+INDEX_FILE = "index.json"
+# The time in seconds between two writes of the index caused by lookups only
+FLUSH_INTERVAL = 30
+
+
+class Artifact_Store:
+    """Local artifact store keyed by model and settings fingerprints."""
+
+    def __init__(self, path=None, size_limit=DEFAULT_SIZE_LIMIT):
+        """
+        Args:
+            path: the directory the artifacts are stored in.
+            size_limit: the number of bytes the store may occupy before unreferenced artifacts are removed.
+        """
+        self.path = path if path is not None else util.cache_path("artifacts")
+        self.size_limit = size_limit
+        self.refs = dict()
+        self.lock = threading.RLock()
+        self.entries = self.load_index()
+        self.dirty = False
+        self.last_flush = time.time()
+        atexit.register(self.flush)
+
+    def key(self, kind, model_fingerprint, settings_fingerprint, *parts):
+        """Creates the key of an artifact.
+
+        Args:
+            kind: the kind of the artifact, e.g. "dictionary" or "gradcam".
+            model_fingerprint: the fingerprint of the model the artifact was computed with.
+            settings_fingerprint: the fingerprint of the settings the artifact depends on.
+            parts: further values identifying the artifact (layer, input, ...).
+
+        Returns:
+            the key of the artifact.
+        """
+        return util.hash_values(kind, model_fingerprint, settings_fingerprint, *parts)
+
+    def entry_path(self, key):
+        """Get the path of the file containing the arrays of the given artifact."""
+        return os.path.join(self.path, key[:2], key + ".npz")
+
+    def load_index(self):
+        """Reads the index of the stored artifacts.
+
+        Returns:
+            dictionary mapping the keys to the metadata of the artifacts.
+        """
+        try:
+            with open(os.path.join(self.path, INDEX_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def save_index(self):
+        """Writes the index of the stored artifacts."""
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, path)
+        self.dirty = False
+        self.last_flush = time.time()
+
+    def flush(self, force=True):
+        """Writes the index if lookups changed it since it was written last.
+
+        Args:
+            force: if not set, the index is only written if FLUSH_INTERVAL passed since the last write.
+        """
+        with self.lock:
+            if not self.dirty or (not force and time.time() - self.last_flush < FLUSH_INTERVAL):
+                return
+            try:
+                self.save_index()
+            except OSError:
+                # The last uses only order the garbage collection, losing them is harmless
+                pass
+
+    def get(self, kind, model_fingerprint, settings_fingerprint, *parts):
+        """Looks up an artifact.
+
+        Args:
+            kind: the kind of the artifact.
+            model_fingerprint: the fingerprint of the current model.
+            settings_fingerprint: the fingerprint of the current settings.
+            parts: further values identifying the artifact.
+
+        Returns:
+            tuple of the key and the dictionary of stored arrays, or None if no matching artifact exists.
+        """
+        key = self.key(kind, model_fingerprint,
+                       settings_fingerprint, *parts)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry["kind"] != kind or entry["model"] != model_fingerprint or entry["settings"] != settings_fingerprint:
+                # Never hand out an artifact recorded for another model or other settings
+                self.remove(key)
+                return None
+            try:
+                with np.load(self.entry_path(key)) as data:
+                    arrays = {name: data[name] for name in data.files}
+            except (OSError, ValueError):
+                self.remove(key)
+                return None
+            entry["last_used"] = time.time()
+            self.dirty = True
+            self.flush(force=False)
+            return key, arrays
+
+    def put(self, arrays, kind, model_fingerprint, settings_fingerprint, *parts):
+        """Stores an artifact and removes old artifacts if the store exceeds its size limit.
+
+        Args:
+            arrays: dictionary of the named arrays forming the artifact.
+            kind: the kind of the artifact.
+            model_fingerprint: the fingerprint of the model the artifact was computed with.
+            settings_fingerprint: the fingerprint of the settings the artifact was computed with.
+            parts: further values identifying the artifact.
+
+        Returns:
+            the key of the stored artifact.
+        """
+        key = self.key(kind, model_fingerprint,
+                       settings_fingerprint, *parts)
+        path = self.entry_path(key)
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a truncated entry behind
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+            self.entries[key] = {
+                "kind": kind,
+                "model": model_fingerprint,
+                "settings": settings_fingerprint,
+                "parts": [str(part) for part in parts],
+                "size": os.path.getsize(path),
+                "last_used": time.time()
+            }
+            self.collect()
+            self.save_index()
+        return key
+
+    def acquire(self, key):
+        """Marks an artifact as in use, so it is not removed by the garbage collection."""
+        with self.lock:
+            self.refs[key] = self.refs.get(key, 0) + 1
+
+    def release(self, key):
+        """Releases an artifact acquired before."""
+        with self.lock:
+            count = self.refs.get(key, 0) - 1
+            if count > 0:
+                self.refs[key] = count
+            else:
+                self.refs.pop(key, None)
+
+    def size(self):
+        """Get the number of bytes occupied by the stored artifacts."""
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def collect(self, size_limit=None):
+        """Removes the least recently used unreferenced artifacts until the store fits into the size limit.
+
+        Args:
+            size_limit: the size limit in bytes (self.size_limit if None is given).
+        """
+        if size_limit is None:
+            size_limit = self.size_limit
+        with self.lock:
+            size = self.size()
+            for key, entry in sorted(self.entries.items(), key=lambda item: item[1]["last_used"]):
+                if size <= size_limit:
+                    break
+                if self.refs.get(key, 0) > 0:
+                    continue
+                size -= entry["size"]
+                self.remove(key, save=False)
+            self.save_index()
+
+    def remove(self, key, save=True):
+        """Deletes the given artifact."""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.refs.pop(key, None)
+            try:
+                os.remove(self.entry_path(key))
+            except OSError:
+                pass
+            if save:
+                self.save_index()
+
+    def clear(self):
+        """Deletes all unreferenced artifacts."""
+        self.collect(0)
+
+    def purge(self):
+        """Deletes the whole store including referenced artifacts."""
+        with self.lock:
+            self.entries = dict()
+            self.refs = dict()
+            shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,116 @@
+import copy
+import tensorflow as tf
+
+"""Memory-aware batch sizing for the batched gradient ascent.
+The gradient tape holds every intermediate activation of the feature extractor, so the memory of a step
+grows linearly with the batch size. The planner estimates the memory per image from the layer metadata index
+(or measures it on the GPU) and picks the largest batch below the memory budget. Allocation failures halve
+the batch and the limit is remembered for the layer until a new model is imported.
+"""
+
+# Forward activations, their gradients and the temporary buffers of the backward pass
+TAPE_FACTOR = 3
+# Images, gradients and regularization buffers of a single example
+IMAGE_BUFFERS = 4
+
+
+def example_bytes(settings, layer_name):
+    """Estimates the memory one image of a batched gradient ascent step on the given layer needs.
+
+    Args:
+        settings: the current settings object.
+        layer_name: the name of the optimized layer.
+
+    Returns:
+        the estimated number of bytes per image.
+    """
+    image_bytes = 4 * settings.input_width * settings.input_height * 3
+    activation_bytes = 0
+    if settings.model_index is not None and layer_name in settings.model_index:
+        activation_bytes = settings.model_index[layer_name].extractor_activation_bytes
+    measured = settings.registry.batch_memory.get(layer_name)
+    if measured is not None:
+        return measured
+    return TAPE_FACTOR * activation_bytes + IMAGE_BUFFERS * image_bytes
+
+
+def measure_example_bytes(settings, layer_name, items, run):
+    """Measures the memory per image with a single step probe run of batch size 1 and 2. Only supported on GPUs.
+
+    Args:
+        settings: the current settings object.
+        layer_name: the name of the optimized layer.
+        items: list of objectives, the first one is used for the probe.
+        run: function taking the settings and a list of items and returning one result per item.
+
+    Returns:
+        the measured number of bytes per image or None if the device does not report its memory usage.
+    """
+    if len(tf.config.list_logical_devices("GPU")) == 0:
+        return None
+    probe_settings = copy.copy(settings)
+    probe_settings.iterations = 1
+    peaks = []
+    for batch_size in (1, 2):
+        tf.config.experimental.reset_memory_stats("GPU:0")
+        run(probe_settings, items[:1] * batch_size)
+        peaks.append(tf.config.experimental.get_memory_info("GPU:0")["peak"])
+    measured = max(1, peaks[1] - peaks[0])
+    settings.registry.batch_memory[layer_name] = measured
+    return measured
+
+
+def plan_batch_size(settings, layer_name, count):
+    """Picks the largest batch size that fits into the memory budget.
+
+    Args:
+        settings: the current settings object.
+        layer_name: the name of the optimized layer.
+        count: the number of images to be optimized.
+
+    Returns:
+        the batch size, at least 1 and at most count.
+    """
+    batch_size = max(1, settings.memory_budget //
+                     max(1, example_bytes(settings, layer_name)))
+    batch_size = min(batch_size, settings.max_batch_size, count)
+    limit = settings.registry.batch_limits.get(layer_name)
+    if limit is not None:
+        batch_size = min(batch_size, limit)
+    return max(1, batch_size)
+
+
+def run_batched(settings, layer_name, items, run, worker=None, measure=False):
+    """Splits the items into batches of the planned size and runs them one after another.
+    A batch that runs out of memory is retried with half the batch size.
+
+    Args:
+        settings: the current settings object.
+        layer_name: the name of the optimized layer.
+        items: list of objectives, one per image.
+        run: function taking the settings and a list of items and returning the list of results of the batch.
+        worker: the worker object that runs the task on a second thread. Used to cancel the remaining batches.
+        measure: if set the memory per image is measured with a probe run instead of estimated, if the device supports it.
+
+    Returns:
+        the results of all completed batches in order of the items.
+    """
+    if measure and len(items) > 1 and layer_name not in settings.registry.batch_memory:
+        measure_example_bytes(settings, layer_name, items, run)
+    results = []
+    batch_size = plan_batch_size(settings, layer_name, len(items))
+    i = 0
+    while i < len(items):
+        if worker is not None and not worker.is_running:
+            break
+        batch = items[i:i + batch_size]
+        try:
+            results.extend(run(settings, batch))
+        except tf.errors.ResourceExhaustedError:
+            if batch_size == 1:
+                raise
+            batch_size = batch_size // 2
+            settings.registry.batch_limits[layer_name] = batch_size
+            continue
+        i += len(batch)
+    return results
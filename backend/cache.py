@@ -0,0 +1,69 @@
+import os
+import numpy as np
+
+import backend.util as util
+
+
+class Result_Cache:
+    """Disk-backed cache for generated feature visualizations.
+    Entries are keyed by a hash of everything that determines the result of a visualization run.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path: the directory the cached visualizations are stored in.
+        """
+        self.path = path if path is not None else util.cache_path(
+            "visualizations")
+
+    def key(self, *parts):
+        """Creates a cache key from the given parts.
+
+        Args:
+            parts: values identifying the visualization (model fingerprint, layer, target, settings, ...).
+
+        Returns:
+            the cache key.
+        """
+        return util.hash_values(*parts)
+
+    def get(self, key):
+        """Looks up the visualization stored for the given key.
+
+        Args:
+            key: the cache key.
+
+        Returns:
+            the cached image or None if no entry exists.
+        """
+        path = os.path.join(self.path, key + ".npy")
+        if not os.path.isfile(path):
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, img):
+        """Stores the given visualization.
+
+        Args:
+            key: the cache key.
+            img: the image to be stored.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, key + ".npy")
+        # Write to a temporary file first so a crash never leaves a truncated entry behind
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, img)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        """Removes all cached visualizations."""
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(".npy"):
+                os.remove(os.path.join(self.path, name))
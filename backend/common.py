@@ -0,0 +1,33 @@
+import os
+import sys
+from enum import Enum
+
+"""Definitions shared by the front-end and the back-end.
+This module must not import TensorFlow or other heavy libraries, so the GUI can be shown before the back-end is loaded.
+"""
+
+
+def resource_path(relative_path):
+    """Get absolute path to resource, works for dev and for PyInstaller"""
+    try:
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+
+    return os.path.join(base_path, relative_path)
+
+
+class Target(str, Enum):
+    """Enum for the differend loss targets for the feature visualization."""
+    FILTER = "FILTER"
+    NEURON = "NEURON"
+    DIRECTION = "DIRECTION"
+
+class Screen(str, Enum):
+    """Enum for the differend screen types."""
+    MAIN = "main"
+    SAMPLE = "sample"
+    FILTER_ACTS = "filter_acts"
+    LAYER_REP = "layer_rep"
+    GROUPED = "grouped"
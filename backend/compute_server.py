@@ -0,0 +1,407 @@
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+"""Optional compute process running the TensorFlow work outside of the GUI process.
+The GUI process talks to the compute process over a pipe. Arrays larger than
+SHARED_MEMORY_THRESHOLD are passed through shared memory instead of being pickled.
+The sender owns the shared memory until the receiver reports that it copied the array.
+If the compute process crashes, the running call fails with a Compute_Server_Error
+and the next call starts a new process.
+"""
+
+# Arrays smaller than this (in bytes) are pickled together with the message
+SHARED_MEMORY_THRESHOLD = 2**16
+# The time in seconds between two checks for cancellation and crashes while waiting for a reply
+POLL_INTERVAL = 0.1
+# Settings that are copied to the compute process before each call
+SYNCED_SETTINGS = ("learning_rate", "lr_decay", "iterations", "blur", "decay", "rotate", "jitter", "scale_jitter",
+                   "scale", "blur_kernel_size", "freq_penalization", "filter", "groups", "top_k", "seed",
+                   "memory_budget", "max_batch_size", "dict_path", "layer", "layer_profiles", "use_tflite")
+# Background jobs and interactive tasks run in separate compute processes, so a long build never blocks an interactive task
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+CHANNELS = (INTERACTIVE, BACKGROUND)
+# Visualizer methods that can be called in the compute process
+REMOTE_METHODS = ("build_dictionary", "get_activation_grid", "generate_groups", "generate_grp_visualizations",
+                  "generate_group_activation_maps", "tune_settings", "sweep_filter")
+
+
+class Compute_Server_Error(RuntimeError):
+    """Raised when a call in the compute process failed or the process exited."""
+
+
+class Shared_Arrays:
+    """Shared memory blocks of the arrays sent to the other process.
+    The handles stay open until the receiver released the arrays, since on Windows
+    a block is freed as soon as its last handle is closed.
+    """
+
+    def __init__(self):
+        self.blocks = dict()
+        self.lock = threading.Lock()
+
+    def share(self, array):
+        """Copies the array into a new shared memory block.
+
+        Args:
+            array: the array to be sent.
+
+        Returns:
+            the reference to the block that is sent instead of the array.
+        """
+        memory = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        np.ndarray(array.shape, array.dtype, buffer=memory.buf)[...] = array
+        with self.lock:
+            self.blocks[memory.name] = memory
+        return ("shared_memory", memory.name, array.shape, array.dtype.str)
+
+    def release(self, names):
+        """Frees the blocks the receiver copied.
+
+        Args:
+            names: the names of the blocks.
+        """
+        for name in names:
+            with self.lock:
+                memory = self.blocks.pop(name, None)
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+
+    def release_all(self):
+        """Frees all blocks, used when the other process exited."""
+        self.release(list(self.blocks))
+
+
+def pack(value, shared):
+    """Replaces the large arrays in the given value with references to shared memory.
+    Lists, tuples and dicts are packed recursively, images are converted to arrays.
+
+    Args:
+        value: the value to be sent.
+        shared: the shared arrays owning the blocks until the receiver released them.
+
+    Returns:
+        the value that can be pickled cheaply.
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value)(pack(item, shared) for item in value)
+    if isinstance(value, dict):
+        return {key: pack(item, shared) for key, item in value.items()}
+    if not isinstance(value, np.ndarray) and hasattr(value, "__array_interface__"):
+        value = np.asarray(value)
+    if isinstance(value, np.ndarray) and value.nbytes >= SHARED_MEMORY_THRESHOLD:
+        return shared.share(value)
+    return value
+
+
+def unpack(value, names):
+    """Restores the arrays referenced by a packed value.
+    The names of the copied blocks are collected, so the sender can be told to free them.
+
+    Args:
+        value: the received value.
+        names: list the names of the copied blocks are appended to.
+
+    Returns:
+        the original value.
+    """
+    if isinstance(value, tuple) and len(value) == 4 and value[0] == "shared_memory":
+        memory = shared_memory.SharedMemory(name=value[1])
+        array = np.ndarray(value[2], np.dtype(value[3]), buffer=memory.buf).copy()
+        memory.close()
+        names.append(value[1])
+        return array
+    if isinstance(value, (list, tuple)):
+        return type(value)(unpack(item, names) for item in value)
+    if isinstance(value, dict):
+        return {key: unpack(item, names) for key, item in value.items()}
+    return value
+
+
+def receive(conn, value):
+    """Unpacks a received value and tells the sender to free the copied blocks.
+
+    Args:
+        conn: the pipe the value was received from.
+        value: the received value.
+
+    Returns:
+        the original value.
+    """
+    names = []
+    value = unpack(value, names)
+    if names:
+        try:
+            conn.send(("release", names))
+        except OSError:
+            # The sender exited, its blocks are gone with it
+            pass
+    return value
+
+
+def drain_releases(conn, shared):
+    """Frees the blocks released by the GUI process while a call is running.
+    While a call runs the GUI process sends nothing but releases."""
+    while conn.poll():
+        message = conn.recv()
+        if message[0] == "release":
+            shared.release(message[1])
+
+
+def settings_state(settings):
+    """Collects the state of the settings the compute process needs to reproduce the results of this process.
+
+    Args:
+        settings: the current settings object.
+
+    Returns:
+        dict that can be sent to the compute process.
+    """
+    return {
+        "model_path": settings.model_path,
+        "input_path": settings.input_path,
+        "resources": settings.resources.to_dict(),
+        "settings": {name: getattr(settings, name) for name in SYNCED_SETTINGS},
+    }
+
+
+class Remote_Signal:
+    """Signal of the remote worker, emitting sends the arguments to the GUI process."""
+
+    def __init__(self, conn, name, shared):
+        self.conn = conn
+        self.name = name
+        self.shared = shared
+
+    def emit(self, *args):
+        drain_releases(self.conn, self.shared)
+        self.conn.send((self.name, pack(args, self.shared)))
+
+
+class Remote_Worker:
+    """Worker passed to the visualizer in the compute process.
+    Cancellation is requested by the GUI process through the cancel event.
+    """
+
+    def __init__(self, conn, cancel_event, shared):
+        self.cancel_event = cancel_event
+        # Background and interactive tasks run in separate processes, there is nothing to preempt
+        self.gate = None
+        self.progress = Remote_Signal(conn, "progress", shared)
+        self.tile = Remote_Signal(conn, "tile", shared)
+        self.preview = Remote_Signal(conn, "preview", shared)
+
+    @property
+    def is_running(self):
+        return not self.cancel_event.is_set()
+
+
+def apply_state(visualizer, state, previous):
+    """Updates the visualizer of the compute process to the state of the GUI process.
+    The model, the input, the activations and the dictionary are only reloaded when they changed.
+
+    Args:
+        visualizer: the visualizer of the compute process.
+        state: the state sent by the GUI process.
+        previous: the state applied before.
+    """
+    import backend.util as util
+    import backend.resources as resources
+    settings = visualizer.settings
+    if state["resources"] != previous.get("resources"):
+        settings.resources = resources.Compute_Resources.from_dict(state["resources"])
+        resources.apply_resources(settings.resources)
+    model_changed = state["model_path"] != previous.get("model_path")
+    if model_changed and state["model_path"] is not None:
+        settings.init_model(util.load_model(
+            state["model_path"]), state["model_path"])
+    input_changed = model_changed or state["input_path"] != previous.get("input_path")
+    if input_changed and state["input_path"] is not None:
+        visualizer.update_input(state["input_path"])
+    for name, value in state["settings"].items():
+        setattr(settings, name, value)
+    old = previous.get("settings", dict())
+    # Switching the inference backend clears the activation cache
+    backend_changed = settings.registry is not None and settings.use_tflite != old.get("use_tflite", False)
+    if backend_changed:
+        visualizer.apply_inference_backend()
+    layer_changed = input_changed or backend_changed or settings.layer != old.get("layer")
+    if settings.layer is None or state["input_path"] is None:
+        return
+    if layer_changed:
+        visualizer.update_activations()
+    if settings.dict_path is not None and (layer_changed or settings.dict_path != old.get("dict_path")):
+        try:
+            visualizer.update_dictionary(settings.layer)
+        except (OSError, KeyError, ValueError):
+            # The dictionary might still be generated, calls needing it fail on their own
+            visualizer.reset_dictionary()
+
+
+def serve(conn, cancel_event):
+    """Main loop of the compute process. Answers the requests of the GUI process until the pipe is closed.
+
+    Args:
+        conn: the compute process end of the pipe.
+        cancel_event: event set by the GUI process to cancel the running call.
+    """
+    # TensorFlow is imported in the compute process only
+    from backend.visualizer import Visualizer
+    visualizer = Visualizer()
+    shared = Shared_Arrays()
+    worker = Remote_Worker(conn, cancel_event, shared)
+    state = dict()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            shared.release_all()
+            return
+        if message[0] == "close":
+            shared.release_all()
+            return
+        if message[0] == "release":
+            shared.release(message[1])
+            continue
+        try:
+            if message[0] == "sync":
+                apply_state(visualizer, message[1], state)
+                state = message[1]
+                result = None
+            elif message[0] == "call":
+                name, args, with_worker = message[1:]
+                if name not in REMOTE_METHODS:
+                    raise ValueError(f"{name} can not be called in the compute process")
+                kwargs = {"worker": worker} if with_worker else dict()
+                result = getattr(visualizer, name)(
+                    *receive(conn, args), **kwargs)
+            drain_releases(conn, shared)
+            conn.send(("result", pack(result, shared)))
+        except Exception as err:
+            # A failed sync leaves the state undefined, everything is reloaded with the next one
+            if message[0] == "sync":
+                state = dict()
+            conn.send(("error", repr(err)))
+
+
+class Compute_Server:
+    """Client of the compute process. The process is started with the first call.
+    Calls are serialized, a running call blocks the calling thread until it is answered.
+    A call waiting for another call to finish is canceled as soon as its worker is stopped.
+    """
+
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.conn = None
+        self.cancel_event = None
+        self.shared = Shared_Arrays()
+        self.lock = threading.Lock()
+
+    @property
+    def is_alive(self):
+        """True while the compute process is running."""
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        """Starts a new compute process."""
+        self.conn, child_conn = self.context.Pipe()
+        self.cancel_event = self.context.Event()
+        self.process = self.context.Process(
+            target=serve, args=(child_conn, self.cancel_event), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def call(self, name, *args, worker=None, settings=None):
+        """Calls the given visualizer method in the compute process.
+
+        Args:
+            name: the name of the method, one of REMOTE_METHODS.
+            args: the arguments of the method.
+            worker: the local worker, receives the progress of the call and cancels it when it is stopped.
+            settings: the current settings object, copied to the compute process before the call.
+
+        Returns:
+            the result of the method, None if the worker was stopped before the call started.
+
+        Raises:
+            Compute_Server_Error: if the method raised an exception or the compute process exited.
+        """
+        if not self.acquire(worker):
+            return None
+        try:
+            if not self.is_alive:
+                self.start()
+            if settings is not None:
+                self.request(("sync", settings_state(settings)))
+            self.cancel_event.clear()
+            return self.request(("call", name, pack(args, self.shared), worker is not None), worker)
+        finally:
+            self.lock.release()
+
+    def acquire(self, worker):
+        """Waits for the running call to finish.
+
+        Args:
+            worker: the local worker, waiting ends when it is stopped.
+
+        Returns:
+            True if the lock was acquired, False if the worker was stopped while waiting.
+        """
+        while not self.lock.acquire(timeout=POLL_INTERVAL):
+            if worker is not None and not worker.is_running:
+                return False
+        return True
+
+    def request(self, message, worker=None):
+        """Sends the message and waits for the reply. Forwards the signals emitted in the compute process to the worker."""
+        try:
+            self.conn.send(message)
+        except OSError:
+            self.crashed()
+        while True:
+            if worker is not None and not worker.is_running:
+                self.cancel_event.set()
+            if self.conn.poll(POLL_INTERVAL):
+                try:
+                    kind, value = self.conn.recv()
+                except EOFError:
+                    self.crashed()
+                if kind == "release":
+                    self.shared.release(value)
+                    continue
+                if kind == "result":
+                    return receive(self.conn, value)
+                if kind == "error":
+                    raise Compute_Server_Error(value)
+                args = receive(self.conn, value)
+                if worker is not None:
+                    getattr(worker, kind).emit(*args)
+            elif not self.process.is_alive():
+                self.crashed()
+
+    def crashed(self):
+        """Cleans up after the compute process exited unexpectedly."""
+        exitcode = self.process.exitcode
+        self.process = None
+        self.conn.close()
+        self.shared.release_all()
+        raise Compute_Server_Error(
+            f"The compute process exited unexpectedly (exit code {exitcode})")
+
+    def stop(self):
+        """Shuts the compute process down."""
+        with self.lock:
+            if not self.is_alive:
+                return
+            self.cancel_event.set()
+            self.conn.send(("close",))
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+            self.conn.close()
+            self.shared.release_all()
@@ -4,8 +4,10 @@ import os
 from tensorflow import keras
 import json
 import backend.feature_visualization as fv
+import backend.batching as batching
 from backend.util import Target
 import backend.util as util
+import numpy as np
 
 
 class Dictionary:
@@ -20,34 +22,55 @@ class Dictionary:
         self.dictionary = dict()
         self.target = target
 
-    def generate_dictionary(self, settings, layer, worker):
+    def generate_dictionary(self, settings, layer, worker, store=None, path=None):
         """Generates the feature visualizations for the given layer and appends them to the dictionary.
         Saves the images immediately to the disk to reduce memory usage.
+        Uses the tuned settings profile of the layer if one exists.
+        Visualizations of the same model, layer and settings are reused from the artifact store.
 
         Args:
             layer: the layer the visualizations are generated for.
             settings: the current settings object.
             worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+            store: the artifact store the generated visualizations are looked up in and added to.
+            path: the directory the visualizations are exported to, defaults to the dictionary path of the settings.
         """
         layer_name = layer.name
-        feature_extractor = util.prepare_feature_extractor(
-            settings.model, layer_name)
-        if self.target == Target.FILTER:
-            self.dictionary[layer_name] = self.generate_features(
-                feature_extractor, settings, layer.filter_count, worker)
-        elif self.target == Target.NEURON:
-            self.dictionary[layer_name] = self.generate_features(
-                feature_extractor, settings, layer.filter_count, layer.neuron_count, worker)
-        self.export_dictionary(settings.dict_path, layer.name)
+        settings = settings.settings_for_layer(layer_name)
+        settings_fingerprint = settings.fingerprint()
+        artifact = None
+        if store is not None and self.target == Target.FILTER:
+            artifact = store.get("dictionary", settings.model_fingerprint,
+                                 settings_fingerprint, layer_name, self.target)
+        if artifact is not None:
+            self.dictionary[layer_name] = [image.array_to_img(img)
+                                           for img in artifact[1]["images"]]
+        else:
+            feature_extractor = settings.registry.extractor(layer_name)
+            if self.target == Target.FILTER:
+                self.dictionary[layer_name] = self.generate_features(
+                    feature_extractor, settings, layer_name, layer.filter_count, worker)
+            elif self.target == Target.NEURON:
+                self.dictionary[layer_name] = self.generate_features(
+                    feature_extractor, settings, layer_name, layer.filter_count, worker, layer.neuron_count)
+            if store is not None and self.target == Target.FILTER and worker.is_running:
+                store.put({"images": np.stack([np.asarray(img) for img in self.dictionary[layer_name]])},
+                          "dictionary", settings.model_fingerprint, settings_fingerprint, layer_name, self.target)
+        if path is None:
+            path = settings.dict_path
+        self.export_dictionary(path, layer.name,
+                               settings.model_fingerprint, settings_fingerprint)
         self.dictionary.clear()
 
-    def generate_features(self, feature_extractor, settings, filter_count, worker, neuron_count=None):
+    def generate_features(self, feature_extractor, settings, layer_name, filter_count, worker, neuron_count=None):
         """Depending on the target this function iterates over the filters (and neurons in the filter output if target==NEURON)
         and generates a visualization for each target.
+        The targets are optimized in batches sized to fit into the memory budget of the settings.
 
         Args:
             feature_extractor: a modified model that outputs the activations for the selected layer.
             settings: the current settings object.
+            layer_name: the name of the selected layer.
             filter_count: the number of filters in the selected layer.
             worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
             neuron_count: the number of neurons in each filter output.
@@ -55,53 +78,65 @@ class Dictionary:
         Returns:
             all_imgs: the list of generated images
         """
-        all_imgs = []
-        for filter_index in range(filter_count):
-            if worker.is_running and self.target == Target.FILTER:
-                img = fv.visualize_filter(
-                    feature_extractor, settings, filter_index)
-                all_imgs.append(image.array_to_img(img))
-            elif worker.is_running and self.target == Target.NEURON:
-                neuron_imgs = []
-                for i in range(neuron_count[0]):
-                    for j in range(neuron_count[1]):
-                        img = fv.visualize_neuron(
-                            feature_extractor, filter_index, (i, j), settings)
-                        neuron_imgs.append(image.array_to_img(img))
-                all_imgs.append(neuron_imgs)
-            elif not worker.is_running:
+        if self.target == Target.FILTER:
+            imgs = batching.run_batched(settings, layer_name, list(range(filter_count)),
+                                        lambda s, batch: fv.visualize_filters(
+                                            feature_extractor, s, batch, worker),
+                                        worker, measure=True)
+            if not worker.is_running:
                 return []
-        return all_imgs
-
-    def export_dictionary(self, path, layer):
+            return [image.array_to_img(img) for img in imgs]
+        neurons = [[filter_index, i, j] for filter_index in range(filter_count)
+                   for i in range(neuron_count[0]) for j in range(neuron_count[1])]
+        imgs = batching.run_batched(settings, layer_name, neurons,
+                                    lambda s, batch: fv.visualize_neurons(
+                                        feature_extractor, batch, s, worker),
+                                    worker, measure=True)
+        if not worker.is_running:
+            return []
+        per_filter = neuron_count[0] * neuron_count[1]
+        return [[image.array_to_img(img) for img in imgs[f * per_filter:(f + 1) * per_filter]]
+                for f in range(filter_count)]
+
+    def export_dictionary(self, path, layer, model_fingerprint=None, settings_fingerprint=None):
         """Saves the generated dictionary of visualizations to the disk.
-        Creates an index file in json format containing the selected target
-        and the number of generated images for each filter.
+        Creates an index file in json format containing the selected target,
+        the number of generated images for each filter and the fingerprints of the model and settings they were generated with.
 
         Args:
             path: the path the dictionary will be exported to.
             layer: the selected layer.
+            model_fingerprint: the fingerprint of the model the visualizations were generated with.
+            settings_fingerprint: the fingerprint of the settings the visualizations of the layer were generated with.
+
+        Raises:
+            ValueError: if the directory already contains a dictionary of a different model.
         """
         index = {
             "target": self.target,
+            "model_fingerprint": model_fingerprint,
+            "settings": dict(),
             "layers": dict()
         }
-        layers = index["layers"]
+        index_path = os.path.join(path, "index.json")
+        if os.path.isfile(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            check_fingerprint(index, model_fingerprint)
+            index["model_fingerprint"] = model_fingerprint
+            index.setdefault("settings", dict())
 
         if not os.path.exists(os.path.join(path, layer)):
             os.makedirs(os.path.join(path, layer))
         if self.target == Target.FILTER:
-            layers[layer] = len(self.dictionary[layer])
             self.export_filter(path, layer)
         # elif self.target == Target.NEURON:
         #     layers[layer] = (len(self.dictionary[layer]),
         #                      len(self.dictionary[layer][0]))
         #     self.export_neurons(path, layer)
-        if os.path.isfile(os.path.join(path, "index.json")):
-            f = open(os.path.join(path, "index.json"))
-            index = json.load(f)
-            index["layers"][layer] = len(self.dictionary[layer])
-        with open(os.path.join(path, "index.json"), "w") as index_file:
+        index["layers"][layer] = len(self.dictionary[layer])
+        index["settings"][layer] = settings_fingerprint
+        with open(index_path, "w") as index_file:
             json.dump(index, index_file)
 
     def export_filter(self, path, layer):
@@ -124,17 +159,23 @@ class Dictionary:
     #                                 "filter" + str(filter_index) + "_neuron" + str(neuron_index) + ".png")
     #             keras.preprocessing.image.save_img(path, img)
 
-    def import_dictionary(self, import_path, layer):
+    def import_dictionary(self, import_path, layer, model_fingerprint=None, settings_fingerprint=None):
         """Imports an already generated dictionary from the disk.
         To reduce memory usage, only one layer at a time is loaded.
 
         Args:
             path: the path the dictionary will be imported from.
             layer: the selected layer.
+            model_fingerprint: the fingerprint of the current model, checked against the fingerprint stored in the index.
+            settings_fingerprint: the fingerprint of the current settings of the layer, checked against the fingerprint stored in the index.
 
+        Raises:
+            ValueError: if the dictionary was generated for a different model or with different settings.
         """
         f = open(os.path.join(import_path, "index.json"))
         data = json.load(f)
+        check_fingerprint(data, model_fingerprint)
+        check_settings(data, layer, settings_fingerprint)
         dictionary = dict()
         self.target = Target(data["target"])
 
@@ -157,3 +198,55 @@ class Dictionary:
             dictionary[layer] = imgs
         self.dictionary.clear()
         self.dictionary = dictionary
+
+
+def check_directory(path, model_fingerprint):
+    """Checks that a directory does not already contain the dictionary of a different model.
+
+    Args:
+        path: the directory the dictionary will be exported to.
+        model_fingerprint: the fingerprint of the current model.
+
+    Raises:
+        ValueError: if the directory contains a dictionary generated for a different model.
+    """
+    index_path = os.path.join(path, "index.json")
+    if not os.path.isfile(index_path):
+        return
+    with open(index_path) as f:
+        check_fingerprint(json.load(f), model_fingerprint)
+
+
+def check_fingerprint(index, model_fingerprint):
+    """Checks that a dictionary index belongs to the given model.
+    Dictionaries exported by older versions do not contain a fingerprint and are accepted.
+
+    Args:
+        index: the loaded index of the dictionary.
+        model_fingerprint: the fingerprint of the current model (None skips the check).
+
+    Raises:
+        ValueError: if the dictionary was generated for a different model.
+    """
+    stored = index.get("model_fingerprint")
+    if model_fingerprint is not None and stored is not None and stored != model_fingerprint:
+        raise ValueError(
+            "The dictionary was generated for a different model")
+
+
+def check_settings(index, layer, settings_fingerprint):
+    """Checks that the visualizations of a layer were generated with the given settings.
+    Dictionaries exported by older versions do not contain settings fingerprints and are accepted.
+
+    Args:
+        index: the loaded index of the dictionary.
+        layer: the name of the layer.
+        settings_fingerprint: the fingerprint of the current settings of the layer (None skips the check).
+
+    Raises:
+        ValueError: if the visualizations of the layer were generated with different settings.
+    """
+    stored = index.get("settings", dict()).get(layer)
+    if settings_fingerprint is not None and stored is not None and stored != settings_fingerprint:
+        raise ValueError(
+            f"The dictionary of layer {layer} was generated with different settings, generate it again or import the settings it was generated with")
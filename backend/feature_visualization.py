@@ -1,55 +1,99 @@
+import copy
 import tensorflow as tf
 import tensorflow_addons as tfa
-import numpy as np
-import cv2
 
 import backend.util as util
+from backend.preemption import checkpoint
 
 """Some regularizations inspired form: https://github.com/tensorflow/lucid.
 Feature Visualization engine based on keras tutorial: https://keras.io/examples/vision/visualizing_what_convnets_learn/.
 """
 
-def rand_select(xs):
-    """Randomly selects rotation angle out of the given list.
-    Args:
-        xs: list of angles.
+ROTATION_ANGLES = list(range(-10, 11)) + 5 * [0]
+SCALE_FACTORS = [1, 0.975, 1.025, 0.95, 1.05]
+
 
+def angle2rads(angle):
+    """Converts angle to radiant.
+    
+    Args:
+        angle: the angle to be converted.
+    
     Returns:
-        tensor containing the selected angle
+        rad: the radiant representation of the angle.
     """
-    xs_list = list(xs)
-    rand_n = tf.random.uniform((), 0, len(xs_list), "int32")
-    return tf.constant(xs_list)[rand_n]
+    angle = tf.cast(angle, "float32")
+    rad = 3.14 * angle / 180.
+    return rad
 
 
-def random_rotate(t, angles):
-    """Randomly rotates the given tensor image representation.
+def sample_transforms(settings, iterations):
+    """Pre-samples the random rotation, jitter and scale parameters for all iterations
+    and composes them into one projective transform per iteration.
+    The parameters are drawn from a stateless generator seeded with settings.seed.
 
     Args:
-        t: tensor representation of the image to be rotated.
-        angles: list of angles to choose from.
+        settings: the feature visualization settings.
+        iterations: the number of iterations to sample transforms for.
 
     Returns:
+        tensor of shape (iterations, 8) containing the flattened projective transforms or None if all random transforms are disabled.
+    """
+    if not (settings.rotate or settings.jitter > 0 or settings.scale_jitter):
+        return None
+    seed = settings.seed
+    angles = tf.zeros((iterations,))
+    if settings.rotate:
+        choice = tf.random.stateless_uniform(
+            (iterations,), [seed, 1], 0, len(ROTATION_ANGLES), "int32")
+        angles = angle2rads(tf.gather(ROTATION_ANGLES, choice))
+    scales = tf.ones((iterations,))
+    if settings.scale_jitter:
+        choice = tf.random.stateless_uniform(
+            (iterations,), [seed, 2], 0, len(SCALE_FACTORS), "int32")
+        scales = tf.gather(tf.constant(SCALE_FACTORS, "float32"), choice)
+    shifts = tf.zeros((iterations, 2))
+    if settings.jitter > 0:
+        shifts = tf.cast(tf.random.stateless_uniform(
+            (iterations, 2), [seed, 3], -settings.jitter, settings.jitter + 1, "int32"), "float32")
+    return compose_transforms(angles, scales, shifts, settings.input_width, settings.input_height)
+
+
+def compose_transforms(angles, scales, shifts, height, width):
+    """Composes rotation and scaling around the image center followed by a translation into a single projective transform.
+    The transforms map output coordinates to input coordinates as expected by tfa.image.transform.
+
+    Args:
+        angles: tensor containing the rotation angles in radiants.
+        scales: tensor containing the zoom factors.
+        shifts: tensor of shape (n, 2) containing the translations in pixels (x, y).
+        height: the height of the transformed images.
+        width: the width of the transformed images.
 
+    Returns:
+        tensor of shape (n, 8) containing the flattened projective transforms.
     """
-    t = tf.convert_to_tensor(t, dtype=tf.float32)
-    angle = rand_select(angles)
-    angle = angle2rads(angle)
-    return tfa.image.rotate(t, angle)
+    cx = (width - 1) / 2
+    cy = (height - 1) / 2
+    cos = tf.math.cos(angles) / scales
+    sin = tf.math.sin(angles) / scales
+    a2 = cx - (cos * cx - sin * cy) - shifts[:, 0]
+    b2 = cy - (sin * cx + cos * cy) - shifts[:, 1]
+    zeros = tf.zeros_like(angles)
+    return tf.stack([cos, -sin, a2, sin, cos, b2, zeros, zeros], axis=1)
 
 
-def angle2rads(angle):
-    """Converts angle to radiant.
-    
+def apply_transform(img, transform):
+    """Resamples the given image once using the given projective transform.
+
     Args:
-        angle: the angle to be converted.
-    
+        img: the image to be transformed.
+        transform: the flattened projective transform.
+
     Returns:
-        rad: the radiant representation of the angle.
+        the transformed image.
     """
-    angle = tf.cast(angle, "float32")
-    rad = 3.14 * angle / 180.
-    return rad
+    return tfa.image.transform(img, transform, interpolation="nearest")
 
 
 def penalize(img, settings, B=128):
@@ -69,7 +113,7 @@ def penalize(img, settings, B=128):
     tv = 1 / (settings.input_height *
               settings.input_width * 0.02 * B)
     img += penalty * B
-    img += tv * tf.image.total_variation(img)
+    img += tv * tf.reshape(tf.image.total_variation(img), (-1, 1, 1, 1))
     return img
 
 
@@ -87,7 +131,8 @@ def decay_regularization(img, decay=0.8):
 
 
 def blur_regularization(img, settings):
-    """Applies blur to the given image.
+    """Applies a box blur to the given image.
+    Matches cv2.blur: the kernel is anchored at its center and the borders are reflected.
 
     Args:
         img: the image to be blurred.
@@ -96,30 +141,53 @@ def blur_regularization(img, settings):
     Returns:
         blurred: the blurred image.    
     """
-    tmp = np.transpose(img[0, :], (1, 0, 2))
-    blurred = np.float32(
-        cv2.blur(tmp, (settings.blur_kernel_size, settings.blur_kernel_size)))
-    blurred = np.float32([np.transpose(blurred, (1, 0, 2))])
-    blurred = tf.convert_to_tensor(blurred)
+    k = settings.blur_kernel_size
+    if k < 2:
+        return img
+    before = k // 2
+    after = k - 1 - before
+    padded = tf.pad(img, [[0, 0], [before, after], [
+                    before, after], [0, 0]], mode="REFLECT")
+    blurred = tf.nn.avg_pool2d(padded, k, 1, "VALID")
     return blurred
 
 
-def compute_loss(feature_extractor, input_image, loss_f):
+def regularize(img, settings):
+    """Applies the enabled regularizations to the given image as one chain of tensor operations.
+
+    Args:
+        img: the image to be regularized.
+        settings: the feature visualization settings.
+
+    Returns:
+        img: the regularized image.
+    """
+    if settings.freq_penalization:
+        img = penalize(img, settings)
+    if settings.blur:
+        img = blur_regularization(img, settings)
+    if settings.decay:
+        img = decay_regularization(img)
+    return img
+
+
+def compute_loss(feature_extractor, input_image, loss_f, objective):
     """Calculates the given loss for the given input image.
     
     Args:
         feature_extractor: modified model to retrieve activations of the selected layer.
         input_image: the input to be optimized in the feature visualization process.
         loss_f: the loss function to be applied.
+        objective: tensor specifying the target of the loss function (filter index, neuron coordinates or direction).
 
     Returns:
         the result of the loss function for the activations of the selected layer.
     """
     activation = feature_extractor(input_image)
-    return loss_f(activation)
+    return loss_f(activation, objective)
 
 
-def gradient_ascent_step(feature_extractor, img, settings, loss_f):
+def gradient_ascent_step(feature_extractor, img, settings, loss_f, objective, transform=None, learning_rate=None):
     """Performs on step of the gradient ascent.
     
     Args:
@@ -127,70 +195,167 @@ def gradient_ascent_step(feature_extractor, img, settings, loss_f):
         img: the input to be optimized in the feature visualization process.
         settings: the feature visualization settings.
         loss_f: the loss function to be applied.
+        objective: tensor specifying the target of the loss function.
+        transform: the pre-sampled projective transform for this step (None disables the transformation).
+        learning_rate: the step size, either a scalar or one value per image in the batch (settings.learning_rate if None is given).
     
     Returns:
         loss: the result of the given loss function.
         img: the img resulting after the gradient ascent step.
     """
+    if learning_rate is None:
+        learning_rate = settings.learning_rate
     with tf.GradientTape() as tape:
         tape.watch(img)
-        loss = compute_loss(feature_extractor, img, loss_f)
+        loss = compute_loss(feature_extractor, img, loss_f, objective)
     # Compute gradients
     grads = tape.gradient(loss, img)
 
-    # Normalize gradients
-    grads = tf.math.l2_normalize(grads)
-    img += settings.learning_rate * grads
-    if settings.freq_penalization:
-        img = penalize(img, settings)
-    if settings.blur:
-        img = blur_regularization(img, settings)
-    if settings.decay:
-        img = decay_regularization(img)
-    if settings.rotate:
-        img = random_rotate(img, list(range(-10, 11)) + 5 * [0])
+    # Normalize gradients of each image in the batch separately
+    grads = tf.math.l2_normalize(grads, axis=[1, 2, 3])
+    img += tf.reshape(learning_rate, (-1, 1, 1, 1)) * grads
+    img = regularize(img, settings)
+    if transform is not None:
+        img = apply_transform(img, transform)
     return loss, img
 
 
-def initialize_image(settings):
+def regularization_key(settings):
+    """Collects the settings that are fixed when the step function is traced.
+
+    Args:
+        settings: the feature visualization settings.
+
+    Returns:
+        tuple identifying the traced step function for a layer and loss function.
+    """
+    transformed = settings.rotate or settings.jitter > 0 or settings.scale_jitter
+    return (settings.input_width, settings.input_height, settings.freq_penalization, settings.blur,
+            settings.blur_kernel_size, settings.decay, transformed)
+
+
+def make_step_function(feature_extractor, settings, loss_f):
+    """Compiles the gradient ascent step including all regularizations and the random transform into a single graph.
+    The objective and the learning rate are arguments of the compiled function, so one trace serves all targets of a layer.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer.
+        settings: the feature visualization settings.
+        loss_f: the loss function to be applied.
+
+    Returns:
+        the compiled step function taking the image, the transform, the learning rate and the objective for the step.
+    """
+    # A retrace for new input shapes must see the settings the function is registered under, not the current ones
+    frozen = copy.copy(settings)
+    transformed = regularization_key(frozen)[-1]
+
+    @tf.function
+    def step(img, transform, learning_rate, objective):
+        return gradient_ascent_step(feature_extractor, img, frozen, loss_f, objective, transform if transformed else None, learning_rate)
+    return step
+
+
+def get_step_function(feature_extractor, settings, loss_f):
+    """Gets the compiled step function from the registry of the model, tracing it on first use.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer (taken from the registry).
+        settings: the feature visualization settings.
+        loss_f: the loss function to be applied.
+
+    Returns:
+        the compiled step function.
+    """
+    key = ("step", id(feature_extractor), loss_f,
+           regularization_key(settings))
+    return settings.registry.function(key, lambda: make_step_function(feature_extractor, settings, loss_f))
+
+
+def optimize(feature_extractor, settings, loss_f, objective, batch_size=None, learning_rate=None, learning_rate_decay=None, callback=None, worker=None):
+    """Runs the gradient ascent for the number of iterations specified in the settings.
+    The worker is checked before every step, a canceled run stops early and returns its current image.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer.
+        settings: the feature visualization settings.
+        loss_f: the loss function to be applied.
+        objective: the target of the loss function (filter index, neuron coordinates or direction).
+        batch_size: the number of images optimized at once (settings.scale if None is given).
+        learning_rate: scalar or list with one learning rate per image (settings.learning_rate if None is given).
+        learning_rate_decay: scalar or list with one factor per image the learning rate is multiplied with after each step (settings.lr_decay if None is given).
+        callback: function called with the number of completed steps and the current image after each step.
+        worker: the worker object that runs the task on a second thread. Used to cancel or preempt the run.
+
+    Returns:
+        img: the optimized image tensor.
+    """
+    img = initialize_image(settings, batch_size)
+    if learning_rate is None:
+        learning_rate = settings.learning_rate
+    if learning_rate_decay is None:
+        learning_rate_decay = settings.lr_decay
+    learning_rate = tf.constant(learning_rate, "float32")
+    learning_rate_decay = tf.constant(learning_rate_decay, "float32")
+    objective = tf.convert_to_tensor(objective)
+    step = get_step_function(feature_extractor, settings, loss_f)
+    transforms = sample_transforms(settings, settings.iterations)
+    if transforms is None:
+        transforms = tf.zeros((settings.iterations, 8))
+    for i in range(settings.iterations):
+        if not checkpoint(worker):
+            break
+        step_size = learning_rate * learning_rate_decay ** i
+        _, img = step(img, transforms[i], step_size, objective)
+        if callback is not None:
+            callback(i + 1, img)
+    return img
+
+
+def initialize_image(settings, batch_size=None):
     """Initializes a random image as a starting point for the feature visualization process.
+    The noise is drawn from a stateless generator seeded with settings.seed so runs are reproducible.
+    Batches repeat the same noise so every image starts from the starting point of a single run.
     
     Args:
         settings: the feature visualization settings.
+        batch_size: the number of images to initialize (settings.scale if None is given).
 
     Returns:
         the random image.
     """
     # Start from a gray image with some random noise
-    img = tf.random.uniform(
-        (settings.scale, settings.input_width, settings.input_height, 3))
+    img = tf.random.stateless_uniform(
+        (settings.scale, settings.input_width, settings.input_height, 3), [settings.seed, 0])
     # Here we scale our random inputs to [-0.125, +0.125]
-    return (img - 0.5 * settings.scale) * 0.25
+    img = (img - 0.5 * settings.scale) * 0.25
+    if batch_size is not None:
+        img = tf.tile(img[:1], [batch_size, 1, 1, 1])
+    return img
 
 
-def visualize_filter(feature_extractor, settings, filter_index):
+def visualize_filter(feature_extractor, settings, filter_index, worker=None, callback=None):
     """Performs a feature visualization process for a filter target.
     
     Args:
         feature_extractor: modified model to retrieve activations of the selected layer.
         settings: the feature visualization settings.
         filter_index: the index of the target filter for the feature visualization process.
+        worker: the worker object that runs the task on a second thread. Used to cancel or preempt the process.
+        callback: function called with the number of completed steps and the current image after each step.
 
     Returns:
         img: the resulting image after the feature visualization process.
     """
-    img = initialize_image(settings)
-    loss_f = filter_loss(filter_index)
-    for i in range(settings.iterations):
-        loss, img = gradient_ascent_step(
-            feature_extractor, img, settings, loss_f)
+    img = optimize(feature_extractor, settings, filter_loss,
+                   filter_index, callback=callback, worker=worker)
 
     # Decode the resulting input image
     img = util.deprocess_image(img[0].numpy())
     return img
 
 
-def visualize_neuron(feature_extractor, filter_index, neuron_index, settings):
+def visualize_neuron(feature_extractor, filter_index, neuron_index, settings, worker=None, callback=None):
     """Performs a feature visualization process for a neuron target.
     
     Args:
@@ -198,85 +363,159 @@ def visualize_neuron(feature_extractor, filter_index, neuron_index, settings):
         settings: the feature visualization settings.
         filter_index: the index of the target filter for the feature visualization process.
         neuron_index: the coordinates of the neuron in the given filter for the feature visualization process.
+        worker: the worker object that runs the task on a second thread. Used to cancel or preempt the process.
+        callback: function called with the number of completed steps and the current image after each step.
 
     Returns:
         img: the resulting image after the feature visualization process.
     """
-    img = initialize_image(settings)
-    loss_f = neuron_loss(filter_index, neuron_index)
-    for _ in range(settings.iterations):
-        _, img = gradient_ascent_step(feature_extractor, img, settings, loss_f)
+    img = optimize(feature_extractor, settings, neuron_loss,
+                   [filter_index, neuron_index[0], neuron_index[1]], callback=callback, worker=worker)
 
     # Decode the resulting input image
     img = util.deprocess_image(img[0].numpy())
     return img
 
 
-def visualize_direction(feature_extractor, acts, settings):
+def visualize_direction(feature_extractor, acts, settings, worker=None):
     """Performs a feature visualization process for the directions target.
     
     Args:
         feature_extractor: modified model to retrieve activations of the selected layer.
         acts: tensor containing the activations of all filters at a single spatial position.
         settings: the feature visualization settings.
+        worker: the worker object that runs the task on a second thread. Used to cancel or preempt the process.
 
     Returns:
         img: the resulting image after the feature visualization process.
     """
-    img = initialize_image(settings)
-    loss_f = direction_loss(acts)
-    for _ in range(settings.iterations):
-        _, img = gradient_ascent_step(feature_extractor, img, settings, loss_f)
+    img = optimize(feature_extractor, settings, direction_loss,
+                   tf.cast(acts, "float32"), worker=worker)
 
     # Decode the resulting input image
     img = util.deprocess_image(img[0].numpy())
     return img
 
 
-def filter_loss(filter_index):
+def visualize_filters(feature_extractor, settings, filter_indices, worker=None):
+    """Performs the feature visualization process for several filters of a layer as one batch.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer.
+        settings: the feature visualization settings.
+        filter_indices: list of the indices of the target filters.
+        worker: the worker object that runs the task on a second thread. Used to cancel or preempt the process.
+
+    Returns:
+        list containing the resulting image for each filter.
+    """
+    img = optimize(feature_extractor, settings, filter_batch_loss, list(filter_indices),
+                   batch_size=len(filter_indices), worker=worker)
+    return [util.deprocess_image(x) for x in img.numpy()]
+
+
+def visualize_neurons(feature_extractor, neurons, settings, worker=None):
+    """Performs the feature visualization process for several neurons of a layer as one batch.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer.
+        neurons: list of [filter index, row, column] of the target neurons.
+        settings: the feature visualization settings.
+        worker: the worker object that runs the task on a second thread. Used to cancel or preempt the process.
+
+    Returns:
+        list containing the resulting image for each neuron.
+    """
+    img = optimize(feature_extractor, settings, neuron_batch_loss, [list(neuron) for neuron in neurons],
+                   batch_size=len(neurons), worker=worker)
+    return [util.deprocess_image(x) for x in img.numpy()]
+
+
+def visualize_directions(feature_extractor, acts, settings, worker=None):
+    """Performs the feature visualization process for several directions of a layer as one batch.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer.
+        acts: list of activation vectors of all filters, one per target direction.
+        settings: the feature visualization settings.
+        worker: the worker object that runs the task on a second thread. Used to cancel or preempt the process.
+
+    Returns:
+        list containing the resulting image for each direction.
+    """
+    # One direction per image, broadcast over the spatial positions
+    directions = tf.cast(tf.stack(acts), "float32")[:, None, None, :]
+    img = optimize(feature_extractor, settings, direction_loss, directions,
+                   batch_size=len(acts), worker=worker)
+    return [util.deprocess_image(x) for x in img.numpy()]
+
+
+def filter_loss(activation, filter_index):
     """Loss function for the filter target. Calculates the mean of the output tensor of the given filter.
 
     Args:
-        filter_index: the index of the target filter.
         activation: the activations of the of the selected layer.
+        filter_index: the index of the target filter.
 
     Returns:
-        inner: a function calculating the mean of the selected filter's activation.
+        the mean of the selected filter's activation.
     """
-    def inner(activation):
-        filter_activation = activation[:, 2:-2, 2:-2, filter_index]
-        return tf.reduce_mean(filter_activation)
-    return inner
+    filter_activation = activation[:, 2:-2, 2:-2, filter_index]
+    return tf.reduce_mean(filter_activation)
 
 
-def neuron_loss(filter_index, neuron_index):
+def neuron_loss(activation, neuron):
     """Loss function for the neuron target. Calculates the activation of the given neuron.
 
     Args:
-        filter_index: the index of the target filter.
-        neuron_index: the index of the target neuron.
         activation: the activations of the of the selected layer.
+        neuron: the index of the target filter followed by the coordinates of the target neuron.
 
     Returns:
-        inner: a function calculating the selected filter's activation at the given neuron index.
+        the selected filter's activation at the given neuron index.
     """
-    def inner(activation):
-        neuron_activation = activation[:,
-                                       neuron_index[0], neuron_index[1], filter_index]
-        return tf.reduce_sum(neuron_activation)
-    return inner
+    neuron_activation = activation[:, neuron[1], neuron[2], neuron[0]]
+    return tf.reduce_sum(neuron_activation)
+
 
+def filter_batch_loss(activation, filter_indices):
+    """Loss function for a batch of filter targets, each image in the batch is optimized for its own filter.
 
-def direction_loss(acts):
+    Args:
+        activation: the activations of the of the selected layer.
+        filter_indices: the index of the target filter for each image in the batch.
+
+    Returns:
+        the mean of the selected filters' activations.
+    """
+    filter_activation = tf.gather(
+        activation[:, 2:-2, 2:-2, :], filter_indices, axis=3, batch_dims=1)
+    return tf.reduce_mean(filter_activation)
+
+
+def neuron_batch_loss(activation, neurons):
+    """Loss function for a batch of neuron targets, each image in the batch is optimized for its own neuron.
+
+    Args:
+        activation: the activations of the of the selected layer.
+        neurons: the filter index followed by the coordinates of the target neuron for each image in the batch.
+
+    Returns:
+        the sum of the selected neurons' activations.
+    """
+    batch = tf.range(tf.shape(neurons)[0], dtype=neurons.dtype)
+    indices = tf.stack([batch, neurons[:, 1], neurons[:, 2], neurons[:, 0]], axis=1)
+    return tf.reduce_sum(tf.gather_nd(activation, indices))
+
+
+def direction_loss(activation, acts):
     """Loss function for the directions target.
 
     Args:
-        acts: the activations for the input image
         activation: the activations for the generated visualization of the of the selected layer.
+        acts: the activations for the input image
 
     Returns:
-        inner: a function calculating the sum of the sum all filter's activations at a single spatial location scaled by their activation for the input image
+        the sum of all filter's activations at each spatial location scaled by their activation for the input image
     """
-    def inner(activation):
-        return tf.reduce_sum(activation * acts, -1)
-    return inner
+    return tf.reduce_sum(activation * acts, -1)
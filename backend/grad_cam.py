@@ -10,12 +10,23 @@ Source: https://keras.io/examples/vision/grad_cam/.
 """
 
 
-def generate_gradcam(model, img, input_data, last_conv_layer):
-    heatmap = make_gradcam_heatmap(model, input_data, last_conv_layer)
+def generate_gradcam(model, img, input_data, last_conv_layer, registry=None):
+    heatmap = make_gradcam_heatmap(
+        model, input_data, last_conv_layer, registry=registry)
     return apply_heatmap(heatmap, img)
 
 
-def make_gradcam_heatmap(model, img_array, layer, pred_index=None):
+def gradcam_function(model, layer):
+    """Creates the traced function calculating the activations of the given layer
+    and their gradients with regard to the predicted (or given) class.
+
+    Args:
+        model: the keras model.
+        layer: the name of the layer.
+
+    Returns:
+        the compiled function taking the input and the class index (negative for the top predicted class).
+    """
     # First, we create a model that maps the input image to the activations
     # of the last conv layer as well as the output predictions
     grad_model = tf.keras.models.Model(
@@ -26,17 +37,34 @@ def make_gradcam_heatmap(model, img_array, layer, pred_index=None):
     # Remove last layer's softmax
     grad_model.layers[-1].activation = None
 
-    # Then, we compute the gradient of the top predicted class for our input image
-    # with respect to the activations of the last conv layer
-    with tf.GradientTape() as tape:
-        layer_output, preds = grad_model(img_array)
-        if pred_index is None:
-            pred_index = tf.argmax(preds[0])
-        class_channel = preds[:, pred_index]
-
-    # This is the gradient of the output neuron (top predicted or chosen)
-    # with regard to the output feature map of the last conv layer
-    grads = tape.gradient(class_channel, layer_output)
+    @tf.function
+    def compute(img_array, pred_index):
+        # Then, we compute the gradient of the top predicted class for our input image
+        # with respect to the activations of the last conv layer
+        with tf.GradientTape() as tape:
+            layer_output, preds = grad_model(img_array)
+            pred_index = tf.where(
+                pred_index < 0, tf.argmax(preds[0]), pred_index)
+            class_channel = tf.gather(preds, pred_index, axis=1)
+
+        # This is the gradient of the output neuron (top predicted or chosen)
+        # with regard to the output feature map of the last conv layer
+        grads = tape.gradient(class_channel, layer_output)
+        return layer_output, grads
+    return compute
+
+
+def make_gradcam_heatmap(model, img_array, layer, pred_index=None, registry=None):
+    # The traced function is cached in the registry of the model if one is given
+    if registry is not None:
+        compute = registry.function(
+            ("gradcam", layer), lambda: gradcam_function(model, layer))
+    else:
+        compute = gradcam_function(model, layer)
+    if pred_index is None:
+        pred_index = -1
+    layer_output, grads = compute(
+        img_array, tf.constant(pred_index, "int64"))
 
     # This is a vector where each entry is the mean intensity of the gradient
     # over a specific feature map channel
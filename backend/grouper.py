@@ -1,11 +1,11 @@
 from sklearn.decomposition import NMF
 import numpy as np
 from colorsys import hls_to_rgb
-from PIL import Image
 import tensorflow as tf
 
 import backend.util as util
 import backend.feature_visualization as fv
+import backend.batching as batching
 
 """Inspired by: https://colab.research.google.com/github/tensorflow/lucid/blob/master/notebooks/building-blocks/NeuronGroups.ipynb"""
 
@@ -23,9 +23,7 @@ def generate_groups(settings):
     model = NMF(n_components=settings.groups, init='random', random_state=0)
     layer_name = settings.layer
     input_data = settings.input_data
-    feature_extractor = util.prepare_feature_extractor(
-        settings.model, layer_name)
-    acts = feature_extractor(input_data)
+    acts = settings.registry.forward(layer_name)(input_data)
     grouped_acts = group_activations(
         acts, model).transpose(2, 0, 1).astype('float32')
     channel_factors = model.components_.astype('float32')
@@ -55,27 +53,23 @@ def group_activations(acts, model):
     return new_flat.reshape(shape)
 
 
-def generate_grp_visualizations(channel_factors, n, settings):
+def generate_grp_visualizations(channel_factors, n, settings, worker=None):
     """Generates feature visualizations for the generated activation groups.
 
     Args:
         channel_factors: the activation groups.
         n = the number of groups.
         settings: the current settings object.
+        worker: the worker object that runs the task on a second thread. Used to cancel the process.
 
     returns:
         grp_imgs: list containing a feature visualization for each group.
     """
-    feature_extractor = util.prepare_feature_extractor(
-        settings.model, settings.layer)
-    grp_imgs = []
-
-    for i in range(n):
-        img = fv.visualize_direction(
-            feature_extractor, channel_factors[i], settings)
-        grp_imgs.append(img)
-
-    return grp_imgs
+    feature_extractor = settings.registry.extractor(settings.layer)
+    return batching.run_batched(settings, settings.layer, [channel_factors[i] for i in range(n)],
+                                lambda s, batch: fv.visualize_directions(
+                                    feature_extractor, batch, s, worker),
+                                worker)
 
 
 def normalize_array(array):
@@ -118,13 +112,15 @@ def generate_group_activation_maps(grouped_acts, settings, worker):
         group_activations_maps: list containing an activation map for each of the provided groups.
     """
     group_activation_maps = []
+    # The tiles have to fit the slots of the combined grid, which differ for non-square inputs
+    size = util.grid_tile_shape(settings)
     for k in range(settings.groups):
         acts = normalize_array(grouped_acts[k])
         activation_grid = []
         for x, row in enumerate(acts):
             activation_grid.append([])
             for _, val in enumerate(row):
-                img = get_img(k, settings.groups, val)
+                img = get_img(k, settings.groups, val, size)
                 activation_grid[x].append(img)
         group_activation_maps.append(
             util.combine_activation_grid(activation_grid, settings, worker))
@@ -134,21 +130,22 @@ def generate_group_activation_maps(grouped_acts, settings, worker):
     return group_activation_maps
 
 
-def get_img(i, n, act):
+def get_img(i, n, act, size=(174, 174)):
     """Converts the given activation into an image resembling an activation map.
 
     Args:
         i: the group index.
         n: the number of groups.
         act: the activation tensor.
+        size: the height and width of the image.
 
     Returns:
-        an image resembling the activation map.
+        an uint8 array resembling the activation map.
     """
     hue = (i + 1 * 360) / n
     rgb = hls_to_rgb(hue, 0.5, act/100)
     rgb = [int(0.5 + 255*u) for u in rgb]
-    return Image.new('RGB', (174, 174), tuple(rgb))
+    return np.full(tuple(size) + (3,), rgb, np.uint8)
 
 
 # def generate_group_attributions(grouped_acts, channel_factors, settings):
@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from tensorflow import keras
+
+"""Local cache for imported models.
+Loading a SavedModel directory rebuilds the model from its traced graphs, which is slow for large models.
+After the first load the model is stored as a single HDF5 file, which only needs the architecture and the weights.
+The cached file is keyed by a hash of the SavedModel contents and checked against the outputs of the original model on a probe input.
+"""
+
+MODEL_FILE = "model.h5"
+PROBE_FILE = "probe.npz"
+INFO_FILE = "info.json"
+PROBE_SEED = 0
+CHUNK_SIZE = 1 << 20
+
+
+def saved_model_hash(path):
+    """Calculates a hash over the relative paths and the contents of all files of a SavedModel directory.
+
+    Args:
+        path: the path to the SavedModel directory.
+
+    Returns:
+        the hexadecimal digest identifying the SavedModel.
+    """
+    sha = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            sha.update(os.path.relpath(file_path, path).replace(
+                os.sep, "/").encode("utf-8"))
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+    return sha.hexdigest()
+
+
+def probe_inputs(model):
+    """Creates a seeded random input for each input of the model.
+
+    Args:
+        model: the keras model.
+
+    Returns:
+        list of input arrays with batch size 1 or None if an input has an unknown shape.
+    """
+    rng = np.random.default_rng(PROBE_SEED)
+    inputs = []
+    for tensor in model.inputs:
+        shape = tuple(tensor.shape)[1:]
+        if any(dim is None for dim in shape):
+            return None
+        inputs.append(rng.uniform(-1, 1, (1,) + shape).astype(
+            tensor.dtype.as_numpy_dtype))
+    return inputs
+
+
+def probe_outputs(model, inputs):
+    """Runs the model on the probe inputs.
+
+    Returns:
+        list of output arrays.
+    """
+    outputs = model(inputs if len(inputs) > 1 else inputs[0], training=False)
+    if not isinstance(outputs, (list, tuple)):
+        outputs = [outputs]
+    return [np.asarray(output) for output in outputs]
+
+
+def outputs_match(expected, actual, rtol=1e-4, atol=1e-5):
+    """Checks if two lists of model outputs are equal up to floating point noise."""
+    return len(expected) == len(actual) and all(
+        e.shape == a.shape and np.allclose(e, a, rtol=rtol, atol=atol) for e, a in zip(expected, actual))
+
+
+class Model_Cache:
+    """Stores imported SavedModels as HDF5 files for faster reloading."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: the directory the cached models are stored in.
+        """
+        self.path = path
+
+    def entry_path(self, digest, name=""):
+        """Get the path of a file of the cache entry for the given SavedModel hash."""
+        return os.path.join(self.path, digest, name)
+
+    def load_model(self, path):
+        """Loads the model from the cache, or from the SavedModel directory and adds it to the cache.
+
+        Args:
+            path: the path to the SavedModel directory.
+
+        Returns:
+            the imported keras model.
+        """
+        if not os.path.isdir(path):
+            # Single file models are already fast to restore
+            return keras.models.load_model(path, compile=False)
+        digest = saved_model_hash(path)
+        model = self.get(digest)
+        if model is not None:
+            return model
+        model = keras.models.load_model(path, compile=False)
+        self.put(digest, model, path)
+        return model
+
+    def get(self, digest):
+        """Loads a cached model and verifies it against the stored probe outputs.
+        Entries that can not be restored or do not match are removed.
+
+        Returns:
+            the cached keras model or None.
+        """
+        model_path = self.entry_path(digest, MODEL_FILE)
+        if not os.path.exists(model_path):
+            return None
+        try:
+            model = keras.models.load_model(model_path, compile=False)
+            probe = np.load(self.entry_path(digest, PROBE_FILE))
+            inputs = [probe[f"input_{i}"] for i in range(len(model.inputs))]
+            expected = [probe[f"output_{i}"]
+                        for i in range(len(probe.files) - len(inputs))]
+            if outputs_match(expected, probe_outputs(model, inputs)):
+                return model
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        self.remove(digest)
+        return None
+
+    def put(self, digest, model, source=None):
+        """Stores the model as HDF5 file if the restored file reproduces the outputs of the given model.
+        Models that can not be stored as HDF5, e.g. because of unregistered custom layers, are not cached.
+
+        Args:
+            digest: the hash of the SavedModel.
+            model: the model loaded from the SavedModel.
+            source: the path of the SavedModel, only stored for reference.
+
+        Returns:
+            True if the model was added to the cache.
+        """
+        inputs = probe_inputs(model)
+        if inputs is None:
+            return False
+        tmp_dir = self.entry_path(digest + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        try:
+            os.makedirs(tmp_dir)
+            model_path = os.path.join(tmp_dir, MODEL_FILE)
+            model.save(model_path, save_format="h5", include_optimizer=False)
+            expected = probe_outputs(model, inputs)
+            restored = keras.models.load_model(model_path, compile=False)
+            if not outputs_match(expected, probe_outputs(restored, inputs)):
+                raise ValueError("Cached model does not reproduce the outputs")
+            arrays = {f"input_{i}": x for i, x in enumerate(inputs)}
+            arrays.update({f"output_{i}": y for i, y in enumerate(expected)})
+            np.savez(os.path.join(tmp_dir, PROBE_FILE), **arrays)
+            with open(os.path.join(tmp_dir, INFO_FILE), "w") as f:
+                json.dump({"source": source}, f)
+            self.remove(digest)
+            os.replace(tmp_dir, self.entry_path(digest))
+            return True
+        except (OSError, ValueError, TypeError, NotImplementedError, ImportError):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+    def remove(self, digest):
+        """Deletes the cache entry of the given SavedModel hash."""
+        shutil.rmtree(self.entry_path(digest), ignore_errors=True)
+
+    def clear(self):
+        """Deletes all cached models."""
+        shutil.rmtree(self.path, ignore_errors=True)
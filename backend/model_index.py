@@ -0,0 +1,252 @@
+import json
+import os
+import numpy as np
+from tensorflow import keras
+
+import backend.util as util
+
+"""Precomputed per-layer metadata of a model.
+The index is stored next to the model and keyed by the model fingerprint, so it is
+only recomputed when the architecture or the weights change.
+"""
+
+
+class Layer_Info:
+    """Data class containing the metadata of a single layer.
+    Receptive field and stride are measured in input pixels along the first spatial axis.
+    The extractor values cover all layers needed to compute the output of this layer.
+    """
+
+    def __init__(self, index, name, out_shape, receptive_field, stride, flops, extractor_flops,
+                 activation_bytes, extractor_activation_bytes, params, extractor_params):
+        self.index = index
+        self.name = name
+        self.out_shape = out_shape
+        self.receptive_field = receptive_field
+        self.stride = stride
+        self.flops = flops
+        self.extractor_flops = extractor_flops
+        self.activation_bytes = activation_bytes
+        self.extractor_activation_bytes = extractor_activation_bytes
+        self.params = params
+        self.extractor_params = extractor_params
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        return "(" + str(self.index) + ", " + self.name + ", rf=" + str(self.receptive_field) + ", flops=" + str(self.extractor_flops) + ")"
+
+
+class Model_Index:
+    """Index mapping layer names to their metadata."""
+
+    def __init__(self, fingerprint, layers):
+        """
+        Args:
+            fingerprint: the fingerprint of the indexed model.
+            layers: list of Layer_Info objects in model order.
+        """
+        self.fingerprint = fingerprint
+        self.layers = {layer.name: layer for layer in layers}
+
+    def __getitem__(self, name):
+        return self.layers[name]
+
+    def __contains__(self, name):
+        return name in self.layers
+
+    def save(self, path):
+        """Writes the index to the given path.
+
+        Args:
+            path: the path of the index file.
+        """
+        data = {
+            "fingerprint": self.fingerprint,
+            "layers": [layer.to_dict() for layer in self.layers.values()]
+        }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Reads the index from the given path.
+
+        Args:
+            path: the path of the index file.
+            fingerprint: the fingerprint of the current model.
+
+        Returns:
+            the index or None if it does not exist or belongs to a different model.
+        """
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("fingerprint") != fingerprint:
+            return None
+        return cls(fingerprint, [Layer_Info.from_dict(layer) for layer in data["layers"]])
+
+
+def inbound_layers(layer, known):
+    """Lists the layers feeding into the given layer.
+
+    Args:
+        layer: the keras layer.
+        known: set of the names of the layers belonging to the model.
+
+    Returns:
+        list of the inbound layers.
+    """
+    parents = []
+    for node in layer._inbound_nodes:
+        inbound = node.inbound_layers
+        if not isinstance(inbound, (list, tuple)):
+            inbound = [inbound]
+        parents.extend(p for p in inbound if p.name in known)
+    return parents
+
+
+def first_shape(shape):
+    """Returns the first shape if the layer has multiple outputs."""
+    if isinstance(shape, list):
+        return shape[0]
+    return shape
+
+
+def window(layer):
+    """Gets the effective window size and stride of the given layer along the first spatial axis.
+
+    Args:
+        layer: the keras layer.
+
+    Returns:
+        tuple containing the window size and the stride (1, 1 for layers without a window).
+    """
+    size = getattr(layer, "kernel_size", None) or getattr(
+        layer, "pool_size", None)
+    if size is None:
+        return 1, 1
+    dilation = getattr(layer, "dilation_rate", (1,))[0]
+    strides = getattr(layer, "strides", None) or (1,)
+    return dilation * (size[0] - 1) + 1, strides[0]
+
+
+def layer_flops(layer):
+    """Estimates the floating point operations of a forward pass through the given layer for a single input.
+
+    Args:
+        layer: the keras layer.
+
+    Returns:
+        the estimated number of operations.
+    """
+    out_shape = first_shape(layer.output_shape)
+    out_size = int(np.prod([d for d in out_shape[1:] if d is not None]))
+    if isinstance(layer, (keras.layers.DepthwiseConv2D, keras.layers.SeparableConv2D)):
+        in_channels = first_shape(layer.input_shape)[-1]
+        spatial = out_shape[1] * out_shape[2]
+        flops = 2 * spatial * \
+            np.prod(layer.kernel_size) * in_channels * layer.depth_multiplier
+        if isinstance(layer, keras.layers.SeparableConv2D):
+            flops += 2 * spatial * in_channels * \
+                layer.depth_multiplier * layer.filters
+        return int(flops)
+    if isinstance(layer, keras.layers.Conv2D):
+        in_channels = first_shape(layer.input_shape)[-1]
+        groups = getattr(layer, "groups", 1)
+        return int(2 * out_size * np.prod(layer.kernel_size) * in_channels / groups)
+    if isinstance(layer, keras.layers.Dense):
+        return int(2 * first_shape(layer.input_shape)[-1] * out_size)
+    return out_size
+
+
+def build_index(model, fingerprint):
+    """Computes the metadata for each layer of the given model.
+
+    Args:
+        model: the keras model.
+        fingerprint: the fingerprint of the model.
+
+    Returns:
+        the model index.
+    """
+    known = {layer.name for layer in model.layers}
+    receptive_fields = dict()
+    strides = dict()
+    ancestors = dict()
+    infos = []
+    # Functional models list their layers in topological order
+    for i, layer in enumerate(model.layers):
+        parents = inbound_layers(layer, known)
+        size, stride = window(layer)
+        jump = max([strides[p.name] for p in parents], default=1)
+        rf = max([receptive_fields[p.name] for p in parents], default=1)
+        receptive_fields[layer.name] = rf + (size - 1) * jump
+        strides[layer.name] = jump * stride
+        ancestors[layer.name] = {layer.name}.union(
+            *[ancestors[p.name] for p in parents])
+        out_shape = first_shape(layer.output_shape)
+        infos.append(Layer_Info(i, layer.name, list(out_shape), receptive_fields[layer.name], strides[layer.name],
+                                layer_flops(layer), 0,
+                                4 * int(np.prod([d for d in out_shape[1:] if d is not None])), 0,
+                                int(layer.count_params()), 0))
+    by_name = {info.name: info for info in infos}
+    for info in infos:
+        members = [by_name[name] for name in ancestors[info.name]]
+        info.extractor_flops = sum(m.flops for m in members)
+        info.extractor_activation_bytes = sum(
+            m.activation_bytes for m in members)
+        info.extractor_params = sum(m.params for m in members)
+    return Model_Index(fingerprint, infos)
+
+
+def index_paths(fingerprint, model_path=None):
+    """Lists the locations the index of a model is stored at, in order of preference.
+
+    Args:
+        fingerprint: the fingerprint of the model.
+        model_path: the path of the SavedModel directory.
+
+    Returns:
+        list of paths.
+    """
+    paths = []
+    if model_path is not None:
+        paths.append(os.path.normpath(model_path) + ".xai_index.json")
+    paths.append(util.cache_path("index", fingerprint + ".json"))
+    return paths
+
+
+def load_index(model, fingerprint, model_path=None):
+    """Loads the stored index of the model or builds and stores it if none matches the model.
+
+    Args:
+        model: the keras model.
+        fingerprint: the fingerprint of the model.
+        model_path: the path of the SavedModel directory.
+
+    Returns:
+        the model index.
+    """
+    paths = index_paths(fingerprint, model_path)
+    for path in paths:
+        index = Model_Index.load(path, fingerprint)
+        if index is not None:
+            return index
+    index = build_index(model, fingerprint)
+    for path in paths:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            index.save(path)
+            break
+        except OSError:
+            # Fall back to the cache directory if the model directory is read-only
+            continue
+    return index
@@ -0,0 +1,57 @@
+import threading
+from contextlib import contextmanager
+
+"""Cooperative cancellation and preemption of long running tasks.
+Workers are checked once per optimization step, so cancelling a task or
+preempting a background task takes at most one step.
+"""
+
+
+class Priority_Gate:
+    """Lets interactive requests preempt background tasks.
+    While an interactive request is active, background tasks pause at their next
+    checkpoint and resume where they stopped once the request is finished.
+    """
+
+    def __init__(self):
+        self.interactive_count = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def interactive(self):
+        """Context manager marking an interactive request that has priority over background tasks."""
+        with self.condition:
+            self.interactive_count += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.interactive_count -= 1
+                self.condition.notify_all()
+
+    def wait(self, worker, poll_interval=0.05):
+        """Blocks the calling background task while an interactive request is active.
+
+        Args:
+            worker: the worker of the background task. Waiting ends early when the task is canceled.
+            poll_interval: the time in seconds between two checks of the worker's state.
+        """
+        with self.condition:
+            while self.interactive_count > 0 and worker.is_running:
+                self.condition.wait(poll_interval)
+
+
+def checkpoint(worker):
+    """Checkpoint of a long running task. Pauses while the task is preempted.
+
+    Args:
+        worker: the worker object running the task (None for tasks that cannot be canceled).
+
+    Returns:
+        False if the task was canceled, True otherwise.
+    """
+    if worker is None:
+        return True
+    if worker.gate is not None:
+        worker.gate.wait(worker)
+    return worker.is_running
@@ -0,0 +1,92 @@
+import threading
+import tensorflow as tf
+
+import backend.util as util
+
+
+class Extractor_Registry:
+    """Model-scoped registry caching the feature extractors of a model and the functions traced for them.
+    A new registry is created whenever a model is imported, which invalidates all cached extractors and traces.
+    Forward-only passes use the optional inference backend for the layers it provides.
+    """
+
+    def __init__(self, model):
+        """
+        Args:
+            model: the model the extractors are created for.
+        """
+        self.model = model
+        self.extractors = dict()
+        self.functions = dict()
+        self.inference_backend = None
+        # Batch sizes that ran out of memory and measured memory per image for each layer
+        self.batch_limits = dict()
+        self.batch_memory = dict()
+        self.lock = threading.RLock()
+
+    def extractor(self, layer_name):
+        """Gets the feature extractor for the given layer, creating it on first use.
+
+        Args:
+            layer_name: the name of the layer whose activations shall be output.
+
+        Returns:
+            the feature extractor.
+        """
+        with self.lock:
+            if layer_name not in self.extractors:
+                self.extractors[layer_name] = util.prepare_feature_extractor(
+                    self.model, layer_name)
+            return self.extractors[layer_name]
+
+    def forward(self, layer_name):
+        """Gets the traced forward pass of the feature extractor for the given layer.
+
+        Args:
+            layer_name: the name of the layer whose activations shall be output.
+
+        Returns:
+            the compiled function calculating the activations of the layer.
+        """
+        if self.inference_backend is not None and layer_name in self.inference_backend.layer_names:
+            return self.inference_backend.forward(layer_name)
+        extractor = self.extractor(layer_name)
+        return self.function(("forward", layer_name), lambda: tf.function(extractor))
+
+    def multi_forward(self, layer_names):
+        """Gets the traced forward pass of a model that outputs the activations of all given layers at once.
+
+        Args:
+            layer_names: list of the names of the layers whose activations shall be output.
+
+        Returns:
+            the compiled function calculating the list of activations.
+        """
+        layer_names = tuple(layer_names)
+        if self.inference_backend is not None and set(layer_names) <= set(self.inference_backend.layer_names):
+            return self.inference_backend.multi_forward(layer_names)
+        return self.function(("multi_forward", layer_names), lambda: tf.function(
+            util.prepare_multi_extractor(self.model, layer_names)))
+
+    def function(self, key, build):
+        """Gets the function cached under the given key, building it on first use.
+
+        Args:
+            key: hashable key identifying the function.
+            build: function without arguments creating the function to be cached.
+
+        Returns:
+            the cached function.
+        """
+        with self.lock:
+            if key not in self.functions:
+                self.functions[key] = build()
+            return self.functions[key]
+
+    def clear(self):
+        """Removes all cached extractors and functions."""
+        with self.lock:
+            self.extractors.clear()
+            self.functions.clear()
+            self.batch_limits.clear()
+            self.batch_memory.clear()
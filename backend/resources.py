@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import multiprocessing
+import tensorflow as tf
+
+import backend.util as util
+
+"""Thread and core budget of the compute paths.
+TensorFlow, OpenCV and the BLAS library used by sklearn each start one thread per core by default.
+Running them next to each other and the GUI thread oversubscribes the machine, so their thread counts
+and the cores the process may run on are configured explicitly here.
+"""
+
+RESOURCES_FILE = "resources.json"
+
+
+class Compute_Resources:
+    """Thread counts per library, the cores the compute process is pinned to and the number of jobs run at the same time.
+    A value of 0 keeps the default of the library, cores set to None allows all cores.
+    """
+
+    def __init__(self, intra_op_threads=0, inter_op_threads=0, cv2_threads=0, blas_threads=0, cores=None, job_workers=1):
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.cv2_threads = cv2_threads
+        self.blas_threads = blas_threads
+        self.cores = cores
+        self.job_workers = job_workers
+
+    def __repr__(self):
+        return (f"intra_op={self.intra_op_threads}, inter_op={self.inter_op_threads}, cv2={self.cv2_threads}, "
+                f"blas={self.blas_threads}, cores={format_cores(self.cores) or 'all'}, jobs={self.job_workers}")
+
+    def to_dict(self):
+        """Converts the resources into a JSON serializable dictionary."""
+        return {"intra_op_threads": self.intra_op_threads, "inter_op_threads": self.inter_op_threads,
+                "cv2_threads": self.cv2_threads, "blas_threads": self.blas_threads, "cores": self.cores,
+                "job_workers": self.job_workers}
+
+    @classmethod
+    def from_dict(cls, values):
+        """Creates the resources from a dictionary created by to_dict."""
+        return cls(int(values.get("intra_op_threads", 0)), int(values.get("inter_op_threads", 0)),
+                   int(values.get("cv2_threads", 0)), int(values.get("blas_threads", 0)), values.get("cores"),
+                   int(values.get("job_workers", 1)))
+
+    def to_fields(self):
+        """Converts the resources into the fields of the settings export."""
+        return [str(self.intra_op_threads), str(self.inter_op_threads), str(self.cv2_threads),
+                str(self.blas_threads), format_cores(self.cores)]
+
+    @classmethod
+    def from_fields(cls, fields):
+        """Creates the resources from the fields of the settings export."""
+        return cls(int(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]), parse_cores(fields[4]))
+
+
+def format_cores(cores):
+    """Formats a core set as comma separated list, an empty string stands for all cores."""
+    if cores is None:
+        return ""
+    return ",".join(str(core) for core in sorted(cores))
+
+
+def parse_cores(value):
+    """Parses a comma separated core list with optional ranges, e.g. "0-3,8".
+
+    Returns:
+        the list of core ids or None for all cores.
+    """
+    value = value.strip()
+    if value == "":
+        return None
+    cores = set()
+    for part in value.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            cores.update(range(int(start), int(end) + 1))
+        else:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def core_budget(resources):
+    """Gets the number of cores available to the compute paths."""
+    if resources.cores is not None:
+        return len(resources.cores)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_cores():
+    """Get the ids of the cores of this machine."""
+    return set(range(os.cpu_count() or 1))
+
+
+def pin_process(cores, pid=0):
+    """Pins a process to the given cores. Only supported on Linux, other platforms ignore the core set.
+    Core ids that do not exist on this machine are dropped.
+
+    Args:
+        cores: list of core ids or None for all cores.
+        pid: the id of the process, 0 pins the calling process.
+
+    Returns:
+        True if the affinity was set.
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        return False
+    cores = available_cores() if cores is None else set(cores) & available_cores()
+    if len(cores) == 0:
+        return False
+    try:
+        os.sched_setaffinity(pid, cores)
+    except OSError:
+        return False
+    return True
+
+
+def apply_resources(resources, pin=True):
+    """Configures the thread pools of all libraries and the core affinity of the process.
+    TensorFlow only accepts thread counts before its runtime is initialized; later changes take effect after a restart.
+
+    Args:
+        resources: the Compute_Resources to apply.
+        pin: if set the process is pinned to the cores of the resources, otherwise the core set is left to the compute process.
+
+    Returns:
+        list of messages for the settings that could not be applied.
+    """
+    messages = []
+    try:
+        if resources.intra_op_threads > 0:
+            tf.config.threading.set_intra_op_parallelism_threads(
+                resources.intra_op_threads)
+        if resources.inter_op_threads > 0:
+            tf.config.threading.set_inter_op_parallelism_threads(
+                resources.inter_op_threads)
+    except RuntimeError:
+        messages.append(
+            "TensorFlow thread counts take effect after a restart")
+    if resources.cv2_threads > 0:
+        try:
+            import cv2
+            cv2.setNumThreads(resources.cv2_threads)
+        except ImportError:
+            messages.append("OpenCV is not installed")
+    if resources.blas_threads > 0:
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=resources.blas_threads)
+        except ImportError:
+            messages.append("threadpoolctl is not installed")
+    if pin and resources.cores is not None:
+        invalid = set(resources.cores) - available_cores()
+        if not hasattr(os, "sched_setaffinity"):
+            messages.append("Core pinning is not supported on " + sys.platform)
+        elif len(invalid) > 0:
+            messages.append(
+                f"The cores {format_cores(invalid)} do not exist on this machine and are ignored")
+        if hasattr(os, "sched_setaffinity") and not pin_process(resources.cores):
+            messages.append("The process could not be pinned to the cores " +
+                            format_cores(resources.cores))
+    return messages
+
+
+def resources_path():
+    """Get the path the resources of the last session are stored at."""
+    return util.cache_path(RESOURCES_FILE)
+
+
+def save_resources(resources):
+    """Stores the resources, so they are applied at the next start before TensorFlow is initialized."""
+    os.makedirs(os.path.dirname(resources_path()), exist_ok=True)
+    with open(resources_path(), "w") as f:
+        json.dump(resources.to_dict(), f)
+
+
+def load_resources():
+    """Loads the resources stored by save_resources.
+
+    Returns:
+        the stored Compute_Resources or the library defaults.
+    """
+    try:
+        with open(resources_path(), "r") as f:
+            return Compute_Resources.from_dict(json.load(f))
+    except (OSError, ValueError):
+        return Compute_Resources()
+
+
+def candidate_configurations(resources):
+    """Creates a few configurations within the core budget of the given resources.
+
+    Returns:
+        list of Compute_Resources.
+    """
+    n = core_budget(resources)
+    splits = [(n, 1), (max(1, n // 2), 2), (max(1, n - 1), 1), (max(1, n // 4), 4)]
+    configurations = []
+    for intra, inter in dict.fromkeys(splits):
+        configurations.append(Compute_Resources(
+            intra, inter, max(1, n // 2), max(1, n // 2), resources.cores))
+    return configurations
+
+
+def measure(model_path, values, layer_name, batch_size, repeats, queue):
+    """Measures the throughput of the forward pass and the gradient ascent step in a fresh process.
+
+    Args:
+        model_path: the path of the model.
+        values: the resources to measure as dictionary.
+        layer_name: the name of the layer used for the measurement.
+        batch_size: the number of images per forward pass.
+        repeats: the number of timed passes and steps.
+        queue: the queue the result is put into.
+    """
+    import numpy as np
+    import backend.feature_visualization as fv
+    from backend.settings import Settings
+
+    apply_resources(Compute_Resources.from_dict(values))
+    settings = Settings()
+    settings.init_model(util.load_model(model_path), model_path)
+    forward = settings.registry.forward(layer_name)
+    inputs = np.random.default_rng(0).uniform(-1, 1, (batch_size, settings.input_width,
+                                                      settings.input_height, 3)).astype(np.float32)
+    # The first pass includes the tracing and is not timed
+    forward(inputs)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        forward(inputs)
+    forward_rate = repeats * batch_size / (time.perf_counter() - start)
+
+    settings.iterations = 1
+    fe = settings.registry.extractor(layer_name)
+    fv.optimize(fe, settings, fv.filter_loss, 0)
+    settings.iterations = repeats
+    start = time.perf_counter()
+    fv.optimize(fe, settings, fv.filter_loss, 0)
+    step_rate = repeats / (time.perf_counter() - start)
+    queue.put((forward_rate, step_rate))
+
+
+def calibrate(settings, configurations=None, layer_name=None, batch_size=8, repeats=10, worker=None):
+    """Measures the throughput of each configuration on the loaded model.
+    Thread counts can not be changed inside a running TensorFlow process, therefore each configuration is measured in a new process.
+
+    Args:
+        settings: the current settings object with an imported model.
+        configurations: list of Compute_Resources to measure, defaults to candidate_configurations.
+        layer_name: the layer used for the measurement, defaults to the last convolution layer.
+        batch_size: the number of images per forward pass.
+        repeats: the number of timed passes and steps.
+        worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+
+    Returns:
+        list of (resources, forward images per second, gradient steps per second) tuples, fastest gradient steps first.
+    """
+    if configurations is None:
+        configurations = candidate_configurations(settings.resources)
+    if layer_name is None:
+        layer_name = settings.conv_layers[-1].name
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for i, resources in enumerate(configurations):
+        if worker is not None and not worker.is_running:
+            break
+        queue = context.Queue()
+        process = context.Process(target=measure, args=(
+            settings.model_path, resources.to_dict(), layer_name, batch_size, repeats, queue))
+        process.start()
+        process.join()
+        if process.exitcode == 0:
+            results.append((resources,) + queue.get())
+        if worker is not None:
+            worker.progress.emit(i + 1)
+    return sorted(results, key=lambda result: result[2], reverse=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    from backend.settings import Settings
+
+    parser = argparse.ArgumentParser(
+        description="Measures the throughput of thread and core configurations on a model.")
+    parser.add_argument("model", help="path to the Keras model")
+    parser.add_argument("--cores", default="",
+                        help="core budget, e.g. 0-7 (default: all cores)")
+    parser.add_argument("--layer", default=None,
+                        help="layer used for the measurement")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    settings = Settings()
+    settings.init_model(util.load_model(args.model), args.model)
+    settings.resources = Compute_Resources(cores=parse_cores(args.cores))
+    for resources, forward_rate, step_rate in calibrate(settings, layer_name=args.layer,
+                                                        batch_size=args.batch_size, repeats=args.repeats):
+        print(f"{resources}: {forward_rate:.1f} images/s, {step_rate:.2f} steps/s")
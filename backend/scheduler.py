@@ -0,0 +1,235 @@
+import heapq
+import itertools
+import threading
+from enum import Enum, IntEnum
+
+"""Runs long tasks as prioritized jobs on a configurable number of threads.
+Jobs can be passed to the back-end wherever a worker is expected, so the
+visualizer functions report progress and check for cancellation through them.
+"""
+
+
+class Priority(IntEnum):
+    """Priority of a job, jobs with a lower value are started first."""
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+class Job_State(str, Enum):
+    """The lifecycle states of a job."""
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    COMPLETED = "Completed"
+    CANCELED = "Canceled"
+    FAILED = "Failed"
+
+
+class Job_Signal:
+    """Minimal replacement for a Qt signal. Callbacks are called on the thread that emits."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def connect(self, callback):
+        """Adds a callback that is called with the emitted arguments."""
+        self.callbacks.append(callback)
+
+    def emit(self, *args):
+        """Calls all connected callbacks with the given arguments."""
+        for callback in list(self.callbacks):
+            callback(*args)
+
+
+class Job:
+    """A task run by the scheduler. Offers the attributes and signals of the GUI worker.
+
+    Args:
+        name: the name displayed for the job.
+        run: function called with the job, its return value is stored in result.
+        priority: the priority of the job.
+        total: the number of progress steps of the job, 0 if unknown.
+        gate: the priority gate pausing the job while interactive requests are processed.
+    """
+
+    def __init__(self, name, run, priority=Priority.NORMAL, total=0, gate=None):
+        self.id = None
+        self.name = name
+        self.run = run
+        self.priority = priority
+        self.total = total
+        self.gate = gate
+        self.state = Job_State.QUEUED
+        self.value = 0
+        self.result = None
+        self.error = None
+        self.is_running = False
+        self.completed = False
+        self.canceled = False
+        self.progress = Job_Signal()
+        self.tile = Job_Signal()
+        self.preview = Job_Signal()
+        self.finished = Job_Signal()
+
+    @property
+    def done(self):
+        """True once the job completed, was canceled or failed."""
+        return self.state in (Job_State.COMPLETED, Job_State.CANCELED, Job_State.FAILED)
+
+    def stop(self):
+        """Cancels the job. A running job stops at its next checkpoint."""
+        self.canceled = True
+        self.is_running = False
+
+
+class Job_Scheduler:
+    """Priority queue of jobs that are processed by up to max_workers threads.
+    Jobs of equal priority are started in the order they were submitted.
+
+    Args:
+        max_workers: the number of jobs that run at the same time.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max(1, max_workers)
+        self.queue = []
+        self.jobs = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.threads = []
+        self.closed = False
+        # Emitted with the job whenever its state or progress changed
+        self.changed = Job_Signal()
+
+    def submit(self, name, run, priority=Priority.NORMAL, total=0, gate=None):
+        """Queues a new job.
+
+        Args:
+            name: the name displayed for the job.
+            run: function called with the job as worker, its return value is stored in the result of the job.
+            priority: the priority of the job.
+            total: the number of progress steps of the job, 0 if unknown.
+            gate: the priority gate pausing the job while interactive requests are processed.
+
+        Returns:
+            the queued job.
+        """
+        job = Job(name, run, priority, total, gate)
+        job.progress.connect(lambda value: self.report_progress(job, value))
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("The scheduler was shut down")
+            job.id = next(self.counter)
+            self.jobs.append(job)
+            heapq.heappush(self.queue, (job.priority, job.id, job))
+            self.start_threads()
+            self.condition.notify()
+        self.changed.emit(job)
+        return job
+
+    def cancel(self, job):
+        """Cancels the given job. Queued jobs are never started, running jobs stop at their next checkpoint."""
+        with self.condition:
+            job.stop()
+            queued = job.state == Job_State.QUEUED
+            if queued:
+                self.queue = [entry for entry in self.queue if entry[2] is not job]
+                heapq.heapify(self.queue)
+                job.state = Job_State.CANCELED
+        if queued:
+            self.changed.emit(job)
+            job.finished.emit(job)
+
+    def cancel_all(self):
+        """Cancels all queued and running jobs."""
+        for job in self.active_jobs():
+            self.cancel(job)
+
+    def wait(self):
+        """Blocks until no job is running anymore. Queued jobs are not waited for."""
+        with self.condition:
+            while self.running_count() > 0:
+                self.condition.wait()
+
+    def active_jobs(self):
+        """Returns the jobs that are queued or running."""
+        with self.condition:
+            return [job for job in self.jobs if not job.done]
+
+    def clear_finished(self):
+        """Forgets the jobs that are done."""
+        with self.condition:
+            self.jobs = [job for job in self.jobs if not job.done]
+
+    def set_max_workers(self, max_workers):
+        """Changes the number of jobs that run at the same time.
+        Surplus threads exit after their current job.
+
+        Args:
+            max_workers: the new number of concurrent jobs.
+        """
+        with self.condition:
+            self.max_workers = max(1, max_workers)
+            self.start_threads()
+            self.condition.notify_all()
+
+    def shutdown(self, wait=True):
+        """Cancels all jobs and stops the threads.
+
+        Args:
+            wait: if set, blocks until the running jobs stopped.
+        """
+        self.cancel_all()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            threads = list(self.threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def start_threads(self):
+        """Starts worker threads for the queued jobs up to max_workers. Requires the condition to be held."""
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        while len(self.threads) < min(self.max_workers, len(self.queue) + self.running_count()):
+            thread = threading.Thread(target=self.work, daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def running_count(self):
+        """Returns the number of running jobs. Requires the condition to be held."""
+        return sum(1 for job in self.jobs if job.state == Job_State.RUNNING)
+
+    def work(self):
+        """Loop of a worker thread. Takes the job with the highest priority until the queue is empty."""
+        while True:
+            with self.condition:
+                if self.closed or len(self.queue) == 0 or self.running_count() >= self.max_workers:
+                    self.threads.remove(threading.current_thread())
+                    return
+                job = heapq.heappop(self.queue)[2]
+                job.state = Job_State.RUNNING
+                job.is_running = True
+            self.changed.emit(job)
+            self.execute(job)
+
+    def execute(self, job):
+        """Runs the given job and records its outcome."""
+        try:
+            job.result = job.run(job)
+            job.completed = job.is_running
+            state = Job_State.COMPLETED if job.completed else Job_State.CANCELED
+        except Exception as err:
+            job.error = repr(err)
+            state = Job_State.FAILED
+        with self.condition:
+            job.state = state
+            job.is_running = False
+            self.condition.notify_all()
+        self.changed.emit(job)
+        job.finished.emit(job)
+
+    def report_progress(self, job, value):
+        """Stores the progress of the job and notifies the listeners."""
+        job.value = value
+        self.changed.emit(job)
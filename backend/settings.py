@@ -1,5 +1,10 @@
 from tensorflow import keras
+import copy
+import json
 import backend.util as util
+from backend.registry import Extractor_Registry
+from backend.resources import Compute_Resources
+import backend.model_index as model_index
 from tensorflow.keras import activations
 
 
@@ -9,24 +14,52 @@ class Settings():
     def __init__(self):
         self.layer = None
         self.learning_rate = 75.0
+        self.lr_decay = 1.0
         self.iterations = 20
         self.blur = True
         self.decay = True
         self.rotate = True
+        self.jitter = 0
+        self.scale_jitter = False
         self.scale = 1
         self.blur_kernel_size = 2
         self.freq_penalization = True
         self.filter = 1
         self.groups = 6
+        self.top_k = 3
+        self.seed = 0
+        self.preview_interval = 5
+        self.activation_cache_budget = 512 * 2**20
+        self.activation_float16 = False
+        self.memory_budget = 2**30
+        self.max_batch_size = 64
+        # Forward-only computations use a TFLite interpreter instead of the Keras model
+        self.use_tflite = False
         self.dict_path = None
-
-    def init_model(self, model):
+        self.model_fingerprint = None
+        self.registry = None
+        self.model_path = None
+        self.input_path = None
+        self.model_index = None
+        self.layers_by_name = dict()
+        self.layer_profiles = dict()
+        self.resources = Compute_Resources()
+
+    def init_model(self, model, path=None):
         """Initializes the model settings after the model was imported.
+        Loads the layer metadata index stored next to the model or builds it if it does not match the model.
 
         Args:
             model: the imported model.
+            path: the path the model was imported from.
         """
         self.model = model
+        self.model_path = path
+        self.model_fingerprint = util.model_fingerprint(model)
+        self.model_index = model_index.load_index(
+            model, self.model_fingerprint, path)
+        # A new registry drops the extractors and traces of the previous model
+        self.registry = Extractor_Registry(model)
         self.input_width = model.inputs[0].shape[1]
         self.input_height = model.inputs[0].shape[2]
         self.conv_layers = []
@@ -45,6 +78,19 @@ class Settings():
                             layer.output.shape[3]), (int(layer.output.shape[1]), int(layer.output.shape[2]))))
                 except AttributeError:
                     continue
+        self.layers_by_name = dict()
+        for layer in self.conv_layers + self.grp_layers:
+            self.layers_by_name.setdefault(layer.name, layer)
+
+    def fingerprint(self):
+        """Calculates a hash of all settings that influence the result of a feature visualization.
+
+        Returns:
+            the hexadecimal digest of the settings.
+        """
+        return util.hash_values(self.input_width, self.input_height, self.learning_rate, self.lr_decay, self.iterations,
+                                self.scale, self.blur, self.blur_kernel_size, self.decay, self.rotate,
+                                self.jitter, self.scale_jitter, self.freq_penalization, self.seed)
 
     def print_layers(self):
         """Prints the information about the convolution layers."""
@@ -60,6 +106,7 @@ class Settings():
         self.input_img = keras.preprocessing.image.load_img(path, target_size=(
             self.input_width, self.input_height))
         self.input_data = util.prepare_input(self.input_img)
+        self.input_path = path
 
     def get_layer_by_name(self, name):
         """Finds the layer object specified by the given name.
@@ -70,12 +117,7 @@ class Settings():
         Returns:
             layer: conv_layer object of the specified layer.
         """
-        for layer in self.conv_layers:
-            if layer.name == name:
-                return layer
-        for layer in self.grp_layers:
-            if layer.name == name:
-                return layer
+        return self.layers_by_name.get(name)
 
     def set_dict_path(self, path):
         """Updates the path for the feature visualization dictionary.
@@ -101,6 +143,18 @@ class Settings():
         self.decay = bool(sett_str[5])
         self.rotate = bool(sett_str[6])
         self.freq_penalization = bool(sett_str[7])
+        # Settings exported by older versions do not contain the transform settings
+        if len(sett_str) > 9:
+            self.jitter = int(sett_str[8])
+            self.scale_jitter = sett_str[9] == "True"
+        if len(sett_str) > 10:
+            self.seed = int(sett_str[10])
+        if len(sett_str) > 11:
+            self.lr_decay = float(sett_str[11])
+        if len(sett_str) > 16:
+            self.resources = Compute_Resources.from_fields(sett_str[12:17])
+        if len(sett_str) > 17:
+            self.use_tflite = sett_str[17].strip() == "True"
 
     def export_settings(self, path):
         """Exports the settings.
@@ -116,9 +170,59 @@ class Settings():
         f.write(str(self.blur) + "|")
         f.write(str(self.decay) + "|")
         f.write(str(self.rotate) + "|")
-        f.write(str(self.freq_penalization))
+        f.write(str(self.freq_penalization) + "|")
+        f.write(str(self.jitter) + "|")
+        f.write(str(self.scale_jitter) + "|")
+        f.write(str(self.seed) + "|")
+        f.write(str(self.lr_decay) + "|")
+        f.write("|".join(self.resources.to_fields()) + "|")
+        f.write(str(self.use_tflite))
         f.close()
 
+    def snapshot(self):
+        """Copies the settings, so a job keeps the settings it was submitted with while the user changes them.
+
+        Returns:
+            the copied settings sharing the model and the registry.
+        """
+        settings = copy.copy(self)
+        settings.layer_profiles = copy.deepcopy(self.layer_profiles)
+        return settings
+
+    def settings_for_layer(self, name):
+        """Applies the tuned profile of the given layer to a copy of the settings.
+
+        Args:
+            name: the name of the layer.
+
+        Returns:
+            the settings to be used for the given layer.
+        """
+        if name not in self.layer_profiles:
+            return self
+        settings = copy.copy(self)
+        for key, value in self.layer_profiles[name].items():
+            setattr(settings, key, value)
+        return settings
+
+    def import_profiles(self, path):
+        """Imports per-layer settings profiles created by the auto-tuner.
+
+        Args:
+            path: the path to the profiles to be imported.
+        """
+        with open(path, "r") as f:
+            self.layer_profiles = json.load(f)
+
+    def export_profiles(self, path):
+        """Exports the per-layer settings profiles.
+
+        Args:
+            path: the path the profiles should be exported to.
+        """
+        with open(path, "w") as f:
+            json.dump(self.layer_profiles, f, indent=2)
+
 
 class Conv_Layer:
     """Data class representing a convolution layer with additional information to those provided by Keras layer type."""
@@ -0,0 +1,121 @@
+import copy
+import itertools
+import time
+
+import backend.feature_visualization as fv
+import backend.batching as batching
+import backend.util as util
+
+"""Hyper-parameter sweeps for the feature visualization settings.
+All learning rates of a configuration group are optimized as one batch (split if it exceeds the memory budget) and the
+images for the different iteration counts are taken as snapshots of the same run.
+"""
+
+REGULARIZERS = ["blur", "decay", "rotate", "freq_penalization"]
+
+
+class Sweep_Result:
+    """Data class containing the visualization generated for a single sweep configuration."""
+
+    def __init__(self, learning_rate, iterations, blur_kernel_size, regularizers, img, seconds):
+        self.learning_rate = learning_rate
+        self.iterations = iterations
+        self.blur_kernel_size = blur_kernel_size
+        self.regularizers = regularizers
+        self.img = img
+        self.seconds = seconds
+
+    @property
+    def label(self):
+        """Short description of the configuration and its wall-time cost."""
+        enabled = [name for name in REGULARIZERS if self.regularizers[name]]
+        kernel = self.blur_kernel_size if self.regularizers["blur"] else "-"
+        return f"lr={self.learning_rate:g} it={self.iterations} k={kernel} [{','.join(enabled)}] {self.seconds:.2f}s"
+
+    def __repr__(self):
+        return "(" + self.label + ")"
+
+
+def regularizer_options(settings, sweep_regularizers):
+    """Lists the regularizer combinations to be tested.
+
+    Args:
+        settings: the current settings object.
+        sweep_regularizers: if set every combination of the regularizers is tested, otherwise only the current one.
+
+    Returns:
+        list of dicts mapping the regularizer names to their state.
+    """
+    if not sweep_regularizers:
+        return [{name: getattr(settings, name) for name in REGULARIZERS}]
+    return [dict(zip(REGULARIZERS, states)) for states in itertools.product([True, False], repeat=len(REGULARIZERS))]
+
+
+def count_configurations(learning_rates, iterations, kernel_sizes, regularizers):
+    """Counts the distinct configurations of a sweep.
+
+    Args:
+        learning_rates: the learning rates to be tested.
+        iterations: the iteration counts to be tested.
+        kernel_sizes: the blur kernel sizes to be tested.
+        regularizers: the regularizer combinations to be tested.
+
+    Returns:
+        the number of configurations.
+    """
+    groups = sum(len(kernel_sizes) if regs["blur"] else 1 for regs in regularizers)
+    return groups * len(learning_rates) * len(iterations)
+
+
+def run_sweep(feature_extractor, settings, filter_index, learning_rates, iterations, kernel_sizes, regularizers, worker=None):
+    """Generates a visualization of the given filter for every combination of the given values.
+    Configurations that only differ in learning rate or iteration count share one batched run.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer.
+        settings: the current settings object.
+        filter_index: the index of the target filter.
+        learning_rates: the learning rates to be tested.
+        iterations: the iteration counts to be tested.
+        kernel_sizes: the blur kernel sizes to be tested.
+        regularizers: the regularizer combinations to be tested.
+        worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+
+    Returns:
+        results: list of Sweep_Result objects.
+    """
+    results = []
+    iterations = sorted(set(iterations))
+    for regs in regularizers:
+        for kernel_size in (kernel_sizes if regs["blur"] else kernel_sizes[:1]):
+            if worker is not None and not worker.is_running:
+                return []
+            group_settings = copy.copy(settings)
+            for name, state in regs.items():
+                setattr(group_settings, name, state)
+            group_settings.blur_kernel_size = kernel_size
+            group_settings.iterations = iterations[-1]
+
+            def run(run_settings, batch):
+                batch_results = []
+                start = time.perf_counter()
+
+                def snapshot(step, img):
+                    if step not in iterations:
+                        return
+                    # The batch is shared by all learning rates, so each configuration is charged its share of the wall time
+                    seconds = (time.perf_counter() - start) / len(batch)
+                    for b, learning_rate in enumerate(batch):
+                        batch_results.append(Sweep_Result(learning_rate, step, kernel_size, regs,
+                                                          util.deprocess_image(img[b].numpy()), seconds))
+                    if worker is not None:
+                        worker.progress.emit(len(results) + len(batch_results))
+
+                fv.optimize(feature_extractor, run_settings, fv.filter_loss, filter_index,
+                            batch_size=len(batch), learning_rate=batch, callback=snapshot, worker=worker)
+                return batch_results
+
+            # Results are only kept once their batch completed, a batch that ran out of memory is repeated
+            results.extend(batching.run_batched(
+                group_settings, settings.layer, learning_rates, run, worker))
+    return results
@@ -0,0 +1,223 @@
+import os
+import threading
+import numpy as np
+import tensorflow as tf
+
+import backend.util as util
+
+"""Optional TFLite inference backend for forward-only computations.
+The activations of the selected layers are computed by a multi-output TFLite interpreter,
+optionally with post-training int8 quantization calibrated on user images.
+Paths that need gradients always use the Keras model.
+"""
+
+# The number of inputs the outputs of the interpreter are matched on
+MATCH_INPUTS = 3
+# The minimum mean correlation of an output of the interpreter with the float activations of its layer
+MIN_MATCH_CORRELATION = 0.5
+
+
+class Tflite_Backend:
+    """Multi-output TFLite interpreter calculating the activations of the selected layers."""
+
+    def __init__(self, model, layer_names, calibration_data=None, quantize=False, num_threads=None):
+        """
+        Args:
+            model: the keras model.
+            layer_names: the names of the layers whose activations are calculated by the interpreter.
+            calibration_data: list of preprocessed inputs used to calibrate the int8 quantization and to match the outputs.
+            quantize: if set the model is quantized to int8 after training.
+            num_threads: the number of threads used by the interpreter (TFLite default if None is given).
+        """
+        self.layer_names = list(layer_names)
+        self.quantize = quantize
+        self.extractor = util.prepare_multi_extractor(model, self.layer_names)
+        if calibration_data is None or len(calibration_data) == 0:
+            # Without user images a single noise input is used to match the outputs
+            shape = [1] + list(model.inputs[0].shape[1:])
+            calibration_data = [np.random.default_rng(
+                0).uniform(-1, 1, shape).astype(np.float32)]
+        self.calibration_data = [np.asarray(x, np.float32)
+                                 for x in calibration_data]
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.extractor)
+        if quantize:
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = self.representative_dataset
+        self.interpreter = tf.lite.Interpreter(
+            model_content=converter.convert(), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        # The interpreter must not be invoked from multiple threads at once
+        self.lock = threading.Lock()
+        self.output_indices = self.match_outputs()
+
+    def representative_dataset(self):
+        """Generator yielding the calibration inputs for the int8 quantization."""
+        for x in self.calibration_data:
+            yield [x]
+
+    def reference(self, input_data):
+        """Calculates the activations of the selected layers with the float Keras model.
+
+        Args:
+            input_data: the preprocessed input of the model.
+
+        Returns:
+            list containing the activations of each selected layer.
+        """
+        outputs = self.extractor(input_data)
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+        return [acts.numpy() for acts in outputs]
+
+    def invoke(self, input_data):
+        """Runs the interpreter for the given input.
+
+        Args:
+            input_data: the preprocessed input of the model.
+        """
+        self.interpreter.set_tensor(
+            self.input_index, np.asarray(input_data, np.float32))
+        self.interpreter.invoke()
+
+    def match_inputs(self):
+        """Get the inputs the outputs are matched on, the calibration data is completed with noise inputs."""
+        inputs = list(self.calibration_data[:MATCH_INPUTS])
+        rng = np.random.default_rng(1)
+        while len(inputs) < MATCH_INPUTS:
+            inputs.append(rng.uniform(-1, 1, inputs[0].shape).astype(np.float32))
+        return inputs
+
+    def match_outputs(self):
+        """Maps the selected layers to the outputs of the interpreter.
+        The converter does not preserve the order of the outputs, so the outputs of the same shape
+        are scored by their mean correlation with the float activations over several inputs.
+        The pairs are assigned in order of descending score, so a single input where two layers
+        look alike can not swap them.
+
+        Returns:
+            list containing the output tensor index of each selected layer.
+
+        Raises:
+            ValueError: if no output correlates with the activations of a layer.
+        """
+        details = self.interpreter.get_output_details()
+        scores = np.zeros((len(self.layer_names), len(details)))
+        inputs = self.match_inputs()
+        for x in inputs:
+            expected = self.reference(x)
+            self.invoke(x)
+            for i, acts in enumerate(expected):
+                for j, detail in enumerate(details):
+                    if tuple(detail["shape"]) != acts.shape:
+                        scores[i, j] = -np.inf
+                        continue
+                    out = self.interpreter.get_tensor(detail["index"])
+                    score = np.corrcoef(out.ravel(), acts.ravel())[0, 1]
+                    scores[i, j] += -1.0 if np.isnan(score) else score
+        scores /= len(inputs)
+        indices = [None] * len(self.layer_names)
+        used = set()
+        for flat in np.argsort(scores, axis=None)[::-1]:
+            i, j = np.unravel_index(flat, scores.shape)
+            if indices[i] is not None or j in used or scores[i, j] < MIN_MATCH_CORRELATION:
+                continue
+            indices[i] = details[j]["index"]
+            used.add(j)
+        missing = [name for name, index in zip(self.layer_names, indices) if index is None]
+        if len(missing) > 0:
+            raise ValueError(
+                "The TFLite outputs do not match the layers " + ", ".join(missing))
+        return indices
+
+    def run(self, input_data):
+        """Calculates the activations of the selected layers.
+
+        Args:
+            input_data: the preprocessed input of the model.
+
+        Returns:
+            list containing the activations of each selected layer.
+        """
+        with self.lock:
+            self.invoke(input_data)
+            return [self.interpreter.get_tensor(i) for i in self.output_indices]
+
+    def forward(self, layer_name):
+        """Creates a forward function for a single layer with the same interface as the registry.
+
+        Args:
+            layer_name: the name of the layer.
+
+        Returns:
+            function calculating the activations of the layer.
+        """
+        i = self.layer_names.index(layer_name)
+        return lambda input_data: tf.constant(self.run(input_data)[i])
+
+    def multi_forward(self, layer_names):
+        """Creates a forward function for multiple layers with the same interface as the registry.
+
+        Args:
+            layer_names: the names of the layers.
+
+        Returns:
+            function calculating the list of activations of the layers.
+        """
+        positions = [self.layer_names.index(name) for name in layer_names]
+
+        def forward(input_data):
+            outputs = self.run(input_data)
+            return [tf.constant(outputs[i]) for i in positions]
+        return forward
+
+    def accuracy_report(self, inputs=None):
+        """Compares the activations of the interpreter with those of the float model.
+
+        Args:
+            inputs: list of preprocessed inputs (calibration data if None is given).
+
+        Returns:
+            report: dict mapping each layer name to its maximum absolute error, relative error and cosine similarity.
+        """
+        if inputs is None:
+            inputs = self.calibration_data
+        report = {name: {"max_abs_error": 0.0, "relative_error": 0.0, "cosine_similarity": 1.0}
+                  for name in self.layer_names}
+        for x in inputs:
+            for name, actual, expected in zip(self.layer_names, self.run(x), self.reference(x)):
+                actual = actual.ravel().astype(np.float64)
+                expected = expected.ravel().astype(np.float64)
+                diff = actual - expected
+                norm = np.linalg.norm(expected)
+                cosine = np.dot(actual, expected) / \
+                    (np.linalg.norm(actual) * norm + 1e-12)
+                entry = report[name]
+                entry["max_abs_error"] = max(
+                    entry["max_abs_error"], float(np.abs(diff).max()))
+                entry["relative_error"] = max(
+                    entry["relative_error"], float(np.linalg.norm(diff) / (norm + 1e-12)))
+                entry["cosine_similarity"] = min(
+                    entry["cosine_similarity"], float(cosine))
+        return report
+
+
+def load_calibration_data(paths, settings):
+    """Imports and preprocesses the images used to calibrate the quantization.
+
+    Args:
+        paths: list of image paths or a directory containing the images.
+        settings: the current settings object.
+
+    Returns:
+        list of preprocessed inputs.
+    """
+    if isinstance(paths, str) and os.path.isdir(paths):
+        paths = [os.path.join(paths, name) for name in sorted(os.listdir(paths))
+                 if name.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))]
+    data = []
+    for path in paths:
+        img = tf.keras.preprocessing.image.load_img(
+            path, target_size=(settings.input_width, settings.input_height))
+        data.append(util.prepare_input(img).astype(np.float32))
+    return data
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class Top_K_Index:
+    """Index of the k most activated filters at each spatial position of a layer.
+    Built once for the activations of an input with a single partial sort over the whole tensor,
+    afterwards the top filters of a position are a lookup.
+    """
+
+    def __init__(self, activations, k):
+        """
+        Args:
+            activations: the activations of the layer with the shape (rows, cols, filters).
+            k: the number of filters kept for each position.
+        """
+        activations = np.asarray(activations)
+        self.k = min(k, activations.shape[-1])
+        # Partition the negated activations, so the k largest end up in front
+        indices = np.argpartition(-activations, self.k - 1,
+                                  axis=-1)[..., :self.k]
+        values = np.take_along_axis(activations, indices, axis=-1)
+        # Only the k selected filters are sorted
+        order = np.argsort(-values, axis=-1, kind="stable")
+        self.indices = np.take_along_axis(indices, order, axis=-1)
+        self.values = np.take_along_axis(values, order, axis=-1)
+
+    def lookup(self, row, col, count=None):
+        """Gets the top activated filters at the given position.
+
+        Args:
+            row: the row index of the position.
+            col: the column index of the position.
+            count: the number of filters to be returned (k if None is given).
+
+        Returns:
+            indices: the indices of the filters, most activated first.
+            values: the activations of the filters.
+        """
+        if count is None:
+            count = self.k
+        return self.indices[row, col, :count], self.values[row, col, :count]
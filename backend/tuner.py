@@ -0,0 +1,140 @@
+import copy
+import itertools
+import numpy as np
+import tensorflow as tf
+
+import backend.feature_visualization as fv
+
+"""Auto-tuner searching the cheapest visualization settings per layer.
+For a few sampled filters of each layer all candidate learning rate schedules are optimized
+as one batch. The maximum activation reached by any candidate serves as an estimate of the
+maximum achievable activation, and each layer gets the schedule that covers the target
+fraction of the gain from the initial to the maximum activation with the fewest iterations.
+Layers for which no schedule reaches the target keep the current settings.
+"""
+
+
+def sample_filters(filter_count, n, seed):
+    """Selects the filters used to tune a layer.
+
+    Args:
+        filter_count: the number of filters in the layer.
+        n: the number of filters to be selected.
+        seed: the seed for the random selection.
+
+    Returns:
+        sorted list of filter indices.
+    """
+    rng = np.random.default_rng(seed)
+    return sorted(rng.choice(filter_count, min(n, filter_count), replace=False).tolist())
+
+
+def activation_trace(feature_extractor, settings, filter_index, candidates, max_iterations, eval_every, worker=None):
+    """Optimizes the given filter with all candidate schedules at once and records the reached activations.
+
+    Args:
+        feature_extractor: modified model to retrieve activations of the selected layer.
+        settings: the current settings object.
+        filter_index: the index of the target filter.
+        candidates: list of (learning rate, decay) tuples.
+        max_iterations: the maximum number of iterations.
+        eval_every: the number of iterations between two evaluations.
+        worker: the worker object that runs the task on a second thread. Used to cancel the run.
+
+    Returns:
+        steps: the iterations at which the activations were evaluated, starting with 0 for the initialized image.
+        trace: array of shape (len(steps), len(candidates)) containing the mean filter activation.
+    """
+    run_settings = copy.copy(settings)
+    run_settings.iterations = max_iterations
+    steps = []
+    trace = []
+
+    def evaluate(step, img):
+        if step % eval_every != 0 and step != max_iterations:
+            return
+        activation = feature_extractor(img)[:, 2:-2, 2:-2, filter_index]
+        steps.append(step)
+        trace.append(tf.reduce_mean(activation, axis=[1, 2]).numpy())
+
+    # The initialization is deterministic, so this is the image every candidate starts from
+    evaluate(0, fv.initialize_image(run_settings, len(candidates)))
+    fv.optimize(feature_extractor, run_settings, fv.filter_loss, filter_index, batch_size=len(candidates),
+                learning_rate=[c[0] for c in candidates], learning_rate_decay=[c[1] for c in candidates], callback=evaluate, worker=worker)
+    return steps, np.array(trace)
+
+
+def tune_layer(settings, layer, filters_per_layer=3, target=0.9, max_iterations=100, eval_every=5,
+               learning_rates=None, decays=(1.0, 0.98, 0.95), worker=None):
+    """Searches the cheapest schedule reaching the target fraction of the maximum activation gain for all sampled filters of a layer.
+
+    Args:
+        settings: the current settings object.
+        layer: the Conv_Layer object of the layer to be tuned.
+        filters_per_layer: the number of filters sampled from the layer.
+        target: the fraction of the gain from the initial to the maximum activation that has to be reached.
+        max_iterations: the iteration budget of the reference runs.
+        eval_every: the number of iterations between two evaluations.
+        learning_rates: the candidate learning rates (multiples of the current learning rate if None is given).
+        decays: the candidate learning rate decay factors.
+        worker: the worker object that runs the task on a second thread. Used to cancel the runs.
+
+    Returns:
+        profile: dict containing the iterations, learning rate and decay for the layer,
+            None if no schedule reached the target within max_iterations.
+    """
+    if learning_rates is None:
+        learning_rates = [settings.learning_rate *
+                          f for f in (0.5, 1.0, 2.0)]
+    candidates = list(itertools.product(learning_rates, decays))
+    feature_extractor = settings.registry.extractor(layer.name)
+    cost = np.zeros(len(candidates))
+    for filter_index in sample_filters(layer.filter_count, filters_per_layer, settings.seed):
+        steps, trace = activation_trace(
+            feature_extractor, settings, filter_index, candidates, max_iterations, eval_every, worker)
+        if len(steps) < 2:
+            return None
+        # Activations can be negative, so the target is a fraction of the gain over the activation of the initialized image
+        start = trace[0].mean()
+        if trace.max() <= start:
+            return None
+        threshold = start + target * (trace.max() - start)
+        for c in range(len(candidates)):
+            reached = np.nonzero(trace[:, c] >= threshold)[0]
+            # A schedule has to reach the target for every sampled filter
+            needed = steps[reached[0]] if len(reached) > 0 else np.inf
+            cost[c] = max(cost[c], needed)
+    best = int(np.argmin(cost))
+    if np.isinf(cost[best]):
+        return None
+    return {
+        "iterations": int(cost[best]),
+        "learning_rate": float(candidates[best][0]),
+        "lr_decay": float(candidates[best][1])
+    }
+
+
+def tune_model(settings, worker, **kwargs):
+    """Creates a settings profile for each convolution layer of the model.
+
+    Args:
+        settings: the current settings object.
+        worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+        kwargs: additional arguments passed to tune_layer.
+
+    Returns:
+        profiles: dict mapping layer names to their settings profile.
+        untuned: the names of the layers no schedule reached the target for.
+    """
+    profiles = dict()
+    untuned = []
+    for i, layer in enumerate(settings.conv_layers):
+        if not worker.is_running:
+            return dict(), []
+        profile = tune_layer(settings, layer, worker=worker, **kwargs)
+        if profile is None:
+            untuned.append(layer.name)
+        else:
+            profiles[layer.name] = profile
+        worker.progress.emit(i + 1)
+    return profiles, untuned
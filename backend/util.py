@@ -4,21 +4,66 @@ from tensorflow.keras.applications.resnet50 import preprocess_input
 from tensorflow import keras
 import tensorflow as tf
 import os
-from enum import Enum
-import sys
+import hashlib
+from backend.common import Target, Screen, resource_path
+from backend.model_cache import Model_Cache
 
 
-def load_model(path):
+def load_model(path, use_cache=True):
     """Wrapper function for loading the keras model.
+    SavedModel directories are reopened from the local model cache after the first load.
+
       Args:
         path: the path to the keras model.
+        use_cache: whether to use the local model cache.
 
     Returns:
         the imported keras model.
     """
+    if use_cache:
+        return Model_Cache(cache_path("models")).load_model(path)
     return keras.models.load_model(path, compile=False)
 
 
+def model_fingerprint(model):
+    """Calculates a hash over the architecture and the weights of the given model.
+
+    Args:
+        model: the keras model.
+
+    Returns:
+        the hexadecimal digest identifying the model.
+    """
+    sha = hashlib.sha1(model.to_json().encode("utf-8"))
+    for weights in model.get_weights():
+        sha.update(np.ascontiguousarray(weights).tobytes())
+    return sha.hexdigest()
+
+
+def hash_values(*values):
+    """Calculates a hash over the string representations of the given values.
+
+    Args:
+        values: the values to be hashed.
+
+    Returns:
+        the hexadecimal digest of the values.
+    """
+    return hashlib.sha1("|".join(str(v) for v in values).encode("utf-8")).hexdigest()
+
+
+def cache_path(*parts):
+    """Get the absolute path of a directory in the user's cache folder of the application.
+
+    Args:
+        parts: path components relative to the cache folder.
+
+    Returns:
+        the absolute path.
+    """
+    return os.path.join(os.path.expanduser("~"), ".xai_viz", *parts)
+
+
 def deprocess_image(img):
     """Converts the given image numpy array with values between 0 and 1 to an rgb numpy array.
     Source: https://keras.io/examples/vision/visualizing_what_convnets_learn/.
@@ -103,6 +148,11 @@ def export_features(images, margin, n, name, settings):
     keras.preprocessing.image.save_img(path, stitched_filters)
 
 
+def grid_tile_shape(settings):
+    """Get the shape (rows, columns) of the slots combine_activation_grid places each image in."""
+    return (settings.input_width - 25 * 2, settings.input_height - 25 * 2)
+
+
 def combine_activation_grid(activation_grid, settings, worker, margin=0):
     """Combines the given array of images to a single image.
 
@@ -116,11 +166,10 @@ def combine_activation_grid(activation_grid, settings, worker, margin=0):
         stitched: the combined image.
     """
     n = len(activation_grid)
-    cropped_width = settings.input_width - 25 * 2
-    cropped_height = settings.input_height - 25 * 2
+    cropped_width, cropped_height = grid_tile_shape(settings)
     width = n * cropped_width + (n - 1) * margin
     height = n * cropped_height + (n - 1) * margin
-    stitched_filters = np.zeros((width, height, 3))
+    stitched_filters = np.zeros((width, height, 3), np.uint8)
     # Fill the picture with our saved filters
     for i in range(n):
         for j in range(n):
@@ -148,7 +197,7 @@ def combine_group_img(settings, grid, vis):
         stitched: the combined image.
     """
     stitched = np.zeros(
-        (2*settings.input_width, 2*settings.input_height + vis.shape[1], 3))
+        (2*settings.input_width, 2*settings.input_height + vis.shape[1], 3), np.uint8)
     stitched[0:, 0:2*settings.input_height, :, ] = grid
     stitched[0:vis.shape[0], 2*settings.input_height: 2 *
              settings.input_height + vis.shape[1], :, ] = vis
@@ -172,6 +221,20 @@ def prepare_feature_extractor(model, layer_name):
     return keras.Model(inputs=inputs, outputs=outputs)
 
 
+def prepare_multi_extractor(model, layer_names):
+    """Creates a modified model with an output of the activations for each of the given layers.
+
+    Args:
+        model: the original model.
+        layer_names: the names of the layers whose activations shall be output.
+
+    Returns:
+        the modified model.
+    """
+    outputs = [model.get_layer(name=name).output for name in layer_names]
+    return keras.Model(inputs=model.inputs, outputs=outputs)
+
+
 def get_layer_model(layer, settings):
     """Creates a modified model with an additional output of the activations for the given layer.
 
@@ -188,19 +251,18 @@ def get_layer_model(layer, settings):
     return model
 
 
-def get_activations(model, layer, input_data):
+def get_activations(registry, layer, input_data):
     """Calculates the activations for the given input at the given layer.
 
     Args:
-        model: the keras model.
+        registry: the extractor registry of the keras model.
         layer: the model the activations should be calculated for.
         input_data: the input for the model
 
     Returns:
         the activations of the given layer.
     """
-    model = prepare_feature_extractor(model, layer)
-    acts = model(input_data)
+    acts = registry.forward(layer)(input_data)
     return tf.squeeze(acts).numpy()
 
 
@@ -248,29 +310,3 @@ def save_img(img, path):
     img = deprocess_image(img[0].numpy())
     img = keras.preprocessing.image.array_to_img(img)
     img.save(path)
-
-
-def resource_path(relative_path):
-    """Get absolute path to resource, works for dev and for PyInstaller"""
-    try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-
-    return os.path.join(base_path, relative_path)
-
-
-class Target(str, Enum):
-    """Enum for the differend loss targets for the feature visualization."""
-    FILTER = "FILTER"
-    NEURON = "NEURON"
-    DIRECTION = "DIRECTION"
-
-class Screen(str, Enum):
-    """Enum for the differend screen types."""
-    MAIN = "main"
-    SAMPLE = "sample"
-    FILTER_ACTS = "filter_acts"
-    LAYER_REP = "layer_rep"
-    GROUPED = "grouped"
\ No newline at end of file
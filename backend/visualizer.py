@@ -1,13 +1,27 @@
 import numpy as np
 
 from backend.dictionary import Dictionary
+import backend.dictionary as dictionary
+from backend.artifacts import Artifact_Store
+from backend.top_k import Top_K_Index
+from backend.cache import Result_Cache
+from backend.activation_cache import Activation_Cache
+from backend.preemption import Priority_Gate
+from backend.scheduler import Job_Scheduler
+import backend.compute_server as compute_server
+from backend.compute_server import Compute_Server
 import backend.activation_grid as ag
 import backend.feature_visualization as fv
 from backend.settings import Settings
 import backend.grouper as grouper
+import backend.sweep as sweep
+import backend.tuner as tuner
+import backend.tflite_backend as tflite_backend
+import backend.resources as resources
 import backend.util as util
 from backend.util import Target
 import backend.grad_cam as grad_cam
+import backend.warmup as warmup
 
 
 class Visualizer:
@@ -16,6 +30,20 @@ class Visualizer:
         self.settings = Settings()
         self.dictionary = Dictionary(Target.FILTER)
         self.activations = None
+        self.top_k = None
+        self.cache = Result_Cache()
+        self.gate = Priority_Gate()
+        self.scheduler = Job_Scheduler()
+        # Run the heavy generation tasks in separate processes if enabled, one per channel
+        self.compute_servers = None
+        self.activation_cache = Activation_Cache()
+        self.store = Artifact_Store()
+        # Keys of the stored artifacts currently in use, by kind
+        self.held = dict()
+        # The resources of the last session are applied before TensorFlow initializes its thread pools
+        self.settings.resources = resources.load_resources()
+        resources.apply_resources(self.settings.resources)
+        self.scheduler.set_max_workers(self.settings.resources.job_workers)
 
     def update_input(self, path):
         """Updates the model's input image.
@@ -25,29 +53,131 @@ class Visualizer:
         """
         self.settings.update_input(path)
 
-    def visualize_filter(self):
+    def visualize_filter(self, worker=None, preview=None):
         """Generates a feature visualization for a specified.
+        Results are looked up in and stored to the visualization cache.
+
+        Args:
+            worker: the worker object that runs the task on a second thread. A stopped run returns its current image.
+            preview: function receiving a deprocessed intermediate image every settings.preview_interval steps.
         
         Returns:
             the generated feature visualizations.
         """
-        feature_extractor = util.prepare_feature_extractor(
-            self.settings.model, self.settings.layer)
-        return fv.visualize_filter(feature_extractor, self.settings, self.settings.filter)
+        key = self.cache_key(Target.FILTER, self.settings.filter)
+        img = self.cache.get(key)
+        if img is None:
+            feature_extractor = self.settings.registry.extractor(
+                self.settings.layer)
+            img = fv.visualize_filter(
+                feature_extractor, self.settings, self.settings.filter, worker, self.preview_callback(preview))
+            self.store_visualization(key, img, worker)
+        return img
 
-    def visualize_neuron(self, neuron):
+    def visualize_neuron(self, neuron, worker=None, preview=None):
         """Generates a feature visualization for a specified.
         
         Args:
             neuron: the index of the neuron to be visualized.
+            worker: the worker object that runs the task on a second thread. A stopped run returns its current image.
+            preview: function receiving a deprocessed intermediate image every settings.preview_interval steps.
 
         Returns:
             the generated feature visualizations.
         """
-        feature_extractor = util.prepare_feature_extractor(
-            self.settings.model, self.settings.layer)
-        neuron_index = util.convert_neuron_index(self.settings, neuron)
-        return fv.visualize_neuron(feature_extractor, self.settings.filter, neuron_index, self.settings)
+        key = self.cache_key(Target.NEURON, self.settings.filter, neuron)
+        img = self.cache.get(key)
+        if img is None:
+            feature_extractor = self.settings.registry.extractor(
+                self.settings.layer)
+            neuron_index = util.convert_neuron_index(self.settings, neuron)
+            img = fv.visualize_neuron(
+                feature_extractor, self.settings.filter, neuron_index, self.settings, worker, self.preview_callback(preview))
+            self.store_visualization(key, img, worker)
+        return img
+
+    def preview_callback(self, preview):
+        """Wraps the given preview function into a step callback for the optimization.
+
+        Args:
+            preview: function receiving a deprocessed intermediate image.
+
+        Returns:
+            the step callback or None if no preview function is given.
+        """
+        if preview is None:
+            return None
+
+        def callback(step, img):
+            if step % self.settings.preview_interval == 0 and step < self.settings.iterations:
+                preview(util.deprocess_image(img[0].numpy()))
+        return callback
+
+    def store_visualization(self, key, img, worker):
+        """Stores the given visualization in the cache unless its run was stopped early.
+
+        Args:
+            key: the cache key.
+            img: the generated visualization.
+            worker: the worker object that ran the task.
+        """
+        if worker is None or worker.is_running:
+            self.cache.put(key, img)
+
+    def sweep_filter(self, learning_rates, iterations, kernel_sizes, sweep_regularizers, worker):
+        """Generates visualizations of the selected filter for every combination of the given settings.
+
+        Args:
+            learning_rates: the learning rates to be tested.
+            iterations: the iteration counts to be tested.
+            kernel_sizes: the blur kernel sizes to be tested.
+            sweep_regularizers: if set every combination of the regularizer toggles is tested.
+            worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+
+        Returns:
+            list containing a sweep result for each configuration.
+        """
+        feature_extractor = self.settings.registry.extractor(
+            self.settings.layer)
+        regularizers = sweep.regularizer_options(
+            self.settings, sweep_regularizers)
+        return sweep.run_sweep(feature_extractor, self.settings, self.settings.filter, learning_rates,
+                               iterations, kernel_sizes, regularizers, worker)
+
+    def tune_settings(self, worker):
+        """Searches the cheapest settings reaching the quality target for each convolution layer.
+        The resulting profiles are used for the following dictionary generations.
+
+        Args:
+            worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+
+        Returns:
+            the names of the layers no schedule reached the quality target for, these keep the current settings.
+        """
+        profiles, untuned = tuner.tune_model(self.settings, worker)
+        if worker.is_running:
+            self.settings.layer_profiles = profiles
+        return untuned
+
+    def export_profiles(self, path):
+        """Exports the tuned per-layer settings profiles to the given path.
+
+        Args:
+            path: the path to export the profiles to.
+        """
+        self.settings.export_profiles(path)
+
+    def cache_key(self, target, *index):
+        """Creates the visualization cache key for the selected layer and the given target.
+
+        Args:
+            target: the loss target of the visualization.
+            index: the indices identifying the filter (and neuron).
+
+        Returns:
+            the cache key.
+        """
+        return self.cache.key(self.settings.model_fingerprint, self.settings.layer, target, *index, self.settings.fingerprint())
 
     def generate_dictionary(self, layer, worker):
         """Generates a dictionary containing feature visualizations for the given layer.
@@ -56,16 +186,204 @@ class Visualizer:
             layer: the current layer the generate visualizations for.
             worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread. 
         """
-        self.dictionary.generate_dictionary(self.settings, layer, worker)
+        self.dictionary.generate_dictionary(
+            self.settings, layer, worker, self.store)
+
+    def build_dictionary(self, path, worker, settings=None):
+        """Generates the dictionaries of all convolution layers and exports them to the given directory.
+        The layers are generated into a separate dictionary, so the dictionary used for exploring stays untouched.
+        All layers are generated with a snapshot of the settings, so changes made while the build runs
+        never mix into it and every layer matches the settings fingerprint recorded for it.
+
+        Args:
+            path: the directory the dictionary is exported to.
+            worker: the worker object or job running the task. Used to emit the number of finished layers and to cancel the process.
+            settings: the settings snapshot taken when the build was requested, a snapshot of the current settings if None is given.
+
+        Returns:
+            True if the dictionary was completed.
+        """
+        if settings is None:
+            settings = self.settings.snapshot()
+        build = Dictionary(Target.FILTER)
+        for i, layer in enumerate(settings.conv_layers):
+            if not worker.is_running:
+                return False
+            build.generate_dictionary(
+                settings, layer, worker, self.store, path)
+            worker.progress.emit(i + 1)
+        return worker.is_running
+
+    def enable_compute_server(self):
+        """Runs the generation tasks started through remote in a separate compute process."""
+        if self.compute_servers is None:
+            self.compute_servers = {channel: Compute_Server()
+                                    for channel in compute_server.CHANNELS}
+            # The compute processes pin themselves to the core set, the GUI process may use all cores
+            resources.pin_process(None)
+
+    def disable_compute_server(self):
+        """Stops the compute process, the generation tasks run in this process again."""
+        if self.compute_servers is not None:
+            for server in self.compute_servers.values():
+                server.stop()
+            self.compute_servers = None
+            resources.apply_resources(self.settings.resources)
+
+    def remote(self, name, *args, worker=None, channel=compute_server.INTERACTIVE, settings=None):
+        """Calls the given method in the compute process if it is enabled, otherwise in this process.
+
+        Args:
+            name: the name of the method, one of compute_server.REMOTE_METHODS.
+            args: the arguments of the method.
+            worker: the worker object or job running the task.
+            channel: the compute process used, background jobs never block interactive tasks.
+            settings: settings snapshot the method runs with instead of the current settings. Passed to the
+                method in this process and copied to the compute process otherwise.
+
+        Returns:
+            the result of the method, None if the worker was stopped while waiting for the compute process.
+
+        Raises:
+            Compute_Server_Error: if the compute process failed or exited.
+        """
+        if self.compute_servers is None:
+            kwargs = dict()
+            if worker is not None:
+                kwargs["worker"] = worker
+            if settings is not None:
+                kwargs["settings"] = settings
+            return getattr(self, name)(*args, **kwargs)
+        if settings is None:
+            settings = self.settings
+        return self.compute_servers[channel].call(name, *args, worker=worker, settings=settings)
+
+    def check_dictionary_path(self, path):
+        """Checks that the given directory does not contain the dictionary of a different model.
+
+        Args:
+            path: the directory the dictionary will be exported to.
+
+        Raises:
+            ValueError: if the directory contains a dictionary generated for a different model.
+        """
+        dictionary.check_directory(path, self.settings.model_fingerprint)
+
+    def hold(self, kind, key):
+        """Marks the given stored artifact as in use and releases the artifact of the same kind used before.
+
+        Args:
+            kind: the kind of the artifact.
+            key: the key of the artifact.
+        """
+        previous = self.held.get(kind)
+        if previous == key:
+            return
+        if previous is not None:
+            self.store.release(previous)
+        self.store.acquire(key)
+        self.held[kind] = key
+
+    def backend_fingerprint(self):
+        """Identifies the back-end computing forward passes, quantized interpreters produce different activations."""
+        backend = self.settings.registry.inference_backend
+        if backend is None:
+            return "keras"
+        return "tflite-int8" if backend.quantize else "tflite"
+
+    def warm_up(self, worker):
+        """Traces the commonly used extractors and gradient functions of the imported model on a dummy input.
+
+        Args:
+            worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+        """
+        warmup.warm_up(self.settings, worker)
+
+    def warm_up_count(self):
+        """Returns the number of warm-up tasks for the imported model."""
+        return len(warmup.warmup_tasks(self.settings))
 
     def reset_dictionary(self):
         """Clears the feature visualization dictionary."""
         self.dictionary = Dictionary(Target.FILTER)
 
     def update_activations(self):
-        """Calculates the activations of the currently selected layer."""
-        self.activations = util.get_activations(
-            self.settings.model, self.settings.layer, self.settings.input_data)
+        """Gets the activations of the currently selected layer from the activation cache.
+        On a miss, activations exported to the artifact store are reused before the activations
+        of all layers are calculated together.
+        """
+        self.top_k = None
+        settings = self.settings
+        input_key = self.activation_cache.input_key(settings, settings.input_data)
+        self.activations = self.activation_cache.lookup(input_key, settings.layer)
+        if self.activations is not None:
+            return
+        artifact = self.store.get("activations", settings.model_fingerprint,
+                                  self.backend_fingerprint(), settings.layer, input_key)
+        if artifact is not None:
+            self.activation_cache.insert(
+                settings, input_key, settings.layer, artifact[1]["activations"])
+            self.activations = self.activation_cache.lookup(input_key, settings.layer)
+            return
+        self.activations = self.activation_cache.get(
+            settings, settings.layer, settings.input_data)
+
+    def export_activations(self):
+        """Persists the activations of the selected layer in the artifact store, so they are reused in later sessions."""
+        if self.activations is None:
+            return
+        input_key = self.activation_cache.input_key(
+            self.settings, self.settings.input_data)
+        key = self.store.put({"activations": np.asarray(self.activations)}, "activations",
+                             self.settings.model_fingerprint, self.backend_fingerprint(), self.settings.layer, input_key)
+        self.hold("activations", key)
+
+    def enable_inference_backend(self, calibration_paths=None, quantize=False, num_threads=None):
+        """Converts the model into a TFLite interpreter that is used for all forward-only computations.
+
+        Args:
+            calibration_paths: list of image paths or a directory with images used to calibrate the quantization.
+            quantize: if set the model is quantized to int8.
+            num_threads: the number of threads used by the interpreter, defaults to the intra-op threads of the compute resources.
+
+        Returns:
+            report comparing the activations of the interpreter with those of the float model for each layer.
+        """
+        if num_threads is None and self.settings.resources.intra_op_threads > 0:
+            num_threads = self.settings.resources.intra_op_threads
+        calibration_data = None
+        if calibration_paths is not None:
+            calibration_data = tflite_backend.load_calibration_data(
+                calibration_paths, self.settings)
+        names = list(dict.fromkeys(
+            [layer.name for layer in self.settings.conv_layers + self.settings.grp_layers]))
+        backend = tflite_backend.Tflite_Backend(
+            self.settings.model, names, calibration_data, quantize, num_threads)
+        self.settings.registry.inference_backend = backend
+        self.settings.use_tflite = True
+        self.activation_cache.clear()
+        return backend.accuracy_report()
+
+    def disable_inference_backend(self):
+        """Switches forward-only computations back to the Keras model."""
+        self.settings.registry.inference_backend = None
+        self.settings.use_tflite = False
+        self.activation_cache.clear()
+
+    def apply_inference_backend(self):
+        """Enables or disables the TFLite interpreter as selected by use_tflite in the settings.
+
+        Returns:
+            the accuracy report if the interpreter was enabled, None otherwise.
+        """
+        if self.settings.registry is None:
+            return None
+        enabled = self.settings.registry.inference_backend is not None
+        if self.settings.use_tflite and not enabled:
+            return self.enable_inference_backend()
+        if not self.settings.use_tflite and enabled:
+            self.disable_inference_backend()
+        return None
 
     def update_dictionary(self, layer):
         """Imports the dictionary for the given layer.
@@ -73,15 +391,73 @@ class Visualizer:
         Args:
             layer: the layer to import the dictionary for.
         """
-        self.dictionary.import_dictionary(self.settings.dict_path, layer)
+        self.dictionary.import_dictionary(
+            self.settings.dict_path, layer, self.settings.model_fingerprint,
+            self.settings.settings_for_layer(layer).fingerprint())
 
-    def update_settings(self, path):
-        """Imports the settings from the given path.
+    def update_settings(self, path, confirm_cores=None):
+        """Imports the settings or the tuned per-layer profiles (.json) from the given path.
+        Core sets are specific to the machine the settings were exported on, so the core set
+        of a settings file is only taken over if confirm_cores accepts it.
         
         Args:
             path: the path to the settings.
+            confirm_cores: function called with the core set of the settings file, returns True to apply it.
+
+        Returns:
+            list of messages for the settings that could not be applied.
         """
+        if path.endswith(".json"):
+            self.settings.import_profiles(path)
+            return []
+        previous = self.settings.resources
+        cores = previous.cores
         self.settings.import_settings(path)
+        imported = self.settings.resources
+        # The number of parallel jobs is a preference of this machine and not part of the settings export
+        imported.job_workers = previous.job_workers
+        messages = []
+        if imported.cores != cores and (confirm_cores is None or not confirm_cores(imported.cores)):
+            messages.append("The core set " + (resources.format_cores(imported.cores) or "all") +
+                            " of the settings file was not applied")
+            imported.cores = cores
+        return messages + self.update_resources(imported)
+
+    def update_resources(self, compute_resources):
+        """Applies the thread counts and the core set and stores them for the next session.
+
+        Args:
+            compute_resources: the new Compute_Resources.
+
+        Returns:
+            list of messages for the settings that could not be applied.
+        """
+        self.settings.resources = compute_resources
+        resources.save_resources(compute_resources)
+        self.scheduler.set_max_workers(compute_resources.job_workers)
+        # The compute processes apply the resources with the next call
+        return resources.apply_resources(compute_resources, pin=self.compute_servers is None)
+
+    def set_job_workers(self, job_workers):
+        """Changes the number of jobs the scheduler runs at the same time and stores it for the next session.
+
+        Args:
+            job_workers: the number of parallel jobs.
+        """
+        self.settings.resources.job_workers = job_workers
+        resources.save_resources(self.settings.resources)
+        self.scheduler.set_max_workers(job_workers)
+
+    def calibrate_resources(self, worker=None):
+        """Measures the throughput of a few thread configurations within the current core budget on the imported model.
+
+        Args:
+            worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+
+        Returns:
+            list of (resources, forward images per second, gradient steps per second) tuples, fastest first.
+        """
+        return resources.calibrate(self.settings, worker=worker)
 
     def export_settings(self, path):
         """Exports the settings to the given path.
@@ -91,44 +467,54 @@ class Visualizer:
         """
         self.settings.export_settings(path)
 
-    def get_filter_visualization(self, i, j, count=3):
+    def top_filters(self, i, j, count=None):
+        """Looks up the top activated filters at the given spatial position in the top-k index of the current activations.
+        The index is built on the first lookup after the activations changed and rebuilt if more than k filters are requested.
+
+        Args:
+            i: row index of the considered positions.
+            j: col index of the considered positions.
+            count: specifies the number of filters to be returned (settings.top_k if None is given).
+
+        Returns:
+            the indices of the filters, most activated first.
+        """
+        if count is None:
+            count = self.settings.top_k
+        if self.top_k is None or self.top_k.k < min(count, self.activations.shape[-1]):
+            self.top_k = Top_K_Index(
+                self.activations, max(count, self.settings.top_k))
+        return self.top_k.lookup(j, i, count)[0]
+
+    def get_filter_visualization(self, i, j, count=None):
         """Gets the feature visualizations for the top activated filter at the given spatial position.
         
         Args:
             i: row index of the considered positions.
             j: col index of the considered positions.
-            count: specifies the number of filters to be returned.
+            count: specifies the number of filters to be returned (settings.top_k if None is given).
 
         Returns:
             filter_visualizations: list of the top "count" activated filters at the specified position.
         """
-        filter_visualizations = []
-        max_idx = np.argsort(self.activations[j][i])
         imgs = self.dictionary.dictionary[self.settings.layer]
-        for i in range(max_idx.shape[0] - 1, max_idx.shape[0] - count - 1, -1):
-            filter_visualizations.append(imgs[max_idx[i]])
-        return filter_visualizations
+        return [imgs[index] for index in self.top_filters(i, j, count)]
 
-    def get_filter_visualizations(self, i, j, count=3):
+    def get_filter_visualizations(self, i, j, count=None):
         """Gets the feature visualizations for the top activated filter at the given spatial position.
         
         Args:
             i: row index of the considered positions.
             j: col index of the considered positions.
-            count: specifies the number of filters to be returned.
+            count: specifies the number of filters to be returned (settings.top_k if None is given).
 
         Returns:
             filter_visualizations: list of the top "count" activated filters at the specified position.
             filter_index: the indices of the filters.
         """
-        filter_visualizations = []
-        filter_index = []
-        max_idx = np.argsort(self.activations[j][i])
+        filter_index = list(self.top_filters(i, j, count))
         imgs = self.dictionary.dictionary[self.settings.layer]
-        for i in range(max_idx.shape[0] - 1, max_idx.shape[0] - count - 1, -1):
-            filter_visualizations.append(imgs[max_idx[i]])
-            filter_index.append(max_idx[i])
-        return (filter_visualizations, filter_index)
+        return ([imgs[index] for index in filter_index], filter_index)
 
     def get_activation_grid(self, target, worker):
         """Generates an activation grid resembling a representation of the currently selected layer.
@@ -163,28 +549,70 @@ class Visualizer:
             the given image with Grad-CAM applied.
         """
         if layer is None:
-            return grad_cam.generate_gradcam(self.settings.model, self.settings.input_img, self.settings.input_data, self.settings.conv_layers[-1].name)
+            return grad_cam.apply_heatmap(self.gradcam_heatmap(self.settings.conv_layers[-1].name), self.settings.input_img)
         else:
-            return grad_cam.generate_gradcam(self.settings.model, img, self.settings.input_data, layer)
+            return grad_cam.apply_heatmap(self.gradcam_heatmap(layer), img)
+
+    def gradcam_heatmap(self, layer):
+        """Gets the Grad-CAM heatmap of the given layer for the current input from the artifact store or computes it.
+
+        Args:
+            layer: the name of the layer.
+
+        Returns:
+            the heatmap.
+        """
+        input_key = self.activation_cache.input_key(
+            self.settings, self.settings.input_data)
+        artifact = self.store.get(
+            "gradcam", self.settings.model_fingerprint, "", layer, input_key)
+        if artifact is not None:
+            self.hold("gradcam", artifact[0])
+            return artifact[1]["heatmap"]
+        heatmap = np.asarray(grad_cam.make_gradcam_heatmap(
+            self.settings.model, self.settings.input_data, layer, registry=self.settings.registry))
+        key = self.store.put({"heatmap": heatmap}, "gradcam",
+                             self.settings.model_fingerprint, "", layer, input_key)
+        self.hold("gradcam", key)
+        return heatmap
 
-    def generate_groups(self):
+    def generate_groups(self, worker=None):
         """Generates activation groups for the current layer.
+
+        Args:
+            worker: the worker object that runs the task on a second thread. Used to cancel the process before the groups are computed.
         
         Returns:
-            the generated groups.
+            the generated groups, None if the task was canceled.
         """
-        return grouper.generate_groups(self.settings)
+        if worker is not None and not worker.is_running:
+            return None
+        input_key = self.activation_cache.input_key(
+            self.settings, self.settings.input_data)
+        settings_fingerprint = util.hash_values(
+            self.settings.groups, self.backend_fingerprint())
+        artifact = self.store.get("groups", self.settings.model_fingerprint,
+                                  settings_fingerprint, self.settings.layer, input_key)
+        if artifact is not None:
+            self.hold("groups", artifact[0])
+            return (artifact[1]["grouped_acts"], artifact[1]["channel_factors"])
+        grouped_acts, channel_factors = grouper.generate_groups(self.settings)
+        key = self.store.put({"grouped_acts": grouped_acts, "channel_factors": channel_factors}, "groups",
+                             self.settings.model_fingerprint, settings_fingerprint, self.settings.layer, input_key)
+        self.hold("groups", key)
+        return (grouped_acts, channel_factors)
 
-    def generate_grp_visualizations(self, channel_factors):
+    def generate_grp_visualizations(self, channel_factors, worker=None):
         """Generates feature visualizations for the given activation groups.
         
         Args:
             channel_factors: the activations groups to generate visualizations for.
+            worker: the worker object that runs the task on a second thread. Used to cancel the process.
 
         Returns:
             list containing a feature visualization for each group.
         """
-        return grouper.generate_grp_visualizations(channel_factors, self.settings.groups, self.settings)
+        return grouper.generate_grp_visualizations(channel_factors, self.settings.groups, self.settings, worker)
 
     def generate_group_activation_maps(self, grouped_acts, worker):
         """Generates activation maps for the given groups.
@@ -0,0 +1,67 @@
+import copy
+import numpy as np
+
+import backend.feature_visualization as fv
+import backend.grad_cam as grad_cam
+
+"""Warm-up of a freshly imported model.
+Runs the common forward and gradient paths once on a dummy input, so their one-time tracing
+and kernel initialization costs are paid in the background instead of on the first interaction.
+"""
+
+
+def dummy_input(settings):
+    """Creates an input of the model's input shape filled with zeros."""
+    return np.zeros((1, settings.input_width, settings.input_height, 3), np.float32)
+
+
+def warmup_tasks(settings):
+    """Lists the warm-up tasks for the imported model.
+
+    Args:
+        settings: the current settings object.
+
+    Returns:
+        list of functions without arguments, each tracing one commonly used function.
+    """
+    tasks = []
+    names = list(dict.fromkeys(
+        [layer.name for layer in settings.conv_layers + settings.grp_layers]))
+    if len(names) > 0:
+        # Multi-output forward pass used by the activation cache
+        tasks.append(lambda: settings.registry.multi_forward(
+            names)(dummy_input(settings)))
+    if len(settings.conv_layers) > 0:
+        last_conv = settings.conv_layers[-1].name
+        tasks.append(lambda: grad_cam.make_gradcam_heatmap(
+            settings.model, dummy_input(settings), last_conv, registry=settings.registry))
+        first_conv = settings.conv_layers[0].name
+        tasks.append(lambda: trace_step(settings, first_conv))
+    return tasks
+
+
+def trace_step(settings, layer_name):
+    """Runs one gradient ascent step for the filter target of the given layer.
+
+    Args:
+        settings: the current settings object.
+        layer_name: the name of the layer.
+    """
+    step_settings = copy.copy(settings)
+    step_settings.iterations = 1
+    fv.optimize(settings.registry.extractor(layer_name),
+                step_settings, fv.filter_loss, 0)
+
+
+def warm_up(settings, worker):
+    """Runs the warm-up tasks. The worker is checked between the tasks.
+
+    Args:
+        settings: the current settings object.
+        worker: the worker object that runs the task on a second thread. The object is used to emit progress to the main thread.
+    """
+    for i, task in enumerate(warmup_tasks(settings)):
+        if not worker.is_running:
+            return
+        task()
+        worker.progress.emit(i + 1)
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import signal
+import sys
+
+from backend.common import Target
+
+"""Command line interface running the generation tasks without the GUI.
+Progress and results are printed to stdout as JSON lines, e.g.
+{"event": "progress", "stage": "dictionary", "value": 3, "total": 17}.
+
+Exit codes:
+    0: the task completed.
+    1: the task failed.
+    2: the arguments are invalid, e.g. an unknown layer or a dictionary of a different model.
+    3: the model, the input or the settings could not be loaded.
+    130: the task was canceled with Ctrl+C.
+"""
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_LOAD = 3
+EXIT_CANCELED = 130
+
+
+class Usage_Error(Exception):
+    """Raised for arguments that are invalid for the loaded model, reported with EXIT_USAGE."""
+
+
+def emit(event, **fields):
+    """Prints an event as a JSON line.
+
+    Args:
+        event: the type of the event.
+        fields: the fields of the event.
+    """
+    print(json.dumps(dict(event=event, **fields)), flush=True)
+
+
+class Cli_Signal:
+    """Signal printing the emitted progress as JSON lines."""
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def emit(self, value):
+        emit("progress", stage=self.worker.stage,
+             value=value, total=self.worker.total)
+
+
+class Null_Signal:
+    """Signal ignoring everything emitted, used for the tiles and previews meant for the GUI."""
+
+    def emit(self, *args):
+        pass
+
+
+class Cli_Worker:
+    """Worker object passed to the back-end. Ctrl+C stops the task at its next checkpoint."""
+
+    def __init__(self):
+        self.is_running = True
+        self.gate = None
+        self.stage = None
+        self.total = None
+        self.progress = Cli_Signal(self)
+        self.tile = Null_Signal()
+        self.preview = Null_Signal()
+
+    def start_stage(self, stage, total=None):
+        """Sets the name and the number of steps of the next stage reported in the progress events."""
+        self.stage = stage
+        self.total = total
+        emit("stage", stage=stage, total=total)
+
+    def stop(self, *args):
+        """Cancels the task, usable as signal handler. A second Ctrl+C terminates immediately."""
+        self.is_running = False
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
+def load_visualizer(args):
+    """Creates the visualizer and loads the model, settings, input and dictionary given on the command line.
+
+    Args:
+        args: the parsed arguments.
+
+    Returns:
+        the visualizer.
+    """
+    # The back-end is imported after the arguments were parsed, so --help stays fast
+    from backend.visualizer import Visualizer
+    import backend.util as util
+
+    visualizer = Visualizer()
+    if args.settings is not None:
+        messages = visualizer.update_settings(args.settings)
+        for message in messages or []:
+            emit("warning", message=message)
+    visualizer.settings.init_model(util.load_model(args.model), args.model)
+    if args.tflite:
+        report = visualizer.enable_inference_backend(
+            args.calibration, args.quantize)
+        emit("tflite", report=str(report))
+    elif visualizer.settings.use_tflite:
+        # The settings file selected the TFLite interpreter
+        emit("tflite", report=str(visualizer.apply_inference_backend()))
+    if getattr(args, "input", None) is not None:
+        visualizer.update_input(args.input)
+    if getattr(args, "dictionary", None) is not None:
+        visualizer.settings.set_dict_path(args.dictionary)
+    return visualizer
+
+
+def select_layer(visualizer, name, layers):
+    """Selects the given layer and computes its activations.
+
+    Args:
+        visualizer: the visualizer.
+        name: the name of the layer.
+        layers: the layers the name must be one of.
+
+    Raises:
+        Usage_Error: if the model has no suitable layer with the given name.
+    """
+    if name not in [layer.name for layer in layers]:
+        raise Usage_Error(f"{name} is not one of the layers: " +
+                          ", ".join(layer.name for layer in layers))
+    visualizer.settings.layer = name
+    visualizer.update_activations()
+
+
+def check_dictionary(visualizer, path, layer=None):
+    """Checks that the dictionary directory matches the loaded model and, if a layer is given, the settings of the layer.
+
+    Args:
+        visualizer: the visualizer.
+        path: the dictionary directory.
+        layer: the name of the layer whose dictionary is imported, None only checks the model.
+
+    Raises:
+        Usage_Error: if the dictionary belongs to a different model or was generated with different settings.
+    """
+    try:
+        if layer is None:
+            visualizer.check_dictionary_path(path)
+        else:
+            visualizer.update_dictionary(layer)
+    except (ValueError, KeyError) as err:
+        raise Usage_Error(f"The dictionary {path} can not be used: {err}")
+
+
+def save_image(path, img):
+    """Saves the given image and reports the path."""
+    import tensorflow as tf
+    tf.keras.utils.save_img(path, img)
+    emit("output", path=os.path.abspath(path))
+
+
+def run_dictionary(visualizer, args, worker):
+    """Generates the dictionary of all convolution layers."""
+    check_dictionary(visualizer, args.output)
+    worker.start_stage("dictionary", len(visualizer.settings.conv_layers))
+    if visualizer.build_dictionary(args.output, worker):
+        emit("output", path=os.path.abspath(args.output))
+
+
+def run_layer_rep(visualizer, args, worker):
+    """Generates the layer representation of the input for the given layer."""
+    import numpy as np
+    settings = visualizer.settings
+    select_layer(visualizer, args.layer, settings.conv_layers)
+    target = Target.DIRECTION if args.target == "direction" else Target.FILTER
+    if target == Target.FILTER:
+        if settings.dict_path is None:
+            raise Usage_Error(
+                "--dictionary is required for the filter target")
+        check_dictionary(visualizer, settings.dict_path, args.layer)
+    worker.start_stage("layer-rep", len(visualizer.activations) ** 2)
+    img = visualizer.get_activation_grid(target, worker)
+    if img is None or not worker.is_running:
+        return
+    if args.grad_cam:
+        img = np.asarray(visualizer.apply_grad_cam(img, args.layer))
+    save_image(args.output, img)
+
+
+def run_gradcam(visualizer, args, worker):
+    """Applies the Grad-CAM heatmap of the given layer to the input."""
+    settings = visualizer.settings
+    layer = args.layer if args.layer is not None else settings.conv_layers[-1].name
+    if settings.get_layer_by_name(layer) is None:
+        raise Usage_Error(f"The model has no layer {layer}")
+    worker.start_stage("gradcam")
+    save_image(args.output, visualizer.apply_grad_cam(
+        settings.input_img, layer))
+
+
+def run_groups(visualizer, args, worker):
+    """Groups the activations of the given layer and saves an activation map and a feature visualization for each group."""
+    import cv2
+    import numpy as np
+    import backend.util as util
+    settings = visualizer.settings
+    if args.groups is not None:
+        if args.groups < 1:
+            raise Usage_Error("--groups has to be positive")
+        settings.groups = args.groups
+    select_layer(visualizer, args.layer, settings.grp_layers)
+    worker.start_stage("groups")
+    grouped_acts, channel_factors = visualizer.generate_groups()
+    worker.start_stage("activation-maps", settings.groups)
+    maps = visualizer.generate_group_activation_maps(grouped_acts, worker)
+    if not worker.is_running:
+        return
+    worker.start_stage("group-visualizations", settings.groups)
+    imgs = visualizer.generate_grp_visualizations(channel_factors, worker)
+    if not worker.is_running:
+        return
+    os.makedirs(args.output, exist_ok=True)
+    size = 2 * settings.input_width
+    for i, (act_map, img) in enumerate(zip(maps, imgs)):
+        act_map = cv2.resize(act_map, dsize=(size, size))
+        save_image(os.path.join(args.output, f"group_{i}.png"),
+                   util.combine_group_img(settings, act_map, np.asarray(img)))
+    path = os.path.join(args.output, "groups.npz")
+    np.savez(path, grouped_acts=grouped_acts, channel_factors=channel_factors)
+    emit("output", path=os.path.abspath(path))
+
+
+def build_parser():
+    """Creates the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Runs the generation tasks of XAI Viz without the GUI. Progress is printed as JSON lines.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("model", help="path to the Keras model")
+    common.add_argument("--settings", default=None,
+                        help="settings file or tuned per-layer profiles (.json)")
+    common.add_argument("--tflite", action="store_true",
+                        help="compute forward passes with a TFLite interpreter")
+    common.add_argument("--quantize", action="store_true",
+                        help="quantize the TFLite interpreter to int8")
+    common.add_argument("--calibration", default=None,
+                        help="directory with images calibrating the quantization")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    dictionary = subparsers.add_parser("dictionary", parents=[common],
+                                       help="generate the dictionary of all convolution layers")
+    dictionary.add_argument("output", help="directory the dictionary is exported to")
+    dictionary.set_defaults(run=run_dictionary)
+
+    layer_rep = subparsers.add_parser("layer-rep", parents=[common],
+                                      help="generate the layer representation of an input")
+    layer_rep.add_argument("input", help="path to the input image")
+    layer_rep.add_argument("output", help="path of the generated image")
+    layer_rep.add_argument("--layer", required=True)
+    layer_rep.add_argument("--target", choices=["filter", "direction"], default="filter",
+                           help="combine dictionary images (filter) or optimize each position (direction)")
+    layer_rep.add_argument("--dictionary", default=None,
+                           help="dictionary directory, required for the filter target")
+    layer_rep.add_argument("--grad-cam", action="store_true",
+                           help="apply the Grad-CAM heatmap of the layer")
+    layer_rep.set_defaults(run=run_layer_rep)
+
+    gradcam = subparsers.add_parser("gradcam", parents=[common],
+                                    help="apply Grad-CAM to an input")
+    gradcam.add_argument("input", help="path to the input image")
+    gradcam.add_argument("output", help="path of the generated image")
+    gradcam.add_argument("--layer", default=None,
+                         help="layer of the heatmap (default: last convolution layer)")
+    gradcam.set_defaults(run=run_gradcam)
+
+    groups = subparsers.add_parser("groups", parents=[common],
+                                   help="group the activations of a layer with NMF")
+    groups.add_argument("input", help="path to the input image")
+    groups.add_argument("output", help="directory the group images are saved to")
+    groups.add_argument("--layer", required=True)
+    groups.add_argument("--groups", type=int, default=None,
+                        help="number of groups (default: from the settings)")
+    groups.set_defaults(run=run_groups)
+    return parser
+
+
+def main(argv=None):
+    """Runs the command given on the command line.
+
+    Args:
+        argv: the command line arguments, defaults to sys.argv.
+
+    Returns:
+        the exit code.
+    """
+    args = build_parser().parse_args(argv)
+    worker = Cli_Worker()
+    signal.signal(signal.SIGINT, worker.stop)
+    try:
+        visualizer = load_visualizer(args)
+    except Exception as err:
+        emit("error", message=repr(err))
+        return EXIT_LOAD
+    try:
+        args.run(visualizer, args, worker)
+    except Usage_Error as err:
+        emit("error", message=str(err))
+        return EXIT_USAGE
+    except Exception as err:
+        emit("error", message=repr(err))
+        return EXIT_FAILED
+    if not worker.is_running:
+        emit("canceled")
+        return EXIT_CANCELED
+    emit("done")
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,64 @@
-from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtCore import pyqtSignal, QTimer
 from PyQt5 import QtWidgets
 
+# Roughly one display refresh, bursts of mouse moves within this interval are merged
+COALESCE_INTERVAL = 16
+
 
 class HoverLabel(QtWidgets.QLabel):
     """Custom implementation of the QLabel.
     This implementation adds mouse tracking that is used to display highlights on generated visualizations.
+    The label is divided into a grid of cells, mouseHover is only emitted when the hovered cell changes
+    and bursts of changes are coalesced to one emission per display refresh.
     """
     mouseHover = pyqtSignal(bool)
 
     def __init__(self, parent=None):
         QtWidgets.QLabel.__init__(self, parent)
         self.setMouseTracking(True)
-        self.event = None
+        self.cell_size = 1
+        self.grid_shape = None
+        self.cell = None
+        self.pending = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(COALESCE_INTERVAL)
+        self.timer.timeout.connect(self.emit_pending)
+
+    def set_grid(self, cell_size, rows, cols):
+        """Sets the size of the grid cells in pixels and the number of cells.
+
+        Args:
+            cell_size: the edge length of a cell.
+            rows: the number of cells along the x axis.
+            cols: the number of cells along the y axis.
+        """
+        self.cell_size = cell_size
+        self.grid_shape = (rows, cols)
+        self.cell = None
+        self.pending = None
 
     def mouseMoveEvent(self, event):
-        self.event = event
+        cell = (event.x() // self.cell_size, event.y() // self.cell_size)
+        if self.grid_shape is not None and not (0 <= cell[0] < self.grid_shape[0] and 0 <= cell[1] < self.grid_shape[1]):
+            return
+        if cell == self.cell and self.pending is None:
+            return
+        self.pending = cell
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def emit_pending(self):
+        """Emits the last hovered cell of the burst if it differs from the cell emitted before."""
+        if self.pending is None or self.pending == self.cell:
+            self.pending = None
+            return
+        self.cell = self.pending
+        self.pending = None
         self.mouseHover.emit(True)
 
     def leaveEvent(self, event):
+        self.timer.stop()
+        self.pending = None
+        self.cell = None
         self.mouseHover.emit(False)
@@ -0,0 +1,66 @@
+import numpy as np
+from PyQt5 import QtGui, QtCore
+
+"""Conversion of NumPy arrays into Qt images without PIL in between.
+Contiguous uint8 arrays are wrapped as QImage buffers without a copy, the only copy happens
+when the QImage is uploaded into a QPixmap.
+"""
+
+FORMATS = {
+    1: QtGui.QImage.Format_Grayscale8,
+    3: QtGui.QImage.Format_RGB888,
+    4: QtGui.QImage.Format_RGBA8888
+}
+
+
+def to_uint8(array):
+    """Converts the given array or PIL image into a contiguous uint8 array.
+    Arrays that already are contiguous uint8 arrays are returned unchanged, other arrays are clipped to [0, 255].
+
+    Args:
+        array: the image data with the shape (height, width) or (height, width, channels).
+
+    Returns:
+        the uint8 array.
+    """
+    array = np.asarray(array)
+    if array.dtype != np.uint8:
+        array = np.clip(array, 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(array)
+
+
+def array_to_qimage(array):
+    """Wraps the given image data as QImage sharing the memory of the array.
+    The array is attached to the QImage, so the buffer lives as long as the image.
+
+    Args:
+        array: the image data with the shape (height, width) or (height, width, channels).
+
+    Returns:
+        the QImage.
+    """
+    array = to_uint8(array)
+    channels = 1 if array.ndim == 2 else array.shape[2]
+    height, width = array.shape[:2]
+    qimage = QtGui.QImage(array.data, width, height,
+                          array.strides[0], FORMATS[channels])
+    # QImage does not own the buffer, keep the array alive together with the image
+    qimage.buffer = array
+    return qimage
+
+
+def array_to_pixmap(array, size=None):
+    """Converts the given image data into a pixmap.
+
+    Args:
+        array: the image data with the shape (height, width) or (height, width, channels).
+        size: the edge length the pixmap is scaled to (not scaled if None is given).
+
+    Returns:
+        the QPixmap.
+    """
+    pixmap = QtGui.QPixmap.fromImage(array_to_qimage(array))
+    if size is not None:
+        pixmap = pixmap.scaled(
+            size, size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation)
+    return pixmap
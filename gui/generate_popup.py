@@ -1,9 +1,8 @@
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5.QtCore import QThread
-import os
 from gui.worker import Worker
+from gui.ui_loader import load_ui
 from enum import Enum
-import backend.util as util
 
 
 class Generate_Popup(QtWidgets.QDialog):
@@ -11,8 +10,7 @@ class Generate_Popup(QtWidgets.QDialog):
 
     def __init__(self, controller, task, target=None, path=None):
         super(Generate_Popup, self).__init__()
-        path = util.resource_path(os.path.join('res', 'ui', 'generate.ui'))
-        uic.loadUi(path, self)
+        load_ui(self, 'generate')
         self.controller = controller
         self.target = target
         self.task = task
@@ -24,11 +22,7 @@ class Generate_Popup(QtWidgets.QDialog):
         self.progress_bar = self.findChild(
             QtWidgets.QProgressBar, "progress_bar")
 
-        if self.task == Task.DICTIONARY:
-            self.setWindowTitle("Generate Dictionary")
-            self.progress_bar.setRange(
-                0, len(self.controller.visualizer.settings.conv_layers))
-        elif self.task == Task.LAYER_REP:
+        if self.task == Task.LAYER_REP:
             self.setWindowTitle("Generate Layer Representation")
             self.label.setText("Generating Visualization...")
             self.progress_bar.setRange(0, len(
@@ -38,6 +32,16 @@ class Generate_Popup(QtWidgets.QDialog):
             self.label.setText("Generating Visualization...")
             self.progress_bar.setRange(
                 0, self.controller.visualizer.settings.groups)
+        elif self.task == Task.SWEEP:
+            self.setWindowTitle("Sweep Settings")
+            self.label.setText("Generating Visualizations...")
+            self.progress_bar.setRange(
+                0, self.controller.sample_screen.sweep_count)
+        elif self.task == Task.TUNE:
+            self.setWindowTitle("Auto-Tune Settings")
+            self.label.setText("Tuning Settings...")
+            self.progress_bar.setRange(
+                0, len(self.controller.visualizer.settings.conv_layers))
         self.start()
 
     def start(self):
@@ -45,18 +49,28 @@ class Generate_Popup(QtWidgets.QDialog):
         self.thread = QThread()
         self.worker = Worker(self.controller)
         self.worker.moveToThread(self.thread)
-        if self.task == Task.DICTIONARY:
-            self.thread.started.connect(self.worker.run_generate_dictionary)
-        elif self.task == Task.LAYER_REP:
+        if self.task == Task.LAYER_REP:
+            layer_rep = self.controller.layer_rep_screen
+            layer_rep.start_canvas()
+            self.worker.tile.connect(layer_rep.paint_tiles)
+            self.worker.result.connect(layer_rep.show_result)
             self.thread.started.connect(
                 self.worker.run_generate_activation_grid)
         elif self.task == Task.GROUPS:
+            group = self.controller.grouped_screen
+            self.worker.preview.connect(group.show_maps)
+            self.worker.result.connect(group.show_result)
             self.thread.started.connect(
                 self.worker.run_generate_group_visualization)
+        elif self.task == Task.SWEEP:
+            self.thread.started.connect(self.worker.run_sweep)
+        elif self.task == Task.TUNE:
+            self.thread.started.connect(self.worker.run_tune_settings)
         self.worker.finished.connect(self.thread.quit)
         self.worker.finished.connect(self.worker.deleteLater)
         self.thread.finished.connect(self.finish)
         self.worker.progress.connect(self.reportProgress)
+        self.worker.failed.connect(self.show_error)
         self.thread.start()
 
     def cancel(self):
@@ -64,10 +78,6 @@ class Generate_Popup(QtWidgets.QDialog):
         self.worker.stop()
         self.thread.quit()
         self.thread.wait()
-        # If the task was dictionary generation reset the dictionary since only complete dictionaries are valid.
-        if self.task == Task.DICTIONARY:
-            self.controller.visualizer.reset_dictionary()
-            self.controller.visualizer.settings.dict_path = None
         self.close()
 
     def finish(self):
@@ -75,6 +85,14 @@ class Generate_Popup(QtWidgets.QDialog):
         self.close()
         self.thread.deleteLater
 
+    def show_error(self, message):
+        """Displays the error of a task that failed in the compute process."""
+        msg = QtWidgets.QMessageBox()
+        msg.setWindowTitle("Error")
+        msg.setIcon(QtWidgets.QMessageBox.Critical)
+        msg.setText(message)
+        msg.exec_()
+
     def reportProgress(self, n):
         """Updates the displayed progress bar."""
         self.progress_bar.setValue(n)
@@ -84,14 +102,12 @@ class Generate_Popup(QtWidgets.QDialog):
         self.worker.stop()
         self.thread.quit()
         self.thread.wait()
-        if not self.worker.completed and self.task == Task.DICTIONARY:
-            self.controller.visualizer.reset_dictionary()
-            self.controller.visualizer.settings.dict_path = None
         event.accept()
 
 
 class Task(str, Enum):
     """Enumeration to distinguish between the different tasks that can be executed using this popup."""
-    DICTIONARY = "DICTIONARY"
     LAYER_REP = "LAYER_REP"
     GROUPS = "GROUPS"
+    SWEEP = "SWEEP"
+    TUNE = "TUNE"
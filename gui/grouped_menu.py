@@ -1,13 +1,12 @@
-from PyQt5 import QtWidgets, QtGui, uic, QtCore
-from PIL.ImageQt import ImageQt
-import tensorflow as tf
-import os
+from PyQt5 import QtWidgets, QtGui, QtCore
 import math
 
 from gui.generate_popup import Generate_Popup, Task
 from gui.HoverLabel import HoverLabel
-import backend.util as util
-from backend.util import Screen
+from gui.highlight import Highlight
+from gui.display import array_to_pixmap
+from gui.ui_loader import load_ui
+from backend.common import Screen
 
 
 class Grouped_Menu(QtWidgets.QWidget):
@@ -18,8 +17,7 @@ class Grouped_Menu(QtWidgets.QWidget):
     def __init__(self, controller):
         super(Grouped_Menu, self).__init__()
         self.controller = controller
-        path = util.resource_path(os.path.join('res', 'ui', 'grouped.ui'))
-        uic.loadUi(path, self)
+        load_ui(self, 'grouped')
         back_btn = self.findChild(QtWidgets.QPushButton, "back_btn")
         back_btn.clicked.connect(self.goto_back)
 
@@ -38,8 +36,12 @@ class Grouped_Menu(QtWidgets.QWidget):
 
         self.init_vis_container()
 
-        self.input_highlight = []
-        self.vis_highlight = []
+        self.input_container = HoverLabel(self)
+        self.vis_container = HoverLabel(self)
+        self.input_container.mouseHover.connect(self.update_input_highlight)
+        self.vis_container.mouseHover.connect(self.update_vis_highlight)
+        self.input_highlight = Highlight(self)
+        self.vis_highlight = Highlight(self)
 
         self.choose_layer = self.findChild(QtWidgets.QComboBox, "choose_layer")
         self.choose_layer.currentTextChanged.connect(self.update_layer)
@@ -62,13 +64,12 @@ class Grouped_Menu(QtWidgets.QWidget):
         Additionally the visualization for the new layer are imported from the harddrive.
         """
         self.generated = False
+        self.loading = True
         self.group_label = self.findChild(QtWidgets.QLabel, "groups")
         self.group_label.setText(
             f"{self.controller.visualizer.settings.groups} groups")
         self.group_slider.setValue(
             self.controller.visualizer.settings.groups / 2)
-        self.input_container = HoverLabel(self)
-        self.vis_container = HoverLabel(self)
         for i in range(len(self.group_vis_container)):
             self.group_vis_container[i].clear()
             self.group_vis_container[i].setStyleSheet("border: ")
@@ -85,8 +86,6 @@ class Grouped_Menu(QtWidgets.QWidget):
             if not "out" in (layer.name) or layer.out_shape[1] > self.controller.visualizer.settings.input_width:
                 continue
             self.choose_layer.addItem(layer.name)
-        self.input_container.mouseHover.connect(self.update_input_highlight)
-        self.vis_container.mouseHover.connect(self.update_vis_highlight)
 
     def update_groups(self, value):
         """Updates the label displaying how many groups are selected."""
@@ -94,10 +93,8 @@ class Grouped_Menu(QtWidgets.QWidget):
 
     def update_input_image(self, img):
         """Updates the display inout image."""
-        self.in_qim = ImageQt(img)
-        self.in_pixmap = QtGui.QPixmap.fromImage(self.in_qim)
-        self.input_container.setPixmap(self.in_pixmap.scaled(
-            self.img_size, self.img_size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation))
+        self.in_pixmap = array_to_pixmap(img, self.img_size)
+        self.input_container.setPixmap(self.in_pixmap)
 
     def export_image(self):
         """Exports the selected activation map and the corresponding feature visualization."""
@@ -107,19 +104,63 @@ class Grouped_Menu(QtWidgets.QWidget):
             self, "Export Image", "layer", "PNG (*.png)")
         if path[0] == "":
             return
+        # The back-end is imported lazily to keep the start of the application fast
+        import tensorflow as tf
+        import backend.util as util
         export = util.combine_group_img(self.controller.visualizer.settings,
                                         self.group_activation_maps[self.selected_group], self.grp_imgs[self.selected_group])
         tf.keras.utils.save_img(path[0], export)
+        self.controller.visualizer.export_activations()
 
     def generate_visualization(self):
         """Starts the task to generate the group visualizations on a new thread.
         Displays the progress popup during the process.
         """
+        if self.loading:
+            return
+        self.controller.visualizer.settings.groups = self.group_slider.value() * 2
+        self.generated = False
+        # Remove highlightings from the last visualization
+        for i in range(len(self.group_vis_container)):
+            self.group_vis_container[i].clear()
+            self.group_vis_container[i].setStyleSheet("border: ")
+        self.vis_container.clear()
         self.popup = Generate_Popup(self.controller, Task.GROUPS)
         self.popup.setWindowFlags(
             self.popup.windowFlags() & ~QtCore.Qt.WindowContextHelpButtonHint)
         self.popup.exec_()
 
+    def show_maps(self, group_activation_maps):
+        """Displays the activation map of the first group while the group visualizations are generated.
+
+        Args:
+            group_activation_maps: the activation maps of the groups scaled to the display size.
+        """
+        self.group_activation_maps = group_activation_maps
+        # Pixmaps of the previous result are never shown again
+        self.controller.pixmap_cache.invalidate("group")
+        self.result_id = self.controller.pixmap_cache.new_result_id()
+        self.selected_group = 0
+        self.vis_pixmap = self.controller.pixmap_cache.get_or_create(
+            ("group", self.result_id, 0), self.activation_map_pixmap)
+        self.vis_container.setPixmap(self.vis_pixmap)
+
+    def show_result(self, grp_imgs):
+        """Displays the feature visualizations of the groups and selects the first group.
+
+        Args:
+            grp_imgs: the feature visualization of each group.
+        """
+        self.grp_imgs = grp_imgs
+        for i in range(len(self.grp_imgs)):
+            self.group_vis_container[i].setPixmap(
+                array_to_pixmap(self.grp_imgs[i], 100))
+        # Add the selected highlight to the first group
+        self.selected_group = 0
+        self.group_vis_container[self.selected_group].setStyleSheet(
+            "border: 2px solid orange")
+        self.generated = True
+
     def update_visualization(self, event):
         """Updates the displayed activation map when a different activation group is selected."""
         self.calculate_selected_group(event.windowPos().x())
@@ -129,25 +170,43 @@ class Grouped_Menu(QtWidgets.QWidget):
             self.group_vis_container[self.selected_group].setStyleSheet(
                 "border: 2px solid orange")
             self.vis_container.clear()
-            self.vis_qim = ImageQt(
-                self.group_activation_maps[self.selected_group])
-            self.vis_pixmap = QtGui.QPixmap.fromImage(self.vis_qim)
+            self.vis_pixmap = self.controller.pixmap_cache.get_or_create(
+                ("group", self.result_id, self.selected_group), self.activation_map_pixmap)
             self.vis_container.setPixmap(self.vis_pixmap)
 
+    def activation_map_pixmap(self):
+        """Converts the activation map of the selected group into a pixmap."""
+        return array_to_pixmap(self.group_activation_maps[self.selected_group])
+
     def update_layer(self, value):
-        """When the user selects an different layer the current visualization and highlights are reset."""
+        """When the user selects an different layer the current visualization and highlights are reset.
+        The activations of the new layer are computed on a second thread, a placeholder is displayed until they arrive.
+        """
         self.remove_prev(delete_all=True)
         if value == "":
             return
-        self.controller.visualizer.settings.layer = value
-        self.controller.visualizer.update_activations()
-        self.vis_container.clear()
+        self.loading = True
         self.generated = False
-        self.input_grid = []
-        self.vis_grid = []
         for i in range(len(self.group_vis_container)):
             self.group_vis_container[i].clear()
             self.group_vis_container[i].setStyleSheet("border: ")
+        self.vis_container.setText("Loading layer...")
+        self.controller.layer_loader.request(
+            value, self.finish_layer, load_dictionary=False)
+
+    def finish_layer(self, value, error):
+        """Sets up the grids of the loaded layer.
+
+        Args:
+            value: the name of the loaded layer.
+            error: the error message if the layer could not be loaded.
+        """
+        self.vis_container.clear()
+        if error is not None:
+            self.vis_container.setText(error)
+            return
+        self.input_grid = []
+        self.vis_grid = []
         input_shape = self.controller.visualizer.settings.input_width
         layer = self.controller.visualizer.settings.get_layer_by_name(value)
         self.size = 2 * (input_shape // layer.out_shape[1])
@@ -159,34 +218,33 @@ class Grouped_Menu(QtWidgets.QWidget):
                 ) + i * self.size, self.input_container.y() + j * self.size))
                 self.vis_grid[i].append(
                     (self.vis_container.x() + i * self.size, self.vis_container.y() + j * self.size))
+        self.input_container.set_grid(
+            self.size, layer.out_shape[1], layer.out_shape[2])
+        self.vis_container.set_grid(
+            self.size, layer.out_shape[1], layer.out_shape[2])
+        self.loading = False
 
     def update_input_highlight(self, value, vis_grid_pos=None, rec=False):
-        """Displays the highlight on the input image when the mouse is moved on the displayed input image.
+        """Moves the highlight on the input image when the mouse is moved on the displayed input image.
         Also calls the update function for the highlight on the activation map if it was generated yet.
         """
+        if self.loading:
+            return
         grid_pos = None
         if value:
             if vis_grid_pos is None:
-                grid_pos = self.get_grid_position(self.sender().event)
+                grid_pos = self.input_container.cell
             else:
                 grid_pos = vis_grid_pos
             x = grid_pos[0]
             y = grid_pos[1]
-            self.opacity_effect = QtWidgets.QGraphicsOpacityEffect()
-            self.opacity_effect.setOpacity(0.3)
-            self.input_highlight.append(QtWidgets.QLabel(self))
-            self.input_highlight[-1].setStyleSheet("background-color: orange")
-            self.input_highlight[-1].setGeometry(
-                self.input_grid[x][y][0], self.input_grid[x][y][1], self.size, self.size)
-            self.input_highlight[-1].setGraphicsEffect(self.opacity_effect)
-            self.input_highlight[-1].show()
-        else:
-            self.remove_prev()
+            self.input_highlight.move_to(
+                self.input_grid[x][y][0], self.input_grid[x][y][1], self.size)
         if not rec:
             self.update_vis_highlight(value, grid_pos, True)
 
     def update_vis_highlight(self, value, input_grid_pos=None, rec=False):
-        """Displays the highlight on the activation map when the mouse is moved on the displayed visualization.
+        """Moves the highlight on the activation map when the mouse is moved on the displayed visualization.
         Also calls the update function for the highlight on the input image.
         """
         if not self.generated:
@@ -194,48 +252,21 @@ class Grouped_Menu(QtWidgets.QWidget):
         grid_pos = None
         if value:
             if input_grid_pos is None:
-                grid_pos = self.get_grid_position(self.sender().event)
+                grid_pos = self.vis_container.cell
             else:
                 grid_pos = input_grid_pos
             x = grid_pos[0]
             y = grid_pos[1]
-            self.opacity_effect = QtWidgets.QGraphicsOpacityEffect()
-            self.opacity_effect.setOpacity(0.3)
-            self.vis_highlight.append(QtWidgets.QLabel(self))
-            self.vis_highlight[-1].setStyleSheet("background-color: orange")
-            self.vis_highlight[-1].setGeometry(
-                self.vis_grid[x][y][0], self.vis_grid[x][y][1], self.size, self.size)
-            self.vis_highlight[-1].setGraphicsEffect(self.opacity_effect)
-            self.vis_highlight[-1].show()
-        else:
-            self.remove_prev()
+            self.vis_highlight.move_to(
+                self.vis_grid[x][y][0], self.vis_grid[x][y][1], self.size)
         if not rec:
             self.update_input_highlight(value, grid_pos, True)
 
     def remove_prev(self, delete_all=False):
-        """Removes previous highlights from the list. Clears all highlights if delete_all is set."""
-        while len(self.input_highlight) > 1:
-            self.input_highlight[0].deleteLater()
-            self.input_highlight.remove(self.input_highlight[0])
-        while len(self.vis_highlight) > 1:
-            self.vis_highlight[0].deleteLater()
-            self.vis_highlight.remove(self.vis_highlight[0])
+        """Keeps the highlights at the last hovered position. Hides them if delete_all is set."""
         if delete_all:
-            if len(self.vis_highlight) > 0:
-                self.vis_highlight[0].deleteLater()
-            if len(self.input_highlight) > 0:
-                self.input_highlight[0].deleteLater()
-            self.vis_highlight = []
-            self.input_highlight = []
-
-    def get_grid_position(self, mouse_position):
-        """Converts the mouse position on the displayed images to a coordinate.
-        This coordinate is used to determine which feature visualization is displayed
-        in the magnified view underneath the layer representation.
-        """
-        x = mouse_position.x() // self.size
-        y = mouse_position.y() // self.size
-        return (x, y)
+            self.input_highlight.hide()
+            self.vis_highlight.hide()
 
     def calculate_selected_group(self, x):
         """Calculates which group was selected by clicking on the corresponding feature visualization depending on the mouse position."""
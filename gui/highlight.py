@@ -0,0 +1,35 @@
+from PyQt5 import QtWidgets, QtCore
+
+
+class Highlight(QtWidgets.QLabel):
+    """Semi-transparent overlay marking the hovered cell of a visualization.
+    Each container owns one overlay that is moved to the hovered cell instead of creating a new widget per move.
+    """
+
+    def __init__(self, parent, color="orange", opacity=0.3):
+        """
+        Args:
+            parent: the widget the overlay is drawn on.
+            color: the color of the overlay.
+            opacity: the opacity of the overlay.
+        """
+        super(Highlight, self).__init__(parent)
+        self.setStyleSheet(f"background-color: {color}")
+        self.opacity_effect = QtWidgets.QGraphicsOpacityEffect(self)
+        self.opacity_effect.setOpacity(opacity)
+        self.setGraphicsEffect(self.opacity_effect)
+        # The overlay must not take the hover away from the label underneath
+        self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.hide()
+
+    def move_to(self, x, y, size):
+        """Shows the overlay at the given position.
+
+        Args:
+            x: x coordinate of the top left corner in the parent.
+            y: y coordinate of the top left corner in the parent.
+            size: the edge length of the overlay.
+        """
+        self.setGeometry(x, y, size, size)
+        self.raise_()
+        self.show()
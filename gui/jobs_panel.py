@@ -0,0 +1,104 @@
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
+
+from gui.ui_loader import load_ui
+
+
+class Job_Bridge(QObject):
+    """Forwards the notifications of the job scheduler from its threads to the main thread."""
+    changed = pyqtSignal(object)
+
+    def __init__(self, scheduler):
+        super(Job_Bridge, self).__init__()
+        scheduler.changed.connect(self.changed.emit)
+
+
+class Jobs_Panel(QtWidgets.QWidget):
+    """Non-modal window listing the queued, running and finished jobs of the scheduler.
+    Each job shows its state and progress and can be canceled while it is not done.
+    """
+    job_finished = pyqtSignal(object)
+
+    def __init__(self, controller):
+        super(Jobs_Panel, self).__init__(None, Qt.Tool)
+        self.controller = controller
+        load_ui(self, 'jobs')
+        self.setFixedSize(560, 360)
+        self.scheduler = controller.visualizer.scheduler
+        self.rows = dict()
+        self.cleared = set()
+        self.table = self.findChild(QtWidgets.QTableWidget, "jobs_table")
+        self.table.setColumnWidth(0, 200)
+        self.table.setColumnWidth(1, 90)
+        self.table.setColumnWidth(2, 150)
+        clear_btn = self.findChild(QtWidgets.QPushButton, "clear_btn")
+        clear_btn.clicked.connect(self.clear_finished)
+        self.workers_spin = self.findChild(QtWidgets.QSpinBox, "workers_spin")
+        self.workers_spin.setValue(self.scheduler.max_workers)
+        self.workers_spin.valueChanged.connect(
+            controller.visualizer.set_job_workers)
+        self.bridge = Job_Bridge(self.scheduler)
+        self.bridge.changed.connect(self.update_job)
+
+    def submit(self, name, run, priority, total=0, gate=None):
+        """Queues a job on the scheduler and shows the panel.
+
+        Args:
+            name: the name displayed for the job.
+            run: function called with the job as worker on a thread of the scheduler.
+            priority: the priority of the job.
+            total: the number of progress steps of the job.
+            gate: the priority gate pausing the job while interactive requests are processed.
+
+        Returns:
+            the queued job.
+        """
+        job = self.scheduler.submit(name, run, priority, total, gate)
+        self.show()
+        self.raise_()
+        return job
+
+    def update_job(self, job):
+        """Updates the row of the given job, emits job_finished the first time a job is seen done."""
+        if job.id in self.cleared:
+            return
+        if job.id not in self.rows:
+            self.add_row(job)
+        row, progress_bar, cancel_btn, finished = self.rows[job.id]
+        index = self.row_index(job.id)
+        self.table.item(index, 1).setText(job.state.value)
+        progress_bar.setValue(job.value)
+        if job.done and not finished:
+            if job.error is not None:
+                self.table.item(index, 1).setToolTip(job.error)
+            cancel_btn.setEnabled(False)
+            self.rows[job.id] = (row, progress_bar, cancel_btn, True)
+            self.job_finished.emit(job)
+
+    def add_row(self, job):
+        """Appends a row for the given job to the table."""
+        index = self.table.rowCount()
+        self.table.insertRow(index)
+        self.table.setItem(index, 0, QtWidgets.QTableWidgetItem(job.name))
+        self.table.setItem(index, 1, QtWidgets.QTableWidgetItem(job.state.value))
+        progress_bar = QtWidgets.QProgressBar()
+        # An unknown number of steps shows a busy indicator
+        progress_bar.setRange(0, job.total)
+        self.table.setCellWidget(index, 2, progress_bar)
+        cancel_btn = QtWidgets.QPushButton("Cancel")
+        cancel_btn.clicked.connect(lambda: self.scheduler.cancel(job))
+        self.table.setCellWidget(index, 3, cancel_btn)
+        self.rows[job.id] = (self.table.item(index, 0), progress_bar, cancel_btn, False)
+
+    def row_index(self, job_id):
+        """Returns the current table row of the job with the given id."""
+        return self.table.row(self.rows[job_id][0])
+
+    def clear_finished(self):
+        """Removes the jobs that are done from the scheduler and the table."""
+        finished = [job_id for job_id, row in self.rows.items() if row[3]]
+        for job_id in finished:
+            self.table.removeRow(self.row_index(job_id))
+            del self.rows[job_id]
+            self.cleared.add(job_id)
+        self.scheduler.clear_finished()
@@ -0,0 +1,88 @@
+from PyQt5.QtCore import QObject, QThread, QTimer, Qt
+from gui.worker import Worker
+
+# Selections within this interval are merged, so scrolling through the layers only loads the last one
+DEBOUNCE_INTERVAL = 150
+
+
+class Layer_Loader(QObject):
+    """Loads the activations and the dictionary of a selected layer on a second thread.
+    Requests are debounced and only one load runs at a time. A request that is replaced
+    by a newer one before its load finished is stale and its callback is never called.
+    """
+
+    def __init__(self, controller):
+        super(Layer_Loader, self).__init__()
+        self.controller = controller
+        self.request_id = 0
+        self.pending = None
+        self.running = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_INTERVAL)
+        self.timer.timeout.connect(self.start_pending)
+
+    def request(self, layer, callback, load_dictionary=True):
+        """Requests the layer to be loaded, replacing any request that was not finished yet.
+
+        Args:
+            layer: the name of the layer.
+            callback: called on the main thread with the layer name and an error message or None after the layer was loaded.
+            load_dictionary: if set the dictionary of the layer is imported as well.
+
+        Returns:
+            the id of the request.
+        """
+        self.request_id += 1
+        self.pending = (self.request_id, layer, callback, load_dictionary)
+        self.timer.start()
+        return self.request_id
+
+    @property
+    def is_loading(self):
+        """True while a request is waiting or being loaded."""
+        return self.pending is not None or self.running is not None
+
+    def start_pending(self):
+        """Starts loading the latest request if no other load is running.
+        Otherwise the request is started once the running load finished.
+        """
+        if self.pending is None or self.running is not None:
+            return
+        request_id, layer, callback, load_dictionary = self.pending
+        self.pending = None
+        # The layer is only changed while no load is running, so the back-end is never read with a half-loaded layer
+        self.controller.visualizer.settings.layer = layer
+        self.thread = QThread()
+        self.worker = Worker(self.controller)
+        self.worker.layer = layer
+        self.worker.load_dictionary = load_dictionary
+        self.worker.moveToThread(self.thread)
+        self.running = (request_id, layer, callback, self.worker)
+        self.thread.started.connect(self.worker.run_load_layer)
+        # Direct connection, so the thread can quit while the main thread waits for it in cancel
+        self.worker.finished.connect(self.thread.quit, Qt.DirectConnection)
+        self.thread.finished.connect(self.finish)
+        self.thread.start()
+
+    def finish(self):
+        """Calls the callback of the finished load unless a newer request replaced it."""
+        if self.running is None:
+            return
+        request_id, layer, callback, worker = self.running
+        self.running = None
+        if self.pending is not None:
+            # A newer request made this load stale, start it unless it is still being debounced
+            if not self.timer.isActive():
+                self.start_pending()
+        elif request_id == self.request_id:
+            callback(layer, worker.error)
+
+    def cancel(self):
+        """Drops all requests and waits for a running load, so a new model does not race with it."""
+        self.timer.stop()
+        self.pending = None
+        self.request_id += 1
+        if self.running is not None:
+            self.thread.wait()
+            self.running = None
@@ -1,12 +1,11 @@
-from backend.util import Screen
+from backend.common import Screen
 from gui.HoverLabel import HoverLabel
+from gui.highlight import Highlight
 from gui.generate_popup import Generate_Popup, Task
+from gui.ui_loader import load_ui
+from gui.display import array_to_pixmap
 import numpy as np
-import os
-import tensorflow as tf
-from PIL.ImageQt import ImageQt
-from PyQt5 import QtWidgets, QtGui, uic, QtCore
-import backend.util as util
+from PyQt5 import QtWidgets, QtGui, QtCore
 
 
 class Layer_Rep_Menu(QtWidgets.QWidget):
@@ -17,9 +16,7 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
     def __init__(self, controller):
         super(Layer_Rep_Menu, self).__init__()
         self.controller = controller
-        path = util.resource_path(os.path.join(
-            'res', 'ui', 'layer_rep_screen.ui'))
-        uic.loadUi(path, self)
+        load_ui(self, 'layer_rep_screen')
 
         back_btn = self.findChild(QtWidgets.QPushButton, "back_btn")
         back_btn.clicked.connect(self.goto_back)
@@ -33,8 +30,12 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
 
         self.filter = self.findChild(QtWidgets.QLabel, "filter")
 
-        self.input_highlight = []
-        self.vis_highlight = []
+        self.input_container = HoverLabel(self)
+        self.vis_container = HoverLabel(self)
+        self.input_container.mouseHover.connect(self.update_input_highlight)
+        self.vis_container.mouseHover.connect(self.update_vis_highlight)
+        self.input_highlight = Highlight(self)
+        self.vis_highlight = Highlight(self)
 
         self.choose_layer = self.findChild(QtWidgets.QComboBox, "choose_layer")
         self.choose_layer.currentTextChanged.connect(self.update_layer)
@@ -45,9 +46,8 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
     def update_ui(self):
         """Resets the UI elements of the screen when it is visited."""
         self.generated = False
+        self.loading = True
         self.remove_prev(delete_all=True)
-        self.input_container = HoverLabel(self)
-        self.vis_container = HoverLabel(self)
         self.filter.clear()
         self.img_size = self.controller.visualizer.settings.input_width * 2
         self.input_container.setFixedSize(self.img_size, self.img_size)
@@ -61,23 +61,59 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
             if layer.out_shape[1] > self.controller.visualizer.settings.input_width:
                 continue
             self.choose_layer.addItem(layer.name)
-        self.input_container.mouseHover.connect(self.update_input_highlight)
-        self.vis_container.mouseHover.connect(self.update_vis_highlight)
 
     def update_input_image(self, img):
         """Updates the display inout image."""
-        self.in_qim = ImageQt(img)
-        self.in_pixmap = QtGui.QPixmap.fromImage(self.in_qim)
-        self.input_container.setPixmap(self.in_pixmap.scaled(
-            self.img_size, self.img_size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation))
+        self.in_pixmap = array_to_pixmap(img, self.img_size)
+        self.input_container.setPixmap(self.in_pixmap)
 
     def update_selected_visualization(self, x, y):
         """Updates the magnification of the feature visualization the mouse is currently hovering over."""
-        vis = self.controller.visualizer.get_filter_visualization(x, y, 1)
-        vis_qim = ImageQt(vis[0])
-        vis_pixmap = QtGui.QPixmap.fromImage(vis_qim)
-        self.filter.setPixmap(vis_pixmap.scaled(
-            100, 100, QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation))
+        vis, filter_idx = self.controller.visualizer.get_filter_visualizations(
+            x, y, 1)
+        self.filter.setPixmap(self.controller.pixmap_cache.get_or_create(
+            ("filter", self.controller.visualizer.settings.layer, filter_idx[0], 100), lambda: array_to_pixmap(vis[0], 100)))
+
+    def start_canvas(self):
+        """Clears the layer representation before the tiles of a new one are painted."""
+        layer = self.controller.visualizer.settings.get_layer_by_name(
+            self.controller.visualizer.settings.layer)
+        self.tile_count = (layer.out_shape[1], layer.out_shape[2])
+        self.canvas = QtGui.QPixmap(self.img_size, self.img_size)
+        self.canvas.fill(QtCore.Qt.black)
+        self.vis_container.setPixmap(self.canvas)
+
+    def paint_tiles(self, tiles):
+        """Paints a batch of finished tiles of the layer representation while the rest is still generated.
+        The canvas is shown once per batch, so streaming stays cheaper than painting the final image.
+
+        Args:
+            tiles: list of (row, column, image) tuples.
+        """
+        height = self.img_size / self.tile_count[0]
+        width = self.img_size / self.tile_count[1]
+        # Tiles showing the same filter share their array, so each is converted once
+        pixmaps = dict()
+        painter = QtGui.QPainter(self.canvas)
+        for row, col, img in tiles:
+            if id(img) not in pixmaps:
+                pixmaps[id(img)] = array_to_pixmap(img)
+            painter.drawPixmap(QtCore.QRectF(col * width, row * height, width, height),
+                               pixmaps[id(img)], QtCore.QRectF(0, 0, img.shape[1], img.shape[0]))
+        painter.end()
+        self.vis_container.setPixmap(self.canvas)
+
+    def show_result(self, result):
+        """Displays the completed layer representation and the (Grad-CAM) input image.
+
+        Args:
+            result: tuple of the layer representation and the input image.
+        """
+        self.img_array, input_img = result
+        self.update_input_image(input_img)
+        self.vis_pixmap = array_to_pixmap(self.img_array)
+        self.vis_container.setPixmap(self.vis_pixmap)
+        self.generated = True
 
     def export_image(self):
         """Exports the layer representation image."""
@@ -88,12 +124,17 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
         if path[0] == "":
             return
         export = np.copy(self.img_array)
+        # TensorFlow is imported lazily to keep the start of the application fast
+        import tensorflow as tf
         tf.keras.utils.save_img(path[0], export)
+        self.controller.visualizer.export_activations()
 
     def generate_visualization(self):
         """Starts the task to generate the layer representation on a new thread.
         Displays the progress popup during the process.
         """
+        if self.loading:
+            return
         self.popup = Generate_Popup(
             self.controller, Task.LAYER_REP, target=self.target_choice.isChecked())
         self.popup.setWindowFlags(
@@ -102,16 +143,30 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
 
     def update_layer(self, value):
         """When the user selects an different layer the current visualization and highlights are reset.
-        Additionally the visualization for the new layer are imported from the harddrive.
+        The activations and the visualizations for the new layer are loaded on a second thread,
+        a placeholder is displayed until they arrive.
         """
         if value == "":
             return
-        self.controller.visualizer.settings.layer = value
-        self.controller.visualizer.update_activations()
-        self.controller.visualizer.update_dictionary(value)
-        self.vis_container.clear()
-        self.remove_prev(delete_all=True)
+        self.loading = True
         self.generated = False
+        self.remove_prev(delete_all=True)
+        self.filter.clear()
+        self.vis_container.setText("Loading layer...")
+        self.controller.layer_loader.request(value, self.finish_layer)
+
+    def finish_layer(self, value, error):
+        """Sets up the grids of the loaded layer.
+
+        Args:
+            value: the name of the loaded layer.
+            error: the error message if the layer could not be loaded.
+        """
+        self.vis_container.clear()
+        if error is not None:
+            self.vis_container.setText(error)
+            return
+        self.controller.pixmap_cache.invalidate("filter")
         self.input_grid = []
         self.vis_grid = []
         input_shape = self.controller.visualizer.settings.input_width
@@ -125,36 +180,35 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
                 ) + i * self.size, self.input_container.y() + j * self.size))
                 self.vis_grid[i].append(
                     (self.vis_container.x() + i * self.size, self.vis_container.y() + j * self.size))
+        self.input_container.set_grid(
+            self.size, layer.out_shape[1], layer.out_shape[2])
+        self.vis_container.set_grid(
+            self.size, layer.out_shape[1], layer.out_shape[2])
+        self.loading = False
 
     def update_input_highlight(self, value, vis_grid_pos=None, rec=False):
-        """Displays the highlight on the input image when the mouse is moved on the displayed input image.
+        """Moves the highlight on the input image when the mouse is moved on the displayed input image.
         Also calls the update function for the highlight on the layer representation if it was generated yet.
         """
+        if self.loading:
+            return
         grid_pos = None
         if value:
             if vis_grid_pos is None:
-                grid_pos = self.get_grid_position(self.sender().event)
+                grid_pos = self.input_container.cell
             else:
                 grid_pos = vis_grid_pos
             x = grid_pos[0]
             y = grid_pos[1]
-            self.opacity_effect = QtWidgets.QGraphicsOpacityEffect()
-            self.opacity_effect.setOpacity(0.3)
-            self.input_highlight.append(QtWidgets.QLabel(self))
-            self.input_highlight[-1].setStyleSheet("background-color: orange")
-            self.input_highlight[-1].setGeometry(
-                self.input_grid[x][y][0], self.input_grid[x][y][1], self.size, self.size)
-            self.input_highlight[-1].setGraphicsEffect(self.opacity_effect)
-            self.input_highlight[-1].show()
+            self.input_highlight.move_to(
+                self.input_grid[x][y][0], self.input_grid[x][y][1], self.size)
             if self.generated:
                 self.update_selected_visualization(x, y)
-        else:
-            self.remove_prev()
         if not rec:
             self.update_vis_highlight(value, grid_pos, True)
 
     def update_vis_highlight(self, value, input_grid_pos=None, rec=False):
-        """Displays the highlight on the layer representation when the mouse is moved on the displayed visualization.
+        """Moves the highlight on the layer representation when the mouse is moved on the displayed visualization.
         Also calls the update function for the highlight on the input image.
         """
         if not self.generated:
@@ -162,49 +216,22 @@ class Layer_Rep_Menu(QtWidgets.QWidget):
         grid_pos = None
         if value:
             if input_grid_pos is None:
-                grid_pos = self.get_grid_position(self.sender().event)
+                grid_pos = self.vis_container.cell
             else:
                 grid_pos = input_grid_pos
             x = grid_pos[0]
             y = grid_pos[1]
-            self.opacity_effect = QtWidgets.QGraphicsOpacityEffect()
-            self.opacity_effect.setOpacity(0.3)
-            self.vis_highlight.append(QtWidgets.QLabel(self))
-            self.vis_highlight[-1].setStyleSheet("background-color: orange")
-            self.vis_highlight[-1].setGeometry(
-                self.vis_grid[x][y][0], self.vis_grid[x][y][1], self.size, self.size)
-            self.vis_highlight[-1].setGraphicsEffect(self.opacity_effect)
-            self.vis_highlight[-1].show()
+            self.vis_highlight.move_to(
+                self.vis_grid[x][y][0], self.vis_grid[x][y][1], self.size)
             self.update_selected_visualization(x, y)
-        else:
-            self.remove_prev()
         if not rec:
             self.update_input_highlight(value, grid_pos, True)
 
     def remove_prev(self, delete_all=False):
-        """Removes previous highlights from the list. Clears all highlights if delete_all is set."""
-        while len(self.input_highlight) > 1:
-            self.input_highlight[0].deleteLater()
-            self.input_highlight.remove(self.input_highlight[0])
-        while len(self.vis_highlight) > 1:
-            self.vis_highlight[0].deleteLater()
-            self.vis_highlight.remove(self.vis_highlight[0])
+        """Keeps the highlights at the last hovered position. Hides them if delete_all is set."""
         if delete_all:
-            if len(self.vis_highlight) > 0:
-                self.vis_highlight[0].deleteLater()
-            if len(self.input_highlight) > 0:
-                self.input_highlight[0].deleteLater()
-            self.vis_highlight = []
-            self.input_highlight = []
-
-    def get_grid_position(self, mouse_position):
-        """Converts the mouse position on the displayed images to a coordinate.
-        This coordinate is used to determine which feature visualization is displayed
-        in the magnified view underneath the layer representation.
-        """
-        x = mouse_position.x() // self.size
-        y = mouse_position.y() // self.size
-        return (x, y)
+            self.input_highlight.hide()
+            self.vis_highlight.hide()
 
     def goto_back(self):
         """Switches back to the main menu."""
@@ -1,10 +1,12 @@
-from backend.util import Screen
-from PyQt5 import QtWidgets, QtGui, uic
-from PyQt5.QtCore import Qt
+from backend.common import Screen, resource_path
+from PyQt5 import QtWidgets, QtGui
+from PyQt5.QtCore import Qt, QThread
 import os
 
-import backend.util as util
-from gui.generate_popup import Generate_Popup, Task
+from gui.ui_loader import load_ui
+from backend.scheduler import Priority
+from backend.compute_server import BACKGROUND
+from gui.worker import Worker
 
 
 class Main_Menu(QtWidgets.QWidget):
@@ -18,13 +20,15 @@ class Main_Menu(QtWidgets.QWidget):
         super(Main_Menu, self).__init__()
         self.controller = controller
         self.setWindowTitle("XAI Viz")
-        path = util.resource_path(os.path.join('res', 'ui', 'main_window.ui'))
-        uic.loadUi(path, self)
+        load_ui(self, 'main_window')
         self.loading_lbl = self.findChild(QtWidgets.QLabel, "loading_lbl")
         self.buttons = dict()
         self.init_buttons()
         self.input = False
         self.dictionary = False
+        self.warming_up = False
+        # Output directories of the queued dictionary builds, by job id
+        self.dictionary_jobs = dict()
 
     def init_buttons(self):
         """Imports the UI elements from the ui file and connects them with their corresponding functions."""
@@ -64,6 +68,13 @@ class Main_Menu(QtWidgets.QWidget):
             QtWidgets.QPushButton, "import_settings_btn")
         self.buttons["import_sett"].clicked.connect(self.import_settings)
 
+        self.buttons["jobs"] = self.findChild(
+            QtWidgets.QPushButton, "jobs_btn")
+        self.buttons["jobs"].clicked.connect(self.show_jobs)
+
+        self.tflite = self.findChild(QtWidgets.QCheckBox, "tflite")
+        self.tflite.stateChanged.connect(self.update_tflite)
+
     def load_network(self):
         """Tries to load a Keras model from the given path.
         Initializes model information in the backend on success.
@@ -73,9 +84,17 @@ class Main_Menu(QtWidgets.QWidget):
         if path == "":
             self.loading_lbl.setVisible(False)
             return
+        self.stop_warmup()
+        self.controller.layer_loader.cancel()
+        # Jobs of the previous model must not run on the new one
+        self.controller.visualizer.scheduler.cancel_all()
+        self.controller.visualizer.scheduler.wait()
         try:
+            # Waits for the back-end if it is still being imported in the background
+            util = self.controller.backend_module("backend.util")
             model = util.load_model(path)
-            self.controller.visualizer.settings.init_model(model)
+            self.controller.visualizer.settings.init_model(model, path)
+            self.controller.pixmap_cache.clear()
             self.show_checkmark(True)
             self.enable_model_buttons()
         except (TypeError, OSError) as err:
@@ -84,8 +103,50 @@ class Main_Menu(QtWidgets.QWidget):
             msg.setIcon(QtWidgets.QMessageBox.Critical)
             msg.setText(repr(err))
             msg.exec_()
+            self.loading_lbl.setVisible(False)
+            return
+        # The registry of the new model has no interpreter yet
+        self.update_tflite(Qt.Checked if self.controller.visualizer.settings.use_tflite else Qt.Unchecked)
+
+        self.start_warmup()
+
+    def start_warmup(self):
+        """Traces the commonly used functions of the imported model on a second thread.
+        The screens stay usable while the warm-up runs, the first interaction just skips the tracing if it finished before.
+        """
+        self.warmup_count = self.controller.visualizer.warm_up_count()
+        self.loading_lbl.setText(f"Warming up... 0/{self.warmup_count}")
+        self.warming_up = True
+        self.warmup_thread = QThread()
+        self.warmup_worker = Worker(self.controller)
+        self.warmup_worker.moveToThread(self.warmup_thread)
+        self.warmup_thread.started.connect(self.warmup_worker.run_warmup)
+        self.warmup_worker.progress.connect(self.report_warmup_progress)
+        # Direct connection, so the thread can quit while the main thread waits for it in stop_warmup
+        self.warmup_worker.finished.connect(
+            self.warmup_thread.quit, Qt.DirectConnection)
+        self.warmup_worker.finished.connect(self.warmup_worker.deleteLater)
+        self.warmup_thread.finished.connect(self.finish_warmup)
+        self.warmup_thread.finished.connect(self.warmup_thread.deleteLater)
+        self.warmup_thread.start()
+
+    def report_warmup_progress(self, value):
+        """Shows the number of finished warm-up tasks."""
+        self.loading_lbl.setText(f"Warming up... {value}/{self.warmup_count}")
 
+    def stop_warmup(self):
+        """Cancels a running warm-up and waits for it to stop, so a new model does not race with it."""
+        if not self.warming_up:
+            return
+        self.warmup_worker.stop()
+        self.warmup_thread.wait()
+        self.warming_up = False
+
+    def finish_warmup(self):
+        """Hides the loading label after the warm-up finished or was cancelled."""
+        self.warming_up = False
         self.loading_lbl.setVisible(False)
+        self.loading_lbl.setText("Loading...")
 
     def load_input(self):
         """Tries to load an input image from the given path."""
@@ -105,39 +166,99 @@ class Main_Menu(QtWidgets.QWidget):
             msg.exec_()
 
     def import_settings(self):
-        """Tries to load a settings file from the given path."""
+        """Tries to load a settings file or tuned per-layer profiles (.json) from the given path."""
         path = QtWidgets.QFileDialog.getOpenFileName()[0]
         if path == "":
             return
         try:
-            self.controller.visualizer.update_settings(path)
-        except (TypeError, OSError) as err:
+            messages = self.controller.visualizer.update_settings(
+                path, self.confirm_cores)
+            self.update_tflite(
+                Qt.Checked if self.controller.visualizer.settings.use_tflite else Qt.Unchecked)
+            if messages:
+                msg = QtWidgets.QMessageBox()
+                msg.setWindowTitle("Compute Resources")
+                msg.setIcon(QtWidgets.QMessageBox.Information)
+                msg.setText("\n".join(messages))
+                msg.exec_()
+        except (TypeError, OSError, ValueError) as err:
+            msg = QtWidgets.QMessageBox()
+            msg.setWindowTitle("Error")
+            msg.setIcon(QtWidgets.QMessageBox.Critical)
+            msg.setText(repr(err))
+            msg.exec_()
+
+    def update_tflite(self, state):
+        """Switches the forward-only computations between the TFLite interpreter and the Keras model."""
+        visualizer = self.controller.visualizer
+        visualizer.settings.use_tflite = state == Qt.Checked
+        try:
+            visualizer.apply_inference_backend()
+        except Exception as err:
+            # The conversion can fail in many ways, the Keras model keeps working in any case
+            visualizer.disable_inference_backend()
             msg = QtWidgets.QMessageBox()
             msg.setWindowTitle("Error")
             msg.setIcon(QtWidgets.QMessageBox.Critical)
             msg.setText(repr(err))
             msg.exec_()
+        self.controller.pixmap_cache.clear()
+        self.show_tflite()
+
+    def show_tflite(self):
+        """Shows whether the TFLite interpreter is used without triggering update_tflite."""
+        self.tflite.blockSignals(True)
+        self.tflite.setChecked(self.controller.visualizer.settings.use_tflite)
+        self.tflite.blockSignals(False)
+
+    def confirm_cores(self, cores):
+        """Asks whether the core set of an imported settings file should be used on this machine."""
+        answer = QtWidgets.QMessageBox.question(
+            self, "Compute Resources",
+            "The settings file pins the computations to the cores " +
+            (",".join(str(core) for core in cores) if cores is not None else "all") +
+            ". Use this core set on this machine?")
+        return answer == QtWidgets.QMessageBox.Yes
 
     def generate_dictionary(self, path):
-        """Starts the process for generating visualizations for each filter in the 
-        convolution layers of the network. Displays the progress popup during the process.
+        """Queues a background job generating visualizations for each filter in the 
+        convolution layers of the network. The progress is displayed in the jobs panel,
+        the dictionary is used once the job completed.
         """
-        self.popup = Generate_Popup(
-            self.controller, Task.DICTIONARY, path=path)
-        self.popup.setWindowFlags(
-            self.popup.windowFlags() & ~Qt.WindowContextHelpButtonHint)
-        self.popup.exec_()
-        if len(self.controller.visualizer.dictionary.dictionary) > 0:
-            self.dictionary = True
-            self.enable_input_buttons()
+        visualizer = self.controller.visualizer
+        # The build keeps the settings of this moment while the user continues to change them
+        settings = visualizer.settings.snapshot()
+        job = self.controller.jobs_panel.submit(
+            f"Dictionary ({os.path.basename(path)})",
+            lambda job: visualizer.remote(
+                "build_dictionary", path, worker=job, channel=BACKGROUND, settings=settings),
+            Priority.BACKGROUND, len(visualizer.settings.conv_layers), visualizer.gate)
+        self.dictionary_jobs[job.id] = path
+
+    def finish_job(self, job):
+        """Uses the dictionary of a completed dictionary build."""
+        path = self.dictionary_jobs.pop(job.id, None)
+        if path is None or not job.completed:
+            return
+        self.controller.visualizer.settings.set_dict_path(path)
+        self.controller.pixmap_cache.invalidate("filter")
+        self.dictionary = True
+        self.enable_input_buttons()
+
+    def show_jobs(self):
+        """Shows the jobs panel."""
+        self.controller.jobs_panel.show()
+        self.controller.jobs_panel.raise_()
 
     def export_dictionary(self):
         """Exports the generated filter visualizations to the given path."""
         path = QtWidgets.QFileDialog.getExistingDirectory()
+        if path == "":
+            return
         try:
-            self.controller.visualizer.settings.set_dict_path(path)
+            self.controller.visualizer.check_dictionary_path(path)
             self.generate_dictionary(path)
-        except (TypeError, OSError) as err:
+        except (TypeError, OSError, ValueError) as err:
             msg = QtWidgets.QMessageBox()
             msg.setWindowTitle("Error")
             msg.setIcon(QtWidgets.QMessageBox.Critical)
@@ -150,12 +271,16 @@ class Main_Menu(QtWidgets.QWidget):
         if path == "":
             return
         try:
+            settings = self.controller.visualizer.settings
+            layer = settings.conv_layers[0].name
             self.controller.visualizer.dictionary.import_dictionary(
-                path, self.controller.visualizer.settings.conv_layers[0].name)
+                path, layer, settings.model_fingerprint,
+                settings.settings_for_layer(layer).fingerprint())
+            self.controller.pixmap_cache.invalidate("filter")
             self.dictionary = True
             self.controller.visualizer.settings.set_dict_path(path)
             self.enable_input_buttons()
-        except (TypeError, OSError) as err:
+        except (TypeError, OSError, ValueError) as err:
             msg = QtWidgets.QMessageBox()
             msg.setWindowTitle("Error")
             msg.setIcon(QtWidgets.QMessageBox.Critical)
@@ -169,6 +294,8 @@ class Main_Menu(QtWidgets.QWidget):
         self.buttons["generate"].setEnabled(True)
         self.buttons["import"].setEnabled(True)
         self.buttons["import_sett"].setEnabled(True)
+        self.buttons["jobs"].setEnabled(True)
+        self.tflite.setEnabled(True)
 
     def enable_input_buttons(self):
         """Enables buttons for actions that can only be performed after an input image is imported successfully."""
@@ -181,7 +308,7 @@ class Main_Menu(QtWidgets.QWidget):
     def show_checkmark(self, model):
         """Displays a checkmark to give the user feedback for successfully importing a model or an input image."""
         label = QtWidgets.QLabel(self)
-        path = util.resource_path(os.path.join("res", "checkmark.png"))
+        path = resource_path(os.path.join("res", "checkmark.png"))
         pixmap = QtGui.QPixmap(path)
 
         label.setPixmap(pixmap.scaled(
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+import itertools
+
+DEFAULT_BUDGET = 64 * 2**20
+
+
+class Pixmap_Cache:
+    """LRU cache for the pixmaps shown on the screens.
+    Keys are tuples starting with a namespace, e.g. ("filter", layer, filter index, display size)
+    for dictionary images or ("group", result id, group index) for generated results.
+    The least recently used pixmaps are evicted once the cached pixmaps exceed the byte budget.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        """
+        Args:
+            budget: the number of bytes the cached pixmaps may occupy.
+        """
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.result_ids = itertools.count()
+
+    def get(self, key):
+        """Looks up the pixmap stored for the given key.
+
+        Returns:
+            the cached pixmap or None.
+        """
+        pixmap = self.entries.get(key)
+        if pixmap is not None:
+            self.entries.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        """Stores the given pixmap and evicts the least recently used pixmaps if the budget is exceeded.
+
+        Returns:
+            the stored pixmap.
+        """
+        if key in self.entries:
+            self.size -= pixmap_bytes(self.entries.pop(key))
+        self.entries[key] = pixmap
+        self.size += pixmap_bytes(pixmap)
+        while self.size > self.budget and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= pixmap_bytes(evicted)
+        return pixmap
+
+    def get_or_create(self, key, build):
+        """Gets the pixmap for the given key, creating it on a cache miss.
+
+        Args:
+            key: the key of the pixmap.
+            build: function without arguments creating the pixmap.
+
+        Returns:
+            the pixmap.
+        """
+        pixmap = self.get(key)
+        if pixmap is None:
+            pixmap = self.put(key, build())
+        return pixmap
+
+    def new_result_id(self):
+        """Creates an id for a newly generated result, so its pixmaps are never confused with those of an earlier result."""
+        return next(self.result_ids)
+
+    def invalidate(self, namespace):
+        """Removes all pixmaps of the given namespace, e.g. when the layer or the dictionary changed."""
+        for key in [key for key in self.entries if key[0] == namespace]:
+            self.size -= pixmap_bytes(self.entries.pop(key))
+
+    def clear(self):
+        """Removes all cached pixmaps."""
+        self.entries.clear()
+        self.size = 0
+
+
+def pixmap_bytes(pixmap):
+    """Calculates the memory occupied by the given pixmap."""
+    return pixmap.width() * pixmap.height() * max(1, pixmap.depth()) // 8
@@ -1,12 +1,14 @@
-from tensorflow import keras
-from PyQt5 import QtWidgets, QtGui, uic, QtCore
+from PyQt5 import QtWidgets, QtGui, QtCore
+from PyQt5.QtCore import QThread
 import re
-import os
 from PIL import Image
-from PIL.ImageQt import ImageQt
 
-from backend.util import Screen
-import backend.util as util
+from backend.common import Screen
+from gui.generate_popup import Generate_Popup, Task
+from gui.ui_loader import load_ui
+from gui.sweep_popup import Sweep_Popup
+from gui.worker import Worker
+from gui.display import array_to_pixmap
 
 
 class Sample_Menu(QtWidgets.QWidget):
@@ -22,9 +24,8 @@ class Sample_Menu(QtWidgets.QWidget):
         self.img_array = None
         self.neuron_enabled = False
         self.neuron = 0
-        path = util.resource_path(os.path.join(
-            'res', 'ui', 'sample_screen.ui'))
-        uic.loadUi(path, self)
+        self.generating = False
+        load_ui(self, 'sample_screen')
         self.init_elements()
 
     def init_elements(self):
@@ -68,8 +69,17 @@ class Sample_Menu(QtWidgets.QWidget):
         back_btn = self.findChild(QtWidgets.QPushButton, "back_btn")
         back_btn.clicked.connect(self.goto_main)
 
-        generate_btn = self.findChild(QtWidgets.QPushButton, "generate_btn")
-        generate_btn.clicked.connect(self.generate_visualization)
+        self.generate_btn = self.findChild(
+            QtWidgets.QPushButton, "generate_btn")
+        self.generate_btn.clicked.connect(self.generate_visualization)
+
+        sweep_btn = self.findChild(QtWidgets.QPushButton, "sweep_btn")
+        sweep_btn.clicked.connect(self.sweep_settings)
+        self.sweep_regularizers = self.findChild(
+            QtWidgets.QCheckBox, "sweep_regularizers")
+
+        tune_btn = self.findChild(QtWidgets.QPushButton, "tune_btn")
+        tune_btn.clicked.connect(self.tune_settings)
 
     def export_image(self):
         """Exports the generated visualization to the selected path."""
@@ -79,7 +89,7 @@ class Sample_Menu(QtWidgets.QWidget):
             self, "Export Image", "filter", "PNG (*.png)")[0]
         if path == "":
             return
-        keras.preprocessing.image.save_img(path, self.img_array)
+        Image.fromarray(self.img_array).save(path)
 
     def export_settings(self):
         """Exports the current feature visualization settings."""
@@ -90,17 +100,109 @@ class Sample_Menu(QtWidgets.QWidget):
         self.controller.visualizer.export_settings(path)
 
     def generate_visualization(self):
-        """Generates and displays a visualization for the selected filter."""
-        if not self.neuron_enabled:
-            self.img_array = self.controller.visualizer.visualize_filter()
-        else:
-            self.img_array = self.controller.visualizer.visualize_neuron(
-                self.neuron)
-        img = Image.fromarray(self.img_array)
-        qim = ImageQt(img)
-        pixmap = QtGui.QPixmap.fromImage(qim)
-        self.vis_container.setPixmap(pixmap.scaled(
-            350, 350, QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation))
+        """Generates the visualization for the selected filter on a second thread and displays intermediate images while it runs.
+        Clicking the button again stops the generation and keeps the current image.
+        """
+        if self.generating:
+            self.worker.stop()
+            return
+        self.generating = True
+        self.generate_btn.setText("Stop")
+        self.thread = QThread()
+        self.worker = Worker(self.controller)
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.run_visualize_sample)
+        self.worker.preview.connect(self.show_visualization)
+        self.worker.finished.connect(self.thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.thread.finished.connect(self.finish_visualization)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.start()
+
+    def show_visualization(self, img_array):
+        """Displays the given (intermediate) visualization."""
+        self.img_array = img_array
+        self.vis_container.setPixmap(array_to_pixmap(self.img_array, 350))
+
+    def finish_visualization(self):
+        """Resets the generate button after the generation finished or was stopped."""
+        self.generating = False
+        self.generate_btn.setText("Generate")
+
+    def sweep_settings(self):
+        """Generates visualizations of the selected filter for every combination of the comma separated
+        values entered for learning rate, iterations and kernel size and displays them in a labelled grid.
+        """
+        try:
+            learning_rates = self.parse_values(self.learning_rate.text(), float)
+            iterations = self.parse_values(self.iterations.text(), int)
+            kernel_sizes = self.parse_values(self.kernel.text(), int)
+        except ValueError as err:
+            msg = QtWidgets.QMessageBox()
+            msg.setWindowTitle("Error")
+            msg.setIcon(QtWidgets.QMessageBox.Critical)
+            msg.setText(repr(err))
+            msg.exec_()
+            return
+        settings = self.controller.visualizer.settings
+        # Fall back to the current settings for empty fields
+        learning_rates = learning_rates or [settings.learning_rate]
+        iterations = iterations or [settings.iterations]
+        kernel_sizes = kernel_sizes or [settings.blur_kernel_size]
+        sweep = self.controller.backend_module("backend.sweep")
+        sweep_regularizers = self.sweep_regularizers.isChecked()
+        self.sweep_params = (learning_rates, iterations,
+                             kernel_sizes, sweep_regularizers)
+        self.sweep_count = sweep.count_configurations(learning_rates, iterations, kernel_sizes, sweep.regularizer_options(
+            settings, sweep_regularizers))
+        self.sweep_results = []
+        self.popup = Generate_Popup(self.controller, Task.SWEEP)
+        self.popup.setWindowFlags(
+            self.popup.windowFlags() & ~QtCore.Qt.WindowContextHelpButtonHint)
+        self.popup.exec_()
+        if len(self.sweep_results) > 0:
+            self.sweep_popup = Sweep_Popup(self.sweep_results)
+            self.sweep_popup.exec_()
+
+    def tune_settings(self):
+        """Searches the cheapest settings for each convolution layer and exports them as a profile.
+        The profiles are used for the next dictionary generation and can be imported again from the main menu.
+        """
+        self.popup = Generate_Popup(self.controller, Task.TUNE)
+        self.popup.setWindowFlags(
+            self.popup.windowFlags() & ~QtCore.Qt.WindowContextHelpButtonHint)
+        self.popup.exec_()
+        if not self.popup.worker.completed:
+            return
+        if len(self.popup.worker.untuned) > 0:
+            msg = QtWidgets.QMessageBox()
+            msg.setWindowTitle("Auto-Tune")
+            msg.setIcon(QtWidgets.QMessageBox.Warning)
+            msg.setText("No schedule reached the quality target for the layers " +
+                        ", ".join(self.popup.worker.untuned) +
+                        ". They keep the current settings, try a higher iteration budget.")
+            msg.exec_()
+        path = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export Profiles", "profiles", "JSON (*.json)")[0]
+        if path == "":
+            return
+        self.controller.visualizer.export_profiles(path)
+
+    def parse_values(self, text, value_type):
+        """Parses a comma separated list of positive values.
+
+        Args:
+            text: the text entered by the user.
+            value_type: the type of the values.
+
+        Returns:
+            list of the parsed values.
+        """
+        values = [value_type(value)
+                  for value in text.split(",") if value.strip() != ""]
+        if any(value <= 0 for value in values):
+            raise ValueError("Sweep values have to be positive")
+        return values
 
     def update_filter(self, value):
         """Updates the selected filter."""
@@ -0,0 +1,30 @@
+from PyQt5 import QtWidgets, QtGui, QtCore
+
+from gui.display import array_to_pixmap
+
+
+class Sweep_Popup(QtWidgets.QDialog):
+    """GUI class for the popup displaying the results of a settings sweep as a labelled grid."""
+
+    def __init__(self, results, columns=4, img_size=180):
+        super(Sweep_Popup, self).__init__()
+        self.setWindowTitle("Sweep Results")
+        self.setWindowFlags(self.windowFlags() & ~
+                            QtCore.Qt.WindowContextHelpButtonHint)
+        self.resize(columns * (img_size + 40), 720)
+        content = QtWidgets.QWidget()
+        grid = QtWidgets.QGridLayout(content)
+        for i, result in enumerate(results):
+            cell = QtWidgets.QVBoxLayout()
+            img_label = QtWidgets.QLabel()
+            img_label.setPixmap(array_to_pixmap(result.img, img_size))
+            text_label = QtWidgets.QLabel(result.label)
+            text_label.setWordWrap(True)
+            text_label.setFixedWidth(img_size)
+            cell.addWidget(img_label)
+            cell.addWidget(text_label)
+            grid.addLayout(cell, i // columns, i % columns)
+        scroll = QtWidgets.QScrollArea()
+        scroll.setWidget(content)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(scroll)
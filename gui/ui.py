@@ -1,11 +1,10 @@
 import sys
-from backend.util import Screen
+import importlib
+import threading
+from backend.common import Screen
 import gui.main_menu as main_menu
-import gui.grouped_menu as grouped_menu
-import gui.layer_rep_menu as layer_rep_menu
-import gui.filter_acts_menu as filter_acts_menu
-import gui.sample_menu as sample_menu
-from backend.visualizer import Visualizer
+from gui.pixmap_cache import Pixmap_Cache
+from gui.layer_loader import Layer_Loader
 from PyQt5 import QtWidgets
 import qdarkstyle
 import os
@@ -15,6 +14,9 @@ class Ui:
     Creates and initializes the available screens.
     The communication between backend and frontend is performed through the visualizer
     object created in this class.
+
+    To show the main menu as fast as possible the back-end (TensorFlow, OpenCV, sklearn, ...)
+    is imported on a background thread and the other screens are created when they are visited first.
     """
 
     def __init__(self):
@@ -26,23 +28,110 @@ class Ui:
         self.screen_width = 1280
         self.screen_height = 720
         self.screens.setFixedSize(self.screen_width, self.screen_height)
+        self.lazy_screens = dict()
+        self.pixmap_cache = Pixmap_Cache()
+        self.layer_loader = Layer_Loader(self)
+        self._jobs_panel = None
+        self.backend_error = None
+        self._visualizer = None
+        self.backend_thread = threading.Thread(
+            target=self.load_backend, daemon=True)
+        self.backend_thread.start()
         self.init_screens()
         self.screens.show()
-        self.visualizer = Visualizer()
         sys.exit(app.exec_())
 
+    def load_backend(self):
+        """Imports the back-end and creates the visualizer. Runs on a background thread."""
+        try:
+            import backend.visualizer as visualizer
+            self._visualizer = visualizer.Visualizer()
+            # The generation tasks can be moved into a separate compute process to keep the interface responsive
+            if os.environ.get("XAI_VIZ_COMPUTE_SERVER") == "1":
+                self._visualizer.enable_compute_server()
+        except Exception as err:
+            self.backend_error = err
+
+    @property
+    def visualizer(self):
+        """The visualizer object. Waits for the back-end if it is still being imported."""
+        self.backend_thread.join()
+        if self.backend_error is not None:
+            raise self.backend_error
+        return self._visualizer
+
+    def backend_module(self, name):
+        """Gets the given back-end module after the back-end was imported.
+
+        Args:
+            name: the name of the module.
+
+        Returns:
+            the imported module.
+        """
+        self.backend_thread.join()
+        return importlib.import_module(name)
+
     def init_screens(self):
-        """Creates the available screens."""
+        """Creates the main screen. The other screens are created on their first visit."""
         self.main_screen = main_menu.Main_Menu(self)
-        self.sample_screen = sample_menu.Sample_Menu(self)
-        self.filter_acts_screen = filter_acts_menu.Filter_Acts_Menu(self)
-        self.layer_rep_screen = layer_rep_menu.Layer_Rep_Menu(self)
-        self.grouped_screen = grouped_menu.Grouped_Menu(self)
         self.screens.addWidget(self.main_screen)
-        self.screens.addWidget(self.sample_screen)
-        self.screens.addWidget(self.filter_acts_screen)
-        self.screens.addWidget(self.layer_rep_screen)
-        self.screens.addWidget(self.grouped_screen)
+
+    def get_screen(self, screen):
+        """Gets the given screen and creates it on first use.
+
+        Args:
+            screen: the type of the screen.
+
+        Returns:
+            the screen widget.
+
+        Raises:
+            ValueError: if the screen is not created lazily.
+        """
+        if screen not in self.lazy_screens:
+            if screen == Screen.SAMPLE:
+                import gui.sample_menu as sample_menu
+                widget = sample_menu.Sample_Menu(self)
+            elif screen == Screen.FILTER_ACTS:
+                import gui.filter_acts_menu as filter_acts_menu
+                widget = filter_acts_menu.Filter_Acts_Menu(self)
+            elif screen == Screen.LAYER_REP:
+                import gui.layer_rep_menu as layer_rep_menu
+                widget = layer_rep_menu.Layer_Rep_Menu(self)
+            elif screen == Screen.GROUPED:
+                import gui.grouped_menu as grouped_menu
+                widget = grouped_menu.Grouped_Menu(self)
+            else:
+                raise ValueError(f"{screen} is not a lazily created screen")
+            self.screens.addWidget(widget)
+            self.lazy_screens[screen] = widget
+        return self.lazy_screens[screen]
+
+    @property
+    def jobs_panel(self):
+        """The non-modal panel listing the jobs of the scheduler, created on first use."""
+        if self._jobs_panel is None:
+            import gui.jobs_panel as jobs_panel
+            self._jobs_panel = jobs_panel.Jobs_Panel(self)
+            self._jobs_panel.job_finished.connect(self.main_screen.finish_job)
+        return self._jobs_panel
+
+    @property
+    def sample_screen(self):
+        return self.get_screen(Screen.SAMPLE)
+
+    @property
+    def filter_acts_screen(self):
+        return self.get_screen(Screen.FILTER_ACTS)
+
+    @property
+    def layer_rep_screen(self):
+        return self.get_screen(Screen.LAYER_REP)
+
+    @property
+    def grouped_screen(self):
+        return self.get_screen(Screen.GROUPED)
 
     def switch_screen(self, new_screen):
         """Switches to the given screen. Updates the UI elements on that screen if necessary."""
@@ -60,4 +149,3 @@ class Ui:
         if new_screen == Screen.GROUPED:
             self.grouped_screen.update_ui()
             self.screens.setCurrentWidget(self.grouped_screen)
-
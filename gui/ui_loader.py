@@ -0,0 +1,68 @@
+import glob
+import importlib
+import os
+from PyQt5 import uic
+
+from backend.common import resource_path
+
+"""Loads the screens from precompiled UI classes.
+Run "python -m gui.ui_loader" to compile the .ui files in res/ui into gui/compiled.
+If no up-to-date compiled class exists the .ui file is parsed at runtime instead.
+"""
+
+COMPILED_PACKAGE = "gui.compiled"
+
+
+def ui_file(name):
+    """Get the path of the .ui file with the given name."""
+    return resource_path(os.path.join('res', 'ui', name + '.ui'))
+
+
+def load_ui(widget, name):
+    """Sets up the given widget from the UI definition with the given name.
+
+    Args:
+        widget: the widget to be set up.
+        name: the name of the .ui file without extension.
+    """
+    try:
+        module = importlib.import_module(COMPILED_PACKAGE + "." + name)
+    except ImportError:
+        module = None
+    if module is not None and not is_outdated(module, name):
+        ui_class = next(value for key, value in vars(module).items()
+                        if key.startswith("Ui_"))
+        widget.ui = ui_class()
+        widget.ui.setupUi(widget)
+    else:
+        uic.loadUi(ui_file(name), widget)
+
+
+def is_outdated(module, name):
+    """Checks whether the .ui file was changed after the module was compiled.
+
+    Args:
+        module: the compiled module.
+        name: the name of the .ui file without extension.
+
+    Returns:
+        True if the compiled module is older than the .ui file.
+    """
+    module_path = getattr(module, "__file__", None)
+    path = ui_file(name)
+    if module_path is None or not os.path.isfile(module_path) or not os.path.isfile(path):
+        return False
+    return os.path.getmtime(path) > os.path.getmtime(module_path)
+
+
+def compile_all():
+    """Compiles all .ui files into Python modules in the compiled package."""
+    out_dir = os.path.join(os.path.dirname(__file__), "compiled")
+    for path in glob.glob(resource_path(os.path.join('res', 'ui', '*.ui'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "r") as ui, open(os.path.join(out_dir, name + ".py"), "w") as py:
+            uic.compileUi(ui, py)
+
+
+if __name__ == "__main__":
+    compile_all()
@@ -1,10 +1,9 @@
-import cv2
-from tensorflow.keras.preprocessing import image
-from PIL import Image
-from PIL.ImageQt import ImageQt
-from PyQt5 import QtGui, QtCore
+import numpy as np
 from PyQt5.QtCore import QObject, pyqtSignal
-from backend.util import Target
+from backend.common import Target
+from backend.compute_server import Compute_Server_Error
+
+# cv2 and TensorFlow are imported inside the tasks, so this module can be loaded before the back-end
 
 
 class Worker(QObject):
@@ -13,114 +12,169 @@ class Worker(QObject):
     """
     finished = pyqtSignal()
     progress = pyqtSignal(int)
+    preview = pyqtSignal(object)
+    # List of (row, column, image) tuples of finished tiles of a layer representation
+    tile = pyqtSignal(object)
+    result = pyqtSignal(object)
+    # Error message of a task that failed in the compute process
+    failed = pyqtSignal(str)
 
     def __init__(self, controller):
         super(QObject, self).__init__()
         self.controller = controller
-
-    def run_generate_dictionary(self):
-        """Generates a feature visualization for each filter in the network"""
-        self.is_running = True
+        self.is_running = False
         self.completed = False
-        i = 0
-        # Generate visualizations for each Convolution Layer in the Network
-        while self.is_running and i < len(self.controller.visualizer.settings.conv_layers):
-            layer = self.controller.visualizer.settings.conv_layers[i]
-            self.controller.visualizer.generate_dictionary(layer, self)
-            i += 1
-            self.progress.emit(i)
-        # Check if the task was completed or canceled before emitting the finished signal
-        if self.is_running:
-            self.completed = True
-            self.finished.emit()
+        # Background tasks are preempted by interactive requests through the gate
+        self.gate = None
 
     def run_generate_activation_grid(self):
         """Generates a layer representation for the selected Layer by choosing a filter visualization for each 
         pixel in the layer output and combining the to a single image.
+        Finished tiles are streamed through the tile signal, the final image and the input image
+        are sent through the result signal, so all widgets are updated on the main thread.
         """
+        import cv2
         self.is_running = True
         self.completed = False
         activation_grid = None
         layer_rep = self.controller.layer_rep_screen
         # Generate a layer representation depending on the selected loss target
-        if layer_rep.target_choice.isChecked():
-            activation_grid = self.controller.visualizer.get_activation_grid(
-                Target.DIRECTION, self)
-        else:
-            activation_grid = self.controller.visualizer.get_activation_grid(
-                Target.FILTER, self)
+        target = Target.DIRECTION if layer_rep.target_choice.isChecked() else Target.FILTER
+        try:
+            activation_grid = self.controller.visualizer.remote(
+                "get_activation_grid", target, worker=self)
+        except Compute_Server_Error as err:
+            self.fail(err)
+            return
         # Exit here if the Process was canceled before completion
         if activation_grid is None:
             return
-        layer_rep.img_array = cv2.resize(activation_grid, dsize=(
+        img_array = cv2.resize(activation_grid, dsize=(
             layer_rep.img_size, layer_rep.img_size))
         # If the Grad-Cam option was enabled generate and apply heatmap to the generated Visualization
         if layer_rep.grad_cam.isChecked():
-            layer_rep.update_input_image(
-                self.controller.visualizer.apply_grad_cam())
-            layer_rep.img_array = layer_rep.controller.visualizer.apply_grad_cam(
-                layer_rep.img_array, layer_rep.controller.visualizer.settings.layer)
+            input_img = self.controller.visualizer.apply_grad_cam()
+            img_array = np.asarray(self.controller.visualizer.apply_grad_cam(
+                img_array, self.controller.visualizer.settings.layer))
         else:
-            layer_rep.update_input_image(
-                self.controller.visualizer.settings.input_img)
-        # Convert and display the generated visualization
-        layer_rep.vis_img = image.array_to_img(layer_rep.img_array)
-        layer_rep.vis_qim = ImageQt(layer_rep.vis_img)
-        layer_rep.vis_pixmap = QtGui.QPixmap.fromImage(layer_rep.vis_qim)
-        layer_rep.vis_container.setPixmap(layer_rep.vis_pixmap)
+            input_img = self.controller.visualizer.settings.input_img
         # Check if the task was completed or canceled before emitting the finished signal
         if self.is_running:
             self.completed = True
-            layer_rep.generated = True
+            self.result.emit((img_array, input_img))
             self.finished.emit()
 
     def run_generate_group_visualization(self):
-        """Groups the activations of the selected layer and generates an activation map and a feature visualization for each group."""
+        """Groups the activations of the selected layer and generates an activation map and a feature visualization for each group.
+        The scaled activation maps are sent through the preview signal as soon as they are ready, the feature
+        visualizations through the result signal, so all widgets and pixmaps are created on the main thread.
+        """
+        import cv2
         self.is_running = True
         self.completed = False
-        group = self.controller.grouped_screen
-        group.controller.visualizer.settings.groups = group.group_slider.value() * 2
-        # Remove highlightings from the last visualization
-        for i in range(len(group.group_vis_container)):
-            group.group_vis_container[i].clear()
-            group.group_vis_container[i].setStyleSheet("border: ")
-        group.vis_container.clear()
-        # Generate the activation groups
-        groups = group.controller.visualizer.generate_groups()
-        # Generate the activation map for the activation groups
-        group.group_activation_maps = self.controller.visualizer.generate_group_activation_maps(
-            groups[0], self)
+        img_size = self.controller.grouped_screen.img_size
+        try:
+            # Generate the activation groups
+            groups = self.controller.visualizer.remote(
+                "generate_groups", worker=self)
+            if groups is None:
+                return
+            # Generate the activation map for the activation groups
+            group_activation_maps = self.controller.visualizer.remote(
+                "generate_group_activation_maps", groups[0], worker=self)
+        except Compute_Server_Error as err:
+            self.fail(err)
+            return
         # If the task was canceled return here
-        if group.group_activation_maps == []:
+        if not group_activation_maps:
+            return
+        # Scale the uint8 activation maps to the display size
+        self.preview.emit([cv2.resize(act_map, dsize=(img_size, img_size))
+                           for act_map in group_activation_maps])
+        # Generate the feature visualizations of the groups
+        try:
+            grp_imgs = self.controller.visualizer.remote(
+                "generate_grp_visualizations", groups[1], worker=self)
+        except Compute_Server_Error as err:
+            self.fail(err)
             return
-        # Convert the activation maps to images and display the map for the first group
-        for i, act_map in enumerate(group.group_activation_maps):
-            act_map = cv2.resize(act_map, dsize=(
-                group.img_size, group.img_size))
-            group.group_activation_maps[i] = image.array_to_img(act_map)
-        group.vis_qim = ImageQt(group.group_activation_maps[0])
-        group.vis_pixmap = QtGui.QPixmap.fromImage(group.vis_qim)
-        group.vis_container.setPixmap(group.vis_pixmap)
-        # Generate and convert the Feature visualizations to images and display them
-        group.grp_imgs = group.controller.visualizer.generate_grp_visualizations(
-            groups[1])
+        # Check if the task was completed or canceled before emitting the finished signal
+        if self.is_running:
+            self.completed = True
+            self.result.emit([np.asarray(img) for img in grp_imgs])
+            self.finished.emit()
+
+    def run_visualize_sample(self):
+        """Generates the visualization selected on the sample screen and streams intermediate images through the preview signal.
+        Stopping the task keeps the current image. Background tasks are paused while the visualization runs.
+        """
+        self.is_running = True
+        self.completed = False
+        sample = self.controller.sample_screen
+        visualizer = self.controller.visualizer
+        with visualizer.gate.interactive():
+            if not sample.neuron_enabled:
+                img = visualizer.visualize_filter(self, self.preview.emit)
+            else:
+                img = visualizer.visualize_neuron(
+                    sample.neuron, self, self.preview.emit)
+        self.completed = self.is_running
+        self.preview.emit(img)
+        self.finished.emit()
+
+    def run_sweep(self):
+        """Generates visualizations of the selected filter for each configuration of the sweep requested on the sample screen."""
+        self.is_running = True
+        self.completed = False
+        sample = self.controller.sample_screen
+        sample.sweep_results = self.controller.visualizer.sweep_filter(
+            *sample.sweep_params, self)
+        # Check if the task was completed or canceled before emitting the finished signal
+        if self.is_running:
+            self.completed = True
+            self.finished.emit()
 
-        for i in range(len(group.grp_imgs)):
-            img = Image.fromarray(group.grp_imgs[i])
-            qim = ImageQt(img)
-            pixmap = QtGui.QPixmap.fromImage(qim)
-            group.group_vis_container[i].setPixmap(pixmap.scaled(
-                100, 100, QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation))
-        # Add the selected highlight to the first group
-        group.selected_group = 0
-        group.group_vis_container[group.selected_group].setStyleSheet(
-            "border: 2px solid orange")
+    def run_tune_settings(self):
+        """Searches the cheapest settings reaching the quality target for each convolution layer."""
+        self.is_running = True
+        self.completed = False
+        self.untuned = self.controller.visualizer.tune_settings(self)
         # Check if the task was completed or canceled before emitting the finished signal
         if self.is_running:
             self.completed = True
-            group.generated = True
             self.finished.emit()
 
+    def run_warmup(self):
+        """Warms up the freshly imported model in the background."""
+        self.is_running = True
+        self.completed = False
+        self.controller.visualizer.warm_up(self)
+        self.completed = self.is_running
+        self.finished.emit()
+
+    def run_load_layer(self):
+        """Loads the activations and, if load_dictionary is set, the dictionary of the layer set on the worker.
+        Errors are stored in the error attribute, so they can be shown on the main thread.
+        """
+        self.is_running = True
+        self.completed = False
+        self.error = None
+        try:
+            self.controller.visualizer.update_activations()
+            if self.load_dictionary:
+                self.controller.visualizer.update_dictionary(self.layer)
+            self.completed = True
+        except Exception as err:
+            self.error = repr(err)
+        finally:
+            # The loader waits for finished, so it is emitted whatever happened
+            self.finished.emit()
+
+    def fail(self, err):
+        """Reports a task that failed in the compute process and ends it."""
+        self.failed.emit(str(err))
+        self.finished.emit()
+
     def stop(self):
         """Sets the running variable to cancel the running task."""
         self.is_running = False
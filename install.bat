@@ -1 +1,2 @@
-pyinstaller main.py --onefile -n XAIVIZ --add-data "res;./res"
\ No newline at end of file
+python -m gui.ui_loader
+pyinstaller main.py --onefile -n XAIVIZ --add-data "res;./res" --collect-submodules gui.compiled
\ No newline at end of file